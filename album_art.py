@@ -1,13 +1,20 @@
-from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageChops, ImageEnhance
 import random
 import os
 import math
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+import hashlib, shutil, threading
+import multiprocessing
 
-def generate_cover_art(mood, genre, tempo, output_path):
+def generate_cover_art(mood, genre, tempo, output_path, variants=()):
     """
     Generates a V2 HIGH-QUALITY procedural album cover.
     Features: Gradients, Bokeh/Glow, Compositing, Texture.
+    `variants` are thumbnails to write from the same image (see save_variants).
     """
+    from PIL import Image, ImageDraw, ImageFilter # Imported on use: the web process never draws
     width, height = 800, 800
     
     # 1. Palette Selection
@@ -119,6 +126,7 @@ def generate_cover_art(mood, genre, tempo, output_path):
     # Save
     base = base.convert('RGB') # Remove alpha for saving
     base.save(output_path, quality=95)
+    if variants: save_variants(base, variants)
     return os.path.basename(output_path)
 
 def get_palette(mood, genre):
@@ -154,3 +162,406 @@ def get_palette(mood, genre):
         (255, 100, 150), (255, 200, 100), # Pink -> Orange
         (255, 255, 0), (0, 255, 255), (255, 255, 255) # Brights
     ]
+
+
+# --- NUMPY ENGINE ---
+BOKEH_SCALE = 8 # Bokeh layer is built and blurred at 1/8 resolution, then upsampled
+PNG_COMPRESS_LEVEL = 3 # zlib level 6 (Pillow default) costs ~3x the encode time for ~8% smaller files
+
+@lru_cache(maxsize=8)
+def _gaussian_matrix(n, sigma):
+    """(n, n) matrix that applies a 1-D Gaussian blur (edges renormalized) to a column vector."""
+    idx = np.arange(n)
+    k = np.exp(-0.5 * ((idx[:, None] - idx[None, :]) / sigma) ** 2)
+    return (k / k.sum(axis=1, keepdims=True)).astype(np.float32)
+
+@lru_cache(maxsize=8)
+def _upsample_matrix(n_out, n_in):
+    """(n_out, n_in) bilinear interpolation matrix."""
+    pos = np.clip((np.arange(n_out) + 0.5) * n_in / n_out - 0.5, 0, n_in - 1)
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, n_in - 1)
+    frac = (pos - lo).astype(np.float32)
+    m = np.zeros((n_out, n_in), dtype=np.float32)
+    m[np.arange(n_out), lo] += 1 - frac
+    m[np.arange(n_out), hi] += frac
+    return m
+
+@lru_cache(maxsize=16)
+def _gradient(bg_start, bg_end, width, height):
+    """Pre-rendered background layer; there are only a handful of palettes, so this is almost always a hit."""
+    start, end = np.array(bg_start, dtype=np.float32), np.array(bg_end, dtype=np.float32)
+    ratio = (np.arange(height, dtype=np.float32) / height)[:, None, None]
+    layer = np.broadcast_to(start * (1 - ratio) + end * ratio, (height, width, 3)).copy()
+    layer.flags.writeable = False
+    return layer
+
+def _shape_kind(mood, genre):
+    if mood == "Energetic" or genre in ["Rock", "Electronic"]: return "sharp"
+    if mood == "Sad" or mood == "Calm" or genre == "Jazz": return "soft"
+    return "rounded"
+
+def _shape_mask(kind, xs, ys, cx, cy, size, angle):
+    """Boolean mask of one foreground shape over the pixel grid xs/ys."""
+    dx, dy = xs - cx, ys - cy
+    if kind == "triangle":
+        # Apex (cx, cy-size), base corners (cx±size, cy+size)
+        return (dy <= size) & (2 * dx <= dy + size) & (-2 * dx <= dy + size)
+    if kind == "square":
+        # Square rotated about its centre, clipped to its own unrotated box (like Image.rotate)
+        t = math.radians(angle)
+        u = dx * math.cos(t) - dy * math.sin(t)
+        v = dx * math.sin(t) + dy * math.cos(t)
+        return (np.abs(u) <= size) & (np.abs(v) <= size) & (np.abs(dx) <= size) & (np.abs(dy) <= size)
+    if kind == "circle":
+        return dx * dx + dy * dy <= size * size
+    # Rounded rectangle, corner radius 20
+    ex = np.maximum(np.abs(dx) - (size - 20), 0)
+    ey = np.maximum(np.abs(dy) - (size - 20), 0)
+    return (np.abs(dx) <= size) & (np.abs(dy) <= size) & (ex * ex + ey * ey <= 400)
+
+def render_cover_array(mood, genre, tempo, seed=None, width=800, height=800):
+    """
+    Vectorized equivalent of generate_cover_art's layers, built as NumPy arrays.
+    All randomness comes from one np.random.Generator, so a fixed seed always
+    yields the same pixels. Returns an (height, width, 3) uint8 array.
+    """
+    rng = np.random.default_rng(seed)
+    palette = get_palette(mood, genre)
+    accents = np.array(palette[2:], dtype=np.float32)
+
+    # 1. Gradient: one broadcast instead of a draw.line per row (cached per palette)
+    out = _gradient(palette[0], palette[1], width, height).copy()
+
+    # 2. Bokeh: circles drawn and blurred at reduced resolution, then upsampled
+    sh, sw = height // BOKEH_SCALE, width // BOKEH_SCALE
+    ys, xs = np.mgrid[0:sh, 0:sw].astype(np.float32)
+    small = np.zeros((sh, sw, 4), dtype=np.float32)
+    for _ in range(15):
+        x = rng.integers(-100, width + 101) / BOKEH_SCALE
+        y = rng.integers(-100, height + 101) / BOKEH_SCALE
+        rad = rng.integers(100, 401) / BOKEH_SCALE
+        mask = (xs - x) ** 2 + (ys - y) ** 2 <= rad * rad
+        small[mask] = (*accents[rng.integers(len(accents))], 50)
+    sigma = 60 / BOKEH_SCALE
+    rows = _upsample_matrix(height, sh) @ _gaussian_matrix(sh, sigma)
+    cols = _upsample_matrix(width, sw) @ _gaussian_matrix(sw, sigma)
+    bokeh = np.einsum("ij,jkc,lk->ilc", rows, small, cols, optimize=True)
+
+    # 3. Foreground shapes, each masked only over its own bounding box
+    fg = np.zeros((height, width, 4), dtype=np.float32)
+    shape_kind = _shape_kind(mood, genre)
+    for _ in range(int(tempo / 15) + 3):
+        cx = int(rng.integers(50, width - 49))
+        cy = int(rng.integers(50, height - 49))
+        size = int(rng.integers(20, 151))
+        color = accents[rng.integers(len(accents))]
+        alpha = rng.integers(100, 221)
+        angle = 0
+        if shape_kind == "sharp":
+            kind = "triangle" if rng.random() > 0.5 else "square"
+            if kind == "square": angle = int(rng.integers(0, 91))
+        else:
+            kind = "circle" if shape_kind == "soft" else "rounded"
+        y0, y1 = max(cy - size, 0), min(cy + size + 1, height)
+        x0, x1 = max(cx - size, 0), min(cx + size + 1, width)
+        gy, gx = np.ogrid[y0:y1, x0:x1]
+        mask = _shape_mask(kind, gx, gy, cx, cy, size, angle)
+        fg[y0:y1, x0:x1][mask] = (*color, alpha)
+
+    # 4. Central frame: outer 3px line and inner 1px line
+    frame = np.zeros((height, width), dtype=np.float32)
+    cx, cy, half = width // 2, height // 2, 150
+    for inset, thickness, alpha in ((0, 3, 180), (10, 1, 80)):
+        t, b, l, r = cy - half + inset, cy + half - inset, cx - half + inset, cx + half - inset
+        frame[t:t + thickness, l:r + 1] = alpha
+        frame[b - thickness + 1:b + 1, l:r + 1] = alpha
+        frame[t:b + 1, l:l + thickness] = alpha
+        frame[t:b + 1, r - thickness + 1:r + 1] = alpha
+
+    # 5. Composite every layer in one pass over float arrays
+    for layer_rgb, layer_a in ((bokeh[..., :3], bokeh[..., 3:]), (fg[..., :3], fg[..., 3:])):
+        a = layer_a / 255.0
+        out += (layer_rgb - out) * a
+    out += (255.0 - out) * (frame[..., None] / 255.0)
+    grain = np.clip(rng.normal(128, 15, (height, width)), 0, 255).astype(np.float32)[..., None]
+    out += (grain - out) * (15 / 255.0)
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+def generate_cover_art_fast(mood, genre, tempo, output_path, seed=None, variants=()):
+    """Drop-in alternative to generate_cover_art using the NumPy engine."""
+    from PIL import Image
+    image = Image.fromarray(render_cover_array(mood, genre, tempo, seed=seed), "RGB")
+    image.save(output_path, quality=95, compress_level=PNG_COMPRESS_LEVEL)
+    if variants: save_variants(image, variants)
+    return os.path.basename(output_path)
+
+
+# --- THUMBNAILS ---
+VARIANT_WIDTHS = (96, 256, 512) # Widths served by the variants endpoint; a fixed set keeps the disk cache bounded
+THUMBNAIL_WIDTHS = (96, 256)    # Written with every new cover: dashboard icons and the result page
+VARIANT_FORMATS = {             # format -> (Pillow format, media type, save options)
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+def save_variants(image, variants):
+    """Writes downscaled copies of a cover image. variants: [(width, format, path)], each written atomically."""
+    from PIL import Image
+    image = image.convert("RGB")
+    for width, fmt, path in variants:
+        size = (width, max(1, round(image.height * width / image.width)))
+        thumb = image.resize(size, Image.LANCZOS, reducing_gap=3.0) # reducing_gap: cheap box pre-shrink, then Lanczos
+        pil_format, _, options = VARIANT_FORMATS[fmt]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.part"
+        thumb.save(tmp_path, pil_format, **options)
+        os.replace(tmp_path, path)
+
+def make_variants(cover_path, variants):
+    """save_variants for a cover already on disk (older tracks, cover-cache hits)."""
+    from PIL import Image
+    with Image.open(cover_path) as image: save_variants(image, variants)
+    return len(variants)
+
+class CoverVariants:
+    """
+    Resized WebP / JPEG copies of cover PNGs, kept in their own Storage and
+    named after the cover ("ab/cd/<id>.256.webp"). New covers get
+    THUMBNAIL_WIDTHS as they're rendered; any other allowed size, and covers
+    made before variants existed, are rendered on first request and kept.
+    `make(cover_path, variants)` does the resizing (the art pool in the app).
+    """
+
+    def __init__(self, storage, make=make_variants):
+        self.storage = storage
+        self.make = make
+        self.made = self.hits = 0
+        self._lock = threading.Lock()
+        self._file_locks = [threading.Lock() for _ in range(64)] # Striped by hash(path)
+
+    def name_for(self, cover_name, width, fmt):
+        return f"{os.path.splitext(cover_name)[0]}.{width}.{fmt}"
+
+    def names_for(self, cover_name):
+        """Every variant name a cover can have (for GC and deletes)."""
+        return [self.name_for(cover_name, w, fmt) for w in VARIANT_WIDTHS for fmt in VARIANT_FORMATS]
+
+    def eager(self, cover_name):
+        """(width, format, path) of the thumbnails written along with a new cover."""
+        return [(w, fmt, self.storage.path(self.name_for(cover_name, w, fmt), create=True))
+                for w in THUMBNAIL_WIDTHS for fmt in VARIANT_FORMATS]
+
+    def get(self, cover_path, cover_name, width, fmt):
+        """Path of one variant, rendering it first if it's missing or older than the cover."""
+        if width not in VARIANT_WIDTHS or fmt not in VARIANT_FORMATS: raise ValueError(f"Unsupported variant: {width} {fmt}")
+        path = self.storage.path(self.name_for(cover_name, width, fmt), create=True)
+        file_lock = self._file_locks[hash(path) % len(self._file_locks)]
+        with file_lock: # Concurrent first views of one cover resize once
+            if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(cover_path):
+                with self._lock: self.hits += 1
+                return path
+            self.make(cover_path, [(width, fmt, path)])
+            with self._lock: self.made += 1
+        return path
+
+    def stats(self):
+        with self._lock:
+            return {"made_on_request": self.made, "hits": self.hits}
+
+# --- COVER CACHE ---
+CACHE_ENGINE_VERSION = 1 # Bump when render_cover_array output changes to orphan old entries
+
+def cover_key(mood, genre, tempo, seed):
+    """
+    Content address of a seeded cover. Inputs are reduced to what the NumPy
+    engine actually reads (palette, shape family, shape count), so e.g.
+    Rock/Happy and Rock/Energetic at 120 and 125 BPM share an entry.
+    """
+    ident = (CACHE_ENGINE_VERSION, get_palette(mood, genre), _shape_kind(mood, genre), int(tempo / 15), seed)
+    return hashlib.sha256(repr(ident).encode()).hexdigest()
+
+def _link_or_copy(src, dst):
+    # Hard links make a hit free and keep the track's file alive if the entry is evicted.
+    # A link shares the entry's mtime, so touch it: to the storage GC the output is brand new.
+    if os.path.exists(dst): os.remove(dst)
+    try: os.link(src, dst)
+    except OSError: shutil.copyfile(src, dst)
+    os.utime(dst)
+
+class CoverCache:
+    """
+    Content-addressed store of rendered covers with LRU eviction bounded by
+    entry count and total bytes. The index is rebuilt from the directory
+    (oldest mtime first) on first use, so it survives restarts without
+    touching the disk at construction.
+    """
+
+    def __init__(self, directory, max_entries=512, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = None # key -> size, LRU order; see _loaded()
+        self._bytes = 0
+
+    def _loaded(self):
+        """The index, scanned from the directory the first time it's needed (call with the lock held)."""
+        if self._index is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._index = OrderedDict()
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith(".png")]
+            for e in sorted(entries, key=lambda e: e.stat().st_mtime):
+                self._index[e.name[:-4]] = e.stat().st_size
+                self._bytes += e.stat().st_size
+            self._evict()
+        return self._index
+
+    def open(self):
+        """Loads the index now instead of on the first render."""
+        with self._lock: self._loaded()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def fetch(self, key, output_path):
+        """Places a cached cover at output_path. Returns False on a miss."""
+        with self._lock:
+            if key not in self._loaded():
+                self.misses += 1
+                return False
+            self._index.move_to_end(key)
+            self.hits += 1
+        try:
+            _link_or_copy(self._path(key), output_path)
+        except OSError:
+            # Entry vanished from disk behind our back; treat it as a miss
+            with self._lock:
+                self._bytes -= self._index.pop(key, 0)
+                self.hits -= 1; self.misses += 1
+            return False
+        return True
+
+    def store(self, key, source_path):
+        with self._lock: self._loaded() # Creates the directory
+        size = os.path.getsize(source_path)
+        _link_or_copy(source_path, self._path(key))
+        with self._lock:
+            self._bytes += size - self._index.pop(key, 0)
+            self._index[key] = size
+            self._evict()
+
+    def _evict(self):
+        while self._index and (len(self._index) > self.max_entries or self._bytes > self.max_bytes):
+            key, size = self._index.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try: os.remove(self._path(key))
+            except OSError: pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self._loaded()), "bytes": self._bytes,
+                "max_entries": self.max_entries, "max_bytes": self.max_bytes,
+            }
+
+# --- PROCESS POOL RENDERING ---
+def _pool_context():
+    """
+    Workers are started from a forkserver where available: forking the busy web
+    process directly can leak another thread's pipes into the worker (e.g. a
+    subprocess that is mid-exec), which then never see EOF and hang their owner.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods(): return None
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(["album_art", "PIL.Image", "PIL.ImageDraw", "PIL.ImageFilter"])
+    return ctx
+
+# One (mood, genre) per palette; rendering each fills the per-process gradient / blur matrix caches
+WARM_COMBOS = [("Happy", "Pop"), ("Energetic", "Rock"), ("Sad", "Ambient"), ("Calm", "Jazz"), ("Happy", "Electronic")]
+
+def warm_caches(width=800, height=800):
+    for mood, genre in WARM_COMBOS: render_cover_array(mood, genre, 120, seed=0, width=width, height=height)
+
+def _init_worker():
+    # Forked workers inherit the parent's random state; reseed so they don't all paint the same cover
+    random.seed()
+    warm_caches()
+
+def _ready(): return os.getpid()
+
+class ArtExecutor:
+    """
+    Renders covers in a pool of worker processes so the Pillow work runs on
+    every core instead of holding the GIL in the web process.
+    The pool is created lazily on first use.
+    """
+
+    def __init__(self, workers=None, cache=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = cache
+        self._pool = None
+        self._pool_lock = threading.Lock() # The first covers can be requested from several threads at once
+
+    @property
+    def pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, mp_context=_pool_context())
+            return self._pool
+
+    def submit(self, mood, genre, tempo, output_path, seed=None, variants=()):
+        """
+        Queues one cover (plus its thumbnail `variants`); returns a Future resolving to the output filename.
+        With a seed the deterministic NumPy engine is used, otherwise the classic one.
+        """
+        if seed is None:
+            return self.pool.submit(generate_cover_art, mood, genre, tempo, output_path, variants)
+        return self.pool.submit(generate_cover_art_fast, mood, genre, tempo, output_path, seed, variants)
+
+    def make_variants(self, cover_path, variants, timeout=None):
+        """Thumbnails of an existing cover, resized in the pool."""
+        return self.pool.submit(make_variants, cover_path, variants).result(timeout=timeout)
+
+    def render(self, mood, genre, tempo, output_path, seed=None, timeout=None, variants=()):
+        """
+        Blocking render in the pool (the calling thread just waits, it doesn't burn CPU).
+        Seeded covers are served from / added to the cover cache when one is configured.
+        """
+        if seed is None or self.cache is None:
+            return self.submit(mood, genre, tempo, output_path, seed, variants).result(timeout=timeout)
+        key = cover_key(mood, genre, tempo, seed)
+        if self.cache.fetch(key, output_path):
+            if variants: self.make_variants(output_path, variants, timeout)
+            return os.path.basename(output_path)
+        filename = self.submit(mood, genre, tempo, output_path, seed, variants).result(timeout=timeout)
+        self.cache.store(key, output_path)
+        return filename
+
+    def render_batch(self, jobs, timeout=None):
+        """
+        Renders many covers in parallel.
+        jobs: iterable of (mood, genre, tempo, output_path[, seed, variants]).
+        Returns a list aligned with jobs of (filename, None) or (None, error message).
+        """
+        futures = [self.submit(*job) for job in jobs]
+        results = []
+        for fut in futures:
+            try:
+                results.append((fut.result(timeout=timeout), None))
+            except Exception as e:
+                results.append((None, str(e)))
+        return results
+
+    def warm(self, timeout=60):
+        """Starts every worker process (each warms its caches on start); returns how many answered."""
+        return len({f.result(timeout=timeout) for f in [self.pool.submit(_ready) for _ in range(self.workers)]})
+
+    def shutdown(self, wait=True):
+        with self._pool_lock: pool, self._pool = self._pool, None
+        if pool is not None: pool.shutdown(wait=wait)
@@ -0,0 +1,400 @@
+import os, re, json, time, sqlite3, threading, asyncio, bisect
+from collections import deque
+from concurrent.futures import Future
+
+
+def normalize_prompt(text):
+    """Cache key for a prompt: case, surrounding punctuation and whitespace runs don't change the analysis."""
+    text = re.sub(r"\s+", " ", (text or "").lower()).strip()
+    return text.strip(" .!?,;:\"'")
+
+
+# --- PERSISTENT CACHE ---
+class AnalysisCache:
+    """
+    Prompt -> analysis JSON, stored in a small SQLite file so it survives restarts.
+    Entries expire after `ttl` seconds; beyond `max_entries` the least recently
+    used rows are dropped. The file is opened on first use.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_entries=5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        """The connection, opened (and the table created) the first time it's needed; call with the lock held."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("CREATE TABLE IF NOT EXISTS analysis (key TEXT PRIMARY KEY, data TEXT, created REAL, used REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_analysis_used ON analysis (used)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def open(self):
+        """Opens the file now instead of on the first analysis."""
+        with self._lock: self._db()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT data, created FROM analysis WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl:
+                db.execute("UPDATE analysis SET used = ? WHERE key = ?", (now, key))
+                db.commit()
+                self.hits += 1
+                return json.loads(row[0])
+            if row: db.execute("DELETE FROM analysis WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def put(self, key, data):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO analysis VALUES (?, ?, ?, ?)", (key, json.dumps(data), now, now))
+            db.execute(
+                "DELETE FROM analysis WHERE key IN (SELECT key FROM analysis ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+            db.commit()
+
+    def stats(self):
+        with self._lock:
+            db = self._db()
+            entries = db.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": entries,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
+
+
+# --- CIRCUIT BREAKER ---
+class CircuitBreaker:
+    """
+    Per-name failure tracking. After `threshold` consecutive failures a name is
+    skipped for `cooldown` seconds, then one trial call is let through (half-open).
+    """
+
+    def __init__(self, threshold=3, cooldown=60.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._opened = {}
+
+    def allow(self, name):
+        with self._lock:
+            opened = self._opened.get(name)
+            if opened is None: return True
+            if time.monotonic() - opened >= self.cooldown:
+                self._opened[name] = time.monotonic() # Half-open: one trial, re-armed if it fails
+                return True
+            return False
+
+    def success(self, name):
+        with self._lock:
+            self._failures.pop(name, None)
+            self._opened.pop(name, None)
+
+    def failure(self, name, trip=False):
+        """Records a failure; `trip=True` opens the circuit immediately (e.g. a model that doesn't exist)."""
+        with self._lock:
+            count = self._failures.get(name, 0) + 1
+            self._failures[name] = count
+            if trip or count >= self.threshold: self._opened[name] = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            return {name: {"failures": self._failures.get(name, 0),
+                           "open": now - opened < self.cooldown}
+                    for name, opened in self._opened.items()}
+
+
+# --- STUB BACKEND ---
+class AsyncStubClient:
+    """
+    Drop-in for the AsyncCerebras client (`await client.chat.completions.create(...)`)
+    that answers locally, for tests and benchmarks. `respond(model, prompt)` returns
+    a dict or raises; `delay` is seconds or a callable(model) -> seconds.
+    """
+
+    def __init__(self, respond, delay=0.0):
+        self.respond = respond
+        self.delay = delay
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    async def create(self, model, messages, **kwargs):
+        self.calls += 1
+        wait = self.delay(model) if callable(self.delay) else self.delay
+        if wait: await asyncio.sleep(wait)
+        data = self.respond(model, messages[-1]["content"])
+        message = type("Message", (), {"content": json.dumps(data)})
+        return type("Response", (), {"choices": [type("Choice", (), {"message": message})]})
+
+
+# --- ANALYZER ---
+def is_model_error(error):
+    return "404" in str(error) or "model_not_found" in str(error)
+
+class PromptAnalyzer:
+    """
+    Cached, coalesced prompt analysis over a rotating set of API keys and models.
+    - identical (normalized) prompts in flight at once share one backend call
+    - one client per key, created on first use and reused
+    - keys and models that keep failing are skipped by the circuit breaker
+    Falls back to `fallback(prompt)` when every key/model fails; fallbacks aren't cached.
+    """
+
+    def __init__(self, api_keys, models, system_prompt, client_factory, fallback, cache=None, breaker=None):
+        self.api_keys = [k for k in api_keys if "YOUR_KEY" not in k] # Skip placeholders
+        self.models = models
+        self.system_prompt = system_prompt
+        self.client_factory = client_factory
+        self.fallback = fallback
+        self.cache = cache
+        self.breaker = breaker or CircuitBreaker()
+        self.coalesced = self.backend_calls = self.fallbacks = 0
+        self._clients = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._next_key = 0
+
+    def client(self, api_key):
+        with self._lock:
+            if api_key not in self._clients: self._clients[api_key] = self.client_factory(api_key)
+            return self._clients[api_key]
+
+    def _key_order(self):
+        # Round-robin the starting key so load spreads across keys
+        with self._lock:
+            start = self._next_key
+            self._next_key = (self._next_key + 1) % max(len(self.api_keys), 1)
+        return [(i % len(self.api_keys)) for i in range(start, start + len(self.api_keys))]
+
+    def call_backend(self, prompt_text):
+        """One pass over keys x models. Returns the parsed analysis, or None if everything failed."""
+        for idx in self._key_order():
+            key_name = f"key{idx}"
+            if not self.breaker.allow(key_name): continue
+            api_key = self.api_keys[idx]
+            for model_name in self.models:
+                if not self.breaker.allow(f"model:{model_name}"): continue
+                try:
+                    print(f"🤖 Sending prompt to Cerebras AI (Model: {model_name})...")
+                    with self._lock: self.backend_calls += 1
+                    response = self.client(api_key).chat.completions.create(
+                        model=model_name,
+                        messages=[
+                            {"role": "system", "content": self.system_prompt},
+                            {"role": "user", "content": prompt_text}
+                        ],
+                        response_format={"type": "json_object"}
+                    )
+                    data = json.loads(response.choices[0].message.content)
+                    self.breaker.success(key_name); self.breaker.success(f"model:{model_name}")
+                    print(f"✅ Cerebras Success! Reasoning: {data.get('reasoning')}")
+                    return data
+                except Exception as e:
+                    if is_model_error(e):
+                        print(f"⚠️ Cerebras Model Not Found ({model_name}). Trying next...")
+                        self.breaker.failure(f"model:{model_name}", trip=True)
+                        continue # Try next model with SAME key
+                    print(f"Cerebras Key Error (Key: {api_key[:5]}...): {e}")
+                    self.breaker.failure(key_name)
+                    break # Key/rate-limit problem: rotate to the next key
+        return None
+
+    def analyze(self, prompt_text):
+        key = normalize_prompt(prompt_text)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None: return cached
+
+        with self._lock:
+            pending = self._inflight.get(key)
+            owner = pending is None
+            if owner:
+                pending = Future()
+                self._inflight[key] = pending
+            else:
+                self.coalesced += 1
+        if not owner: return pending.result()
+
+        try:
+            data = self.call_backend(prompt_text)
+            if data is None:
+                print("All Cerebras keys failed. Using Offline Magic Mode.")
+                with self._lock: self.fallbacks += 1
+                data = self.fallback(prompt_text)
+            elif self.cache is not None:
+                self.cache.put(key, data)
+            pending.set_result(data)
+            return data
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock: self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            s = {"backend_calls": self.backend_calls, "coalesced": self.coalesced,
+                 "fallbacks": self.fallbacks, "clients": len(self._clients)}
+        s["breaker"] = self.breaker.snapshot()
+        if self.cache is not None: s["cache"] = self.cache.stats()
+        return s
+
+
+# --- HEDGED ASYNC ANALYZER ---
+class LatencyHistogram:
+    """Cumulative latency buckets (ms) plus a window of recent samples for percentiles."""
+    BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+    def __init__(self, window=200):
+        self.counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.BUCKETS, ms)] += 1
+        self.count += 1
+        self.sum_ms += ms
+        self.recent.append(ms)
+
+    def percentile(self, p):
+        if not self.recent: return None
+        ordered = sorted(self.recent)
+        return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+    def snapshot(self):
+        cumulative, buckets = 0, {}
+        for le, n in zip(self.BUCKETS, self.counts):
+            cumulative += n
+            buckets["+Inf" if le == float("inf") else str(le)] = cumulative
+        return {"count": self.count, "sum_ms": round(self.sum_ms, 2), "buckets": buckets,
+                "p50_ms": self.percentile(0.5), "p90_ms": self.percentile(0.9), "p99_ms": self.percentile(0.99)}
+
+
+class HedgedAnalyzer(PromptAnalyzer):
+    """
+    PromptAnalyzer whose backend pass runs on a private asyncio loop with:
+    - a global latency budget: when it runs out we fall back to the offline path
+    - hedging: if the first attempt is slower than the `hedge_percentile` of recent
+      latencies, a second attempt goes to the next key/model; first answer wins
+    - failed attempts are replaced immediately by the next candidate
+    `client_factory` must return an async client (AsyncCerebras or AsyncStubClient).
+    """
+
+    def __init__(self, *args, budget=8.0, hedge_percentile=0.9, hedge_after=2.0, max_parallel=2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.budget = budget
+        self.hedge_percentile = hedge_percentile
+        self.hedge_after = hedge_after
+        self.max_parallel = max_parallel
+        self.hedges = self.deadline_misses = 0
+        self.latency = {} # "key0" / "model:llama3.1-8b" -> LatencyHistogram
+        self._overall = LatencyHistogram()
+        self._loop = None
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="analysis-loop", daemon=True).start()
+            return self._loop
+
+    def _observe(self, names, ms):
+        with self._lock:
+            for name in names: self.latency.setdefault(name, LatencyHistogram()).observe(ms)
+            self._overall.observe(ms)
+
+    def hedge_delay(self):
+        with self._lock:
+            if len(self._overall.recent) < 20: return self.hedge_after # Not enough data yet
+            return self._overall.percentile(self.hedge_percentile) / 1000
+
+    def _candidates(self):
+        # Best model first across every key, so a hedge lands on a different key
+        keys = self._key_order()
+        return [(idx, model) for model in self.models for idx in keys]
+
+    async def _attempt(self, idx, model_name, prompt_text):
+        key_name, api_key = f"key{idx}", self.api_keys[idx]
+        start = time.perf_counter()
+        try:
+            with self._lock: self.backend_calls += 1
+            response = await self.client(api_key).chat.completions.create(
+                model=model_name,
+                messages=[
+                    {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": prompt_text}
+                ],
+                response_format={"type": "json_object"}
+            )
+            data = json.loads(response.choices[0].message.content)
+        except Exception as e:
+            if is_model_error(e): self.breaker.failure(f"model:{model_name}", trip=True)
+            else: self.breaker.failure(key_name)
+            print(f"Cerebras Error (Key: {api_key[:5]}..., Model: {model_name}): {e}")
+            raise
+        self._observe((key_name, f"model:{model_name}"), 1000 * (time.perf_counter() - start))
+        self.breaker.success(key_name); self.breaker.success(f"model:{model_name}")
+        return data
+
+    async def _call_hedged(self, prompt_text):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.budget
+        candidates = iter(self._candidates())
+        pending = set()
+
+        def launch():
+            for idx, model_name in candidates:
+                if self.breaker.allow(f"key{idx}") and self.breaker.allow(f"model:{model_name}"):
+                    pending.add(asyncio.ensure_future(self._attempt(idx, model_name, prompt_text)))
+                    return True
+            return False
+
+        launch()
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    with self._lock: self.deadline_misses += 1
+                    print("⏱ Analysis budget exhausted. Using Offline Magic Mode.")
+                    return None
+                can_hedge = len(pending) < self.max_parallel
+                timeout = min(remaining, self.hedge_delay()) if can_hedge else remaining
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None: return task.result()
+                    launch() # Replace the failed attempt straight away
+                if not done and can_hedge and launch():
+                    with self._lock: self.hedges += 1
+            return None
+        finally:
+            for task in pending: task.cancel()
+
+    def call_backend(self, prompt_text):
+        future = asyncio.run_coroutine_threadsafe(self._call_hedged(prompt_text), self._get_loop())
+        return future.result()
+
+    async def analyze_async(self, prompt_text):
+        """For async callers: runs the (cached, coalesced) analysis without blocking their loop."""
+        return await asyncio.to_thread(self.analyze, prompt_text)
+
+    def stats(self):
+        s = super().stats()
+        with self._lock:
+            s.update(hedges=self.hedges, deadline_misses=self.deadline_misses,
+                     hedge_delay_ms=None, latency={name: h.snapshot() for name, h in self.latency.items()})
+        s["hedge_delay_ms"] = round(1000 * self.hedge_delay(), 1)
+        return s
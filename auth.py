@@ -0,0 +1,190 @@
+import os, time, threading, multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from functools import lru_cache
+
+USER_CACHE_TTL = 300      # Seconds a cached user is trusted before re-reading it
+USER_CACHE_SIZE = 1024    # Users kept per process
+PBKDF2_ROUNDS = 29000     # passlib's pbkdf2_sha256 default; hashes below this are upgraded on login
+HASH_WORKERS = 2          # Processes doing password hashing
+HASH_MAX_PENDING = 16     # Hash/verify calls queued or running before new ones are refused
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """Detached, read-only copy of the User fields pages and routes read."""
+    id: int
+    username: str
+    bio: str = None
+    avatar_color: str = None
+    created_date: str = None
+
+    @classmethod
+    def from_row(cls, user):
+        return cls(user.id, user.username, user.bio, user.avatar_color, user.created_date)
+
+
+class UserCache:
+    """
+    TTL + LRU cache of CachedUser by id, so authenticated requests resolve
+    the user from the token without a database round trip. Entries are
+    dropped explicitly when the user row changes (invalidate) and expire
+    after `ttl` anyway, which bounds staleness across worker processes.
+    """
+
+    def __init__(self, loader, ttl=USER_CACHE_TTL, max_entries=USER_CACHE_SIZE):
+        self.loader = loader # user_id -> CachedUser or None
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # user_id -> (expires_at, CachedUser)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.invalidations = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        user = self.loader(user_id)
+        if user is not None: self.put(user)
+        return user
+
+    def put(self, user):
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                    "invalidations": self.invalidations}
+
+
+# --- PASSWORD HASHING ---
+class HasherBusy(Exception):
+    """Raised by PasswordHasher when too many hash/verify calls are pending or one times out (-> HTTP 429)."""
+
+@lru_cache(maxsize=None)
+def crypt_context(rounds=PBKDF2_ROUNDS):
+    """pbkdf2_sha256 context; hashes with fewer than `rounds` rounds count as needing an update."""
+    from passlib.context import CryptContext # Only hashing processes (and inline mode) need passlib
+    return CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto",
+                        pbkdf2_sha256__default_rounds=rounds, pbkdf2_sha256__min_rounds=rounds)
+
+def hash_password(password, rounds=PBKDF2_ROUNDS):
+    return crypt_context(rounds).hash(password)
+
+def verify_password(password, hashed, rounds=PBKDF2_ROUNDS):
+    """Returns (matches, new_hash): new_hash is set when the password matched but `hashed` is below the work factor."""
+    if not hashed: return False, None
+    return crypt_context(rounds).verify_and_update(password, hashed)
+
+def _ready(rounds):
+    crypt_context(rounds) # Import passlib and build the context before the first login
+    return os.getpid()
+
+class PasswordHasher:
+    """
+    Runs pbkdf2 hashing and verification in a small process pool, so a burst
+    of logins burns those processes' CPU instead of the web process's (where
+    every hash competes with page renders and generation for the GIL and cores).
+    At most `max_pending` calls may be queued or running; past that callers get
+    HasherBusy right away instead of waiting behind the burst, and a call
+    that takes longer than `timeout` seconds fails the same way.
+    workers=0 hashes inline on the calling thread (the old behaviour).
+    """
+
+    def __init__(self, workers=HASH_WORKERS, max_pending=HASH_MAX_PENDING, rounds=PBKDF2_ROUNDS, timeout=30):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {"hashes": 0, "verifies": 0, "failed_verifies": 0, "rehashes": 0, "rejected": 0, "timeouts": 0,
+                       "in_flight": 0, "total_ms": 0.0, "max_ms": 0.0}
+
+    @property
+    def pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # Forkserver like the art pool: forking the threaded web process can leak its pipes into workers
+                ctx = multiprocessing.get_context("forkserver") if "forkserver" in multiprocessing.get_all_start_methods() else None
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+            return self._pool
+
+    def _call(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock: self._stats["rejected"] += 1
+            raise HasherBusy("Too many logins in progress, try again shortly.")
+        start = time.perf_counter()
+        with self._lock: self._stats["in_flight"] += 1
+        try:
+            if not self.workers: return fn(*args, self.rounds)
+            pool = self.pool
+            future = pool.submit(fn, *args, self.rounds)
+            try: return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                future.cancel() # Still queued behind a stuck worker: don't run it for nobody
+                with self._lock: self._stats["timeouts"] += 1
+                raise HasherBusy("Login is taking too long, try again shortly.")
+            except BrokenProcessPool:
+                with self._pool_lock: # A worker died: start a fresh pool on the next call instead of failing every login
+                    if self._pool is pool: self._pool = None
+                raise
+        finally:
+            ms = 1000 * (time.perf_counter() - start)
+            with self._lock:
+                s = self._stats
+                s["in_flight"] -= 1; s["total_ms"] += ms; s["max_ms"] = max(s["max_ms"], ms)
+            self._slots.release()
+
+    def hash(self, password):
+        new_hash = self._call(hash_password, password)
+        with self._lock: self._stats["hashes"] += 1
+        return new_hash
+
+    def verify(self, password, hashed):
+        """Returns (matches, new_hash); store new_hash when it isn't None (the work factor went up)."""
+        ok, new_hash = self._call(verify_password, password, hashed)
+        with self._lock:
+            self._stats["verifies"] += 1
+            self._stats["failed_verifies"] += not ok
+            self._stats["rehashes"] += new_hash is not None
+        return ok, new_hash
+
+    def warm(self, timeout=60):
+        """Starts every hashing process now rather than on the first login; returns how many answered."""
+        if not self.workers:
+            crypt_context(self.rounds); return 0
+        return len({f.result(timeout=timeout) for f in [self.pool.submit(_ready, self.rounds) for _ in range(self.workers)]})
+
+    def stats(self):
+        with self._lock: s = dict(self._stats)
+        calls = s["hashes"] + s["verifies"]
+        s["avg_ms"] = round(s["total_ms"] / calls, 2) if calls else 0.0
+        s["total_ms"] = round(s["total_ms"], 2); s["max_ms"] = round(s["max_ms"], 2)
+        s.update(workers=self.workers, max_pending=self.max_pending, rounds=self.rounds)
+        return s
+
+    def shutdown(self, wait=True):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait)
+                self._pool = None
@@ -0,0 +1,40 @@
+"""
+Seeds tracks in bulk from the command line, through the same pipeline as POST /batch.
+
+    python batch.py prompts.json --user alice    # JSON list of prompts / param dicts
+    python batch.py prompts.txt --user alice     # one prompt per line
+
+Progress is printed as NDJSON on stdout.
+"""
+import argparse, json, sys
+
+
+def load_items(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            data = json.load(f)
+            return data["items"] if isinstance(data, dict) else data
+        return [line.strip() for line in f if line.strip()]
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Generate many tracks for one user.")
+    parser.add_argument("items", help=".json list of prompts / param dicts, or a text file with one prompt per line")
+    parser.add_argument("--user", required=True, help="username that will own the tracks")
+    args = parser.parse_args(argv)
+
+    import main as app # Heavy: sets up the pools and analyzer
+    app.init_database()
+    db = app.SessionLocal()
+    try: user = db.query(app.User).filter(app.User.username == args.user).first()
+    finally: db.close()
+    if not user: parser.error(f"unknown user: {args.user}")
+
+    items = [app.normalize_batch_item(item) for item in load_items(args.items)]
+    try:
+        track_ids = app.run_batch(user.id, items, lambda event: print(json.dumps(event), flush=True))
+    finally:
+        app.art_executor.shutdown(); app.synth_pool.close()
+    return 0 if all(track_ids) else 1
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,550 @@
+"""
+Benchmark suite: composition, MIDI, cover art, WAV rendering, play counting, SQLite writes, search,
+password hashing, startup and HTTP endpoints.
+
+    python benchmarks.py                          # everything, results -> bench_results/<time>.json
+    python benchmarks.py --only composer,midi     # case-name prefixes
+    python benchmarks.py --quick                  # fewer iterations (CI smoke)
+    python benchmarks.py --save-baseline          # also write bench_results/baseline.json
+    python benchmarks.py --baseline bench_results/baseline.json   # exit 1 on p50 regressions
+
+Every case is seeded, so repeated runs do the same work. HTTP cases run the
+real app in-process (TestClient) against a scratch SQLite database and a
+scratch output directory, with the LLM replaced by a local stub.
+"""
+import os, sys, json, time, random, itertools, argparse, platform, tempfile, tracemalloc, subprocess
+import numpy as np
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results")
+REGRESSION_THRESHOLD = 0.15 # p50 slower than baseline by more than this fraction -> regression
+CASES = {} # name -> (setup() -> op, iterations)
+
+
+def case(name, iterations):
+    def register(setup):
+        CASES[name] = (setup, iterations)
+        return setup
+    return register
+
+class Skip(Exception):
+    """Raised by a case's setup when it can't run here (e.g. no FluidSynth)."""
+
+
+# --- MEASUREMENT ---
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+def measure(op, iterations, warmup=2, memory_runs=3):
+    """Times `iterations` calls of op(), then measures peak traced memory over a few extra calls."""
+    for _ in range(warmup): op()
+    samples = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        op()
+        samples.append(time.perf_counter() - t0)
+    total = time.perf_counter() - start
+    tracemalloc.start() # Kept out of the timed loop: tracing slows allocation-heavy code a lot
+    for _ in range(min(memory_runs, iterations)): op()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    samples.sort()
+    return {
+        "iterations": iterations, "ops_per_sec": round(iterations / total, 2),
+        "mean_ms": round(1000 * total / iterations, 3),
+        "p50_ms": round(1000 * percentile(samples, 0.50), 3), "p99_ms": round(1000 * percentile(samples, 0.99), 3),
+        "peak_mem_kb": round(peak / 1024, 1),
+    }
+
+
+# --- COMPOSITION ---
+@case("composer.markov_melody", 5000)
+def _():
+    from composer import markov_melody, SCALES
+    random.seed(0)
+    return lambda: markov_melody(SCALES["Happy"])
+
+@case("composer.apply_style", 5000)
+def _():
+    from composer import markov_melody, apply_style, SCALES
+    random.seed(0)
+    melody = markov_melody(SCALES["Energetic"])
+    return lambda: apply_style(melody, "Complex", "Energetic")
+
+@case("composer.add_drums", 5000)
+def _():
+    from composer import add_drums, _NoteSink
+    return lambda: add_drums(_NoteSink(), 32, "Energetic")
+
+@case("composer.reference_track", 2000)
+def _():
+    from composer import _reference_track
+    random.seed(0)
+    return lambda: _reference_track("Energetic", "Complex")
+
+@case("composer.compose_track", 2000)
+def _():
+    from composer import compose_track
+    seeds = iter(range(10**9))
+    return lambda: compose_track("Energetic", "Complex", seed=next(seeds))
+
+@case("composer.compose_batch.100", 50)
+def _():
+    """100 tracks per call; compare with 100x composer.reference_track."""
+    from composer import compose_batch
+    compose_batch("Energetic", "Complex", 1, seed=0) # Warm the template cache
+    seeds = iter(range(10**9))
+    return lambda: compose_batch("Energetic", "Complex", 100, seed=next(seeds))
+
+
+# --- MIDI ---
+def _sample_notes():
+    from composer import compose_track
+    return compose_track("Energetic", "Complex", seed=0)[0]
+
+@case("midi.encode_midi", 2000)
+def _():
+    from midi_writer import encode_midi
+    notes = _sample_notes()
+    return lambda: encode_midi(notes, 120, 0)
+
+@case("midi.midiutil", 500)
+def _():
+    from midi_writer import _encode_with_midiutil
+    notes = _sample_notes()
+    return lambda: _encode_with_midiutil(notes, 120, 0, 3)
+
+
+# --- COVER ART ---
+@case("cover.classic", 10)
+def _():
+    from album_art import generate_cover_art
+    path = os.path.join(tempfile.mkdtemp(), "cover.png")
+    random.seed(0)
+    return lambda: generate_cover_art("Energetic", "Rock", 140, path)
+
+@case("cover.fast", 20)
+def _():
+    from album_art import generate_cover_art_fast
+    path = os.path.join(tempfile.mkdtemp(), "cover.png")
+    return lambda: generate_cover_art_fast("Energetic", "Rock", 140, path, seed=0)
+
+
+# --- WAV ---
+@case("wav.render", 5)
+def _():
+    from synth import SynthPool, RenderError
+    from midi_writer import encode_midi
+    pool = SynthPool(os.path.join(os.path.dirname(os.path.abspath(__file__)), "soundfont.sf2"), size=1)
+    midi = encode_midi(_sample_notes(), 120, 0)
+    try: pool.render(midi)
+    except RenderError as e: raise Skip(str(e))
+    return lambda: pool.render(midi)
+
+
+# --- PLAY COUNTS ---
+def _scratch_sqlite(name, tuned=False):
+    from sqlalchemy import create_engine
+    from database import make_engine
+    url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), name)}"
+    return make_engine(url) if tuned else create_engine(url, connect_args={"check_same_thread": False})
+
+def _plays_case(write_behind, plays=200, tracks=200, threads=8):
+    """`plays` plays from `threads` threads: a commit per play (the old route) or PlayCounter's write-behind buffer."""
+    def setup():
+        from concurrent.futures import ThreadPoolExecutor
+        from sqlalchemy import text
+        from counters import PlayCounter
+        engine = _scratch_sqlite("plays.db")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE tracks (id INTEGER PRIMARY KEY, play_count INTEGER DEFAULT 0)"))
+            conn.execute(text("INSERT INTO tracks (id, play_count) VALUES (:id, 0)"), [{"id": i} for i in range(tracks)])
+        rng = random.Random(0)
+        ids = [rng.randrange(tracks) for _ in range(plays)]
+        counter = PlayCounter(engine, interval=0.05)
+        def direct(track_id):
+            with engine.begin() as conn:
+                conn.execute(text("SELECT id FROM tracks WHERE id = :id"), {"id": track_id}).first()
+                conn.execute(text("UPDATE tracks SET play_count = play_count + 1 WHERE id = :id"), {"id": track_id})
+        play = counter.add if write_behind else direct
+        if write_behind: counter.start()
+        pool = ThreadPoolExecutor(threads)
+        op = lambda: list(pool.map(play, ids))
+        def cleanup():
+            pool.shutdown(); counter.stop(); engine.dispose()
+        op.cleanup = cleanup
+        return op
+    return setup
+
+case("plays.commit_per_play", 20)(_plays_case(write_behind=False))
+case("plays.write_behind", 20)(_plays_case(write_behind=True))
+
+
+# --- DATABASE ---
+def _db_writes_case(tuned, writers=16, writes=20):
+    """
+    `writers` threads each committing `writes` insert + update transactions (like finished
+    generation jobs), with SQLite's default connection settings or make_engine()'s tuning.
+    Reports 'database is locked' failures alongside the timings.
+    """
+    def setup():
+        from concurrent.futures import ThreadPoolExecutor
+        from sqlalchemy import text
+        engine = _scratch_sqlite("writes.db", tuned)
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE tracks (id INTEGER PRIMARY KEY, owner_id INTEGER, filename VARCHAR, play_count INTEGER DEFAULT 0)"))
+        failures = []
+        def writer(owner_id):
+            for i in range(writes):
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(text("INSERT INTO tracks (owner_id, filename) VALUES (:o, :f)"), {"o": owner_id, "f": f"{owner_id}-{i}.mid"})
+                        conn.execute(text("UPDATE tracks SET play_count = play_count + 1 WHERE owner_id = :o AND id % 7 = 0"), {"o": owner_id})
+                except Exception as e:
+                    failures.append(e)
+        pool = ThreadPoolExecutor(writers)
+        op = lambda: list(pool.map(writer, range(writers)))
+        op.report = lambda: {"failed_writes": len(failures)}
+        def cleanup():
+            pool.shutdown(); engine.dispose()
+        op.cleanup = cleanup
+        return op
+    return setup
+
+case("db.writes.default", 10)(_db_writes_case(tuned=False))
+case("db.writes.tuned", 10)(_db_writes_case(tuned=True))
+
+
+# --- SEARCH ---
+WORDS = ("sunset neon rain city ocean dream fire night river lonely dance robot forest storm summer winter "
+         "heart road star memory ghost desert midnight velvet thunder garden mirror echo golden broken wild").split()
+
+def build_catalog(engine, tracks=200_000, owners=50, seed=0, vocabulary=5000):
+    """
+    Fills a scratch `tracks` table with synthetic tracks (fixed by `seed`). Words
+    are drawn Zipf-style from WORDS plus made-up ones, so a few terms are very
+    common and most are rare, roughly like real prompts.
+    """
+    from sqlalchemy import text
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "mi", "ra", "ven", "tor", "sil", "an", "qu", "el", "dra", "zu", "pe", "ny", "ox"]
+    made_up = ("".join(p) for n in (2, 3, 4) for p in itertools.product(syllables, repeat=n))
+    vocab = WORDS + list(itertools.islice(made_up, vocabulary - len(WORDS)))
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocab))))
+    def words(k): return " ".join(rng.choices(vocab, cum_weights=weights, k=k))
+    moods, genres = ["Happy", "Sad", "Calm", "Energetic"], ["Pop", "Rock", "Jazz", "Electronic", "Ambient", "Classical"]
+    instruments = ["Grand Piano", "Violin", "Cello", "Synth Lead", "Electric Guitar", "Saxophone", "Flute"]
+    with engine.begin() as conn:
+        conn.execute(text("""CREATE TABLE IF NOT EXISTS tracks (id INTEGER PRIMARY KEY, owner_id INTEGER, prompt TEXT, lyrics TEXT,
+                             ai_reasoning TEXT, tags VARCHAR, mood VARCHAR, genre VARCHAR, instrument VARCHAR, tempo INTEGER,
+                             cover_art VARCHAR, created_at VARCHAR)"""))
+        for chunk in range(0, tracks, 10_000):
+            conn.execute(text("""INSERT INTO tracks (owner_id, prompt, lyrics, ai_reasoning, tags, mood, genre, instrument, tempo, created_at)
+                                 VALUES (:owner_id, :prompt, :lyrics, :ai_reasoning, :tags, :mood, :genre, :instrument, :tempo, '00:00')"""),
+                         [{"owner_id": rng.randrange(owners), "prompt": words(8), "lyrics": "\n".join(words(6) for _ in range(4)),
+                           "ai_reasoning": words(20), "tags": words(2).replace(" ", ","),
+                           "mood": rng.choice(moods), "genre": rng.choice(genres), "instrument": rng.choice(instruments),
+                           "tempo": rng.randint(60, 180)} for _ in range(min(10_000, tracks - chunk))])
+
+_catalog = None
+
+def search_catalog():
+    """A 50,000-track synthetic catalog (10 owners) in a scratch SQLite file, FTS index backfilled."""
+    global _catalog
+    if _catalog is None:
+        from database import make_engine
+        from search import SearchIndex, install_fts, install_facet_index
+        engine = make_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'search.db')}")
+        build_catalog(engine, tracks=50_000, owners=10)
+        with engine.begin() as conn: install_fts(conn); install_facet_index(conn)
+        index = SearchIndex(engine, pause=0)
+        index.backfill()
+        _catalog = index
+    return _catalog
+
+def _search_case(params, fts=True):
+    def setup():
+        index = search_catalog()
+        if fts and not index.available: raise Skip("SQLite built without FTS5")
+        if not fts:
+            from search import SearchIndex
+            index = SearchIndex(index.engine)
+            index._available = False # LIKE scans, the pre-FTS baseline
+        return lambda: index.search(3, **params)
+    return setup
+
+for _name, _params in [("common", {"q": "sunset"}), ("rare", {"q": "velvet"}), ("two_words", {"q": "lonely midnight"}),
+                       ("prefix", {"q": "thun"}), ("faceted", {"q": "neon", "mood": "Calm", "tempo": "90-119"})]:
+    case(f"search.fts.{_name}", 50)(_search_case(_params))
+    case(f"search.like.{_name}", 10)(_search_case(_params, fts=False))
+case("search.facets_only", 50)(_search_case({"genre": "Jazz"}))
+
+
+# --- PASSWORD HASHING ---
+def _probe():
+    """A short pure-Python task standing in for an unrelated request."""
+    return sum(i * i for i in range(20_000))
+
+def _hash_probe_case(workers, logins=16):
+    """Times _probe() while `logins` threads keep verifying passwords, inline (workers=0) or in the hashing pool."""
+    def setup():
+        import threading
+        from auth import PasswordHasher, HasherBusy, hash_password
+        hashed = hash_password("correct horse")
+        hasher = PasswordHasher(workers=workers, max_pending=logins)
+        hasher.warm()
+        stop = threading.Event()
+        def login():
+            while not stop.is_set():
+                try: hasher.verify("correct horse", hashed)
+                except HasherBusy: stop.wait(0.01)
+        threads = [threading.Thread(target=login, daemon=True) for _ in range(logins)]
+        for t in threads: t.start()
+        def cleanup():
+            stop.set()
+            for t in threads: t.join()
+            hasher.shutdown()
+        op = lambda: _probe()
+        op.cleanup = cleanup
+        return op
+    return setup
+
+case("auth.probe.idle", 100)(lambda: _probe)
+case("auth.probe.during_verifies.inline", 50)(_hash_probe_case(workers=0))
+case("auth.probe.during_verifies.pool", 50)(_hash_probe_case(workers=2))
+
+
+# --- STARTUP ---
+# Each iteration is a fresh interpreter, as for a newly autoscaled worker; the scratch DB
+# persists between iterations, so schema checks after the first run are the restart path.
+# Storage GC stays off so its disk walk stays out of the timings.
+STARTUP_SCRIPTS = {
+    "import": "import main",
+    "first_request": "import main\nfrom fastapi.testclient import TestClient\n"
+                     "with TestClient(main.app) as c: assert c.get('/login').status_code == 200",
+    "warm": "import time, main\nfrom fastapi.testclient import TestClient\n"
+            "with TestClient(main.app) as c:\n"
+            "    while c.get('/startup/stats').json()['ready_ms'] is None: time.sleep(0.01)",
+}
+
+def _startup_case(script, preload):
+    def setup():
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'startup.db')}",
+                   PRELOAD="1" if preload else "0", STORAGE_GC_INTERVAL="0")
+        cwd = os.path.dirname(os.path.abspath(__file__))
+        def op(): subprocess.run([sys.executable, "-c", script], cwd=cwd, env=env, check=True, capture_output=True)
+        return op
+    return setup
+
+for _name, _script in STARTUP_SCRIPTS.items():
+    case(f"startup.{_name}", 5)(_startup_case(_script, preload=_name == "warm"))
+
+
+# --- HTTP ---
+_app = None
+
+def app_client(user="bench", tracks=0):
+    """
+    TestClient for main.app on a scratch database and output directory (DATABASE_URL
+    and OUTPUT_DIR are set before main is imported), with the Cerebras client
+    replaced by a 50 ms local stub.
+    Logs the client in as `user` (created on first use, then given `tracks`
+    synthetic tracks) and returns (client, main module).
+    """
+    global _app
+    if _app is None:
+        scratch = tempfile.mkdtemp()
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+        os.environ["OUTPUT_DIR"] = os.path.join(scratch, "output") # Generated tracks never land in the repo's static/output
+        os.environ["STORAGE_GC_INTERVAL"] = "0" # Keep the GC walk out of the timings
+        import main
+        from fastapi.testclient import TestClient
+        from analysis import AsyncStubClient
+        main.analyzer.client_factory = lambda key: AsyncStubClient(lambda model, prompt: main.simulate_ai_response(prompt), delay=0.05)
+        main.analyzer._clients.clear()
+        main.analyzer.cache = None # Every request reaches the (stub) backend
+        client = TestClient(main.app)
+        client.__enter__() # Runs startup: job workers, play counter
+        _app = (client, main)
+    client, main = _app
+    db = main.SessionLocal()
+    try: user_id = db.query(main.User.id).filter(main.User.username == user).scalar()
+    finally: db.close()
+    if user_id is None:
+        client.post("/register", data={"username": user, "password": user})
+        db = main.SessionLocal()
+        try: user_id = db.query(main.User.id).filter(main.User.username == user).scalar()
+        finally: db.close()
+        seed_tracks(main, user_id, tracks)
+    client.post("/login", data={"username": user, "password": user}, follow_redirects=False)
+    return client, main
+
+def seed_tracks(main, user_id, count):
+    """Bulk-inserts `count` seeded random tracks for one user."""
+    from sqlalchemy import insert
+    rng = random.Random(count)
+    moods, genres = ["Happy", "Sad", "Calm", "Energetic"], ["Pop", "Rock", "Jazz", "Electronic", "Ambient"]
+    rows = [dict(filename=f"bench/{user_id}-{i}.mid", mood=rng.choice(moods), genre=rng.choice(genres),
+                 tempo=rng.randint(60, 160), owner_id=user_id, play_count=rng.randint(0, 500),
+                 is_favorite=int(rng.random() < 0.1), duration=rng.randint(30, 240), created_at="00:00")
+            for i in range(count)]
+    db = main.SessionLocal()
+    try:
+        for chunk in range(0, len(rows), 5000): db.execute(insert(main.Track), rows[chunk:chunk + 5000])
+        db.commit()
+    finally:
+        db.close()
+
+@case("http.generate", 20)
+def _():
+    client, _ = app_client()
+    prompts = (f"{mood} {genre} song number {i}" for i in range(10**9)
+               for mood, genre in [("happy", "pop"), ("sad", "piano"), ("energetic", "rock")])
+    def op():
+        job = client.post("/", data={"prompt": next(prompts)}, headers={"accept": "application/json"}).json()
+        while True:
+            status = client.get(f"/jobs/{job['job_id']}").json()
+            if status["status"] in ("done", "failed"): break
+            time.sleep(0.005)
+        if status["status"] == "failed": raise RuntimeError(status["error"])
+    return op
+
+def _remix_case(fields):
+    def setup():
+        client, _ = app_client()
+        def wait(response):
+            job = response.json()
+            while (status := client.get(f"/jobs/{job['job_id']}").json())["status"] not in ("done", "failed"): time.sleep(0.005)
+            if status["status"] == "failed": raise RuntimeError(status["error"])
+            return status["result"]
+        track_id = wait(client.post("/", data={"prompt": "calm remix benchmark song"}, headers={"accept": "application/json"}))["track_id"]
+        variants = itertools.cycle(fields)
+        return lambda: wait(client.post(f"/track/{track_id}/remix", data=next(variants), headers={"accept": "application/json"}))
+    return setup
+
+# Alternating values so every call really changes the input; compare with http.generate
+case("http.remix.instrument", 20)(_remix_case([{"instrument": "Violin"}, {"instrument": "Cello"}]))
+case("http.remix.cover", 10)(_remix_case([{"new_cover": "true"}]))
+
+@case("http.login", 50)
+def _():
+    client, _ = app_client()
+    return lambda: client.post("/login", data={"username": "bench", "password": "bench"}, follow_redirects=False)
+
+@case("http.dashboard.during_logins", 50)
+def _():
+    """Dashboard latency while 8 threads keep logging in (the hashing pool's job is to keep this flat)."""
+    import threading
+    from fastapi.testclient import TestClient
+    app_client() # Creates the "bench" user the burst logs in as
+    client, main = app_client("bench1000", 1000)
+    stop = threading.Event()
+    def burst():
+        other = TestClient(main.app) # Own cookie jar; not entered, so the app's lifespan doesn't run again
+        while not stop.is_set(): other.post("/login", data={"username": "bench", "password": "bench"}, follow_redirects=False)
+    threads = [threading.Thread(target=burst, daemon=True) for _ in range(8)]
+    for t in threads: t.start()
+    def cleanup():
+        stop.set()
+        for t in threads: t.join()
+    op = lambda: client.get("/dashboard")
+    op.cleanup = cleanup
+    return op
+
+def _dashboard_case(path, tracks, mode="render"):
+    """
+    mode: "render" invalidates the user's page cache before every request (what the
+    first view after a change costs), "cached" repeats the request, "revalidate"
+    sends the page's ETag back and gets a bodyless 304.
+    """
+    def setup():
+        client, main = app_client(f"bench{tracks}", tracks) # One user per data size
+        response = client.get(path)
+        if response.status_code != 200: raise RuntimeError(f"GET {path} failed")
+        db = main.SessionLocal()
+        try: user_id = db.query(main.User.id).filter(main.User.username == f"bench{tracks}").scalar()
+        finally: db.close()
+        if mode == "render": return lambda: (main.page_cache.bump(user_id, "bench"), client.get(path))
+        if mode == "revalidate": return lambda: client.get(path, headers={"If-None-Match": response.headers["etag"]})
+        return lambda: client.get(path)
+    return setup
+
+for _tracks in (1000, 20000):
+    case(f"http.dashboard.{_tracks}", 50)(_dashboard_case("/dashboard", _tracks))
+    case(f"http.dashboard_page.{_tracks}", 50)(_dashboard_case(f"/dashboard/tracks?before={_tracks // 2}", _tracks))
+    case(f"http.profile.{_tracks}", 50)(_dashboard_case("/profile", _tracks))
+case("http.dashboard.cached.20000", 50)(_dashboard_case("/dashboard", 20000, "cached"))
+case("http.dashboard.revalidate.20000", 50)(_dashboard_case("/dashboard", 20000, "revalidate"))
+
+# --- RUN / COMPARE ---
+def environment():
+    try: commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError: commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "numpy": np.__version__, "commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+MEASURED = ("iterations", "ops_per_sec", "mean_ms", "p50_ms", "p99_ms", "peak_mem_kb")
+
+def run(selected, quick=False):
+    results = {}
+    for name, (setup, iterations) in CASES.items():
+        if selected and not any(name.startswith(prefix) for prefix in selected): continue
+        if quick: iterations = max(3, iterations // 10)
+        try:
+            op = setup()
+            results[name] = measure(op, iterations)
+            if hasattr(op, "report"): results[name].update(op.report()) # Case-specific counters (e.g. failed writes)
+            if hasattr(op, "cleanup"): op.cleanup()
+        except Skip as e:
+            results[name] = {"skipped": str(e)}
+        r = results[name]
+        if "skipped" in r: print(f"{name:<32} skipped: {r['skipped']}")
+        else: print(f"{name:<32} p50 {r['p50_ms']:>9.3f} ms  p99 {r['p99_ms']:>9.3f} ms  "
+                    f"{r['ops_per_sec']:>10,.1f} ops/s  peak {r['peak_mem_kb']:>9,.1f} KB"
+                    + "".join(f"  {key} {value}" for key, value in r.items() if key not in MEASURED))
+    return results
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Prints p50 changes against a baseline run; returns the names of regressed cases."""
+    regressions = []
+    print(f"\nvs baseline {baseline['environment'].get('commit')} ({baseline['environment'].get('time')}):")
+    for name, r in results.items():
+        base = baseline["results"].get(name)
+        if not base or "p50_ms" not in base or "p50_ms" not in r: continue
+        change = r["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] else 0.0
+        flag = "REGRESSION" if change > threshold else ""
+        if flag: regressions.append(name)
+        print(f"  {name:<32} {base['p50_ms']:>9.3f} -> {r['p50_ms']:>9.3f} ms  {change:+7.1%} {flag}")
+    return regressions
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="CoverComposer benchmark suite")
+    parser.add_argument("--only", default="", help="comma-separated case-name prefixes (e.g. composer,http.dashboard)")
+    parser.add_argument("--quick", action="store_true", help="a tenth of the iterations")
+    parser.add_argument("--out", help="results JSON path (default bench_results/<time>.json)")
+    parser.add_argument("--baseline", help="results JSON to compare against; exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="allowed p50 slowdown fraction")
+    parser.add_argument("--save-baseline", action="store_true", help="also write bench_results/baseline.json")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    args = parser.parse_args(argv)
+    if args.list:
+        print("\n".join(CASES)); return 0
+
+    selected = [p.strip() for p in args.only.split(",") if p.strip()]
+    report = {"environment": environment(), "quick": args.quick, "results": run(selected, args.quick)}
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out = args.out or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(out, "w") as f: json.dump(report, f, indent=2)
+    print(f"\nResults written to {out}")
+    if args.save_baseline:
+        with open(os.path.join(RESULTS_DIR, "baseline.json"), "w") as f: json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)
+        if compare(report["results"], baseline, args.threshold): return 1
+    return 0
+
+if __name__ == "__main__":
+    status = cli()
+    if _app is not None: _app[0].__exit__(None, None, None) # Flush the play buffer, stop workers and pools
+    sys.exit(status)
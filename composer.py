@@ -0,0 +1,173 @@
+import io, random
+from functools import lru_cache
+import numpy as np
+
+# --- MUSIC DATA ---
+SCALES = {
+    "Happy": [60, 62, 64, 65, 67, 69, 71, 72], # Major
+    "Sad": [60, 62, 63, 65, 67, 68, 70, 72],   # Minor
+    "Calm": [60, 62, 64, 67, 69],              # Pentatonic
+    "Energetic": [60, 62, 63, 65, 67, 68, 71, 72], # Dorian-ish
+    # We can expand this later with AI suggested scales
+}
+
+DRUM_PATTERNS = {
+    "Energetic": [(35, 0), (42, 0.5), (38, 1.0), (42, 1.5)],
+    "Sad": [(35, 0)], # Minimal
+}
+DEFAULT_DRUM_PATTERN = [(35, 0), (38, 1.0)] # Kick Snare basic
+
+# One row per note; arrays of these are kept sorted by start time
+NOTE_DTYPE = np.dtype([
+    ("track", "u1"), ("channel", "u1"), ("pitch", "u1"), ("velocity", "u1"),
+    ("start", "f4"), ("duration", "f4"),
+])
+
+# --- MUSIC LOGIC (reference implementation, kept for benchmarks) ---
+def markov_melody(scale, length=32):
+    curr = random.choice(scale)
+    melody = [curr]
+    for _ in range(length - 1):
+        if random.random() > 0.5: curr = random.choice(scale) # Simple randomness for now
+        melody.append(curr)
+    return melody
+
+def apply_style(melody, style, mood):
+    processed = []
+    for note in melody:
+        dur, vel = 1.0, 100
+        if style == "Complex":
+            if mood == "Energetic": dur, vel = 0.5, 120
+            elif mood == "Calm": dur, vel = 2.0, 80
+        processed.append((note, dur, vel))
+    return processed
+
+def add_drums(midi, duration, mood):
+    track, channel = 2, 9
+    pattern = [(35, 0), (38, 1.0)] # Kick Snare basic
+    if mood == "Energetic": pattern = [(35, 0), (42, 0.5), (38, 1.0), (42, 1.5)]
+    elif mood == "Sad": pattern = [(35, 0)] # Minimal
+    
+    time = 0
+    while time < duration:
+        for note, offset in pattern: midi.addNote(track, channel, note, time + offset, 0.5, 100)
+        time += 2
+
+# --- VECTORIZED ENGINE ---
+def style_params(style, mood):
+    """(duration, velocity) of melody notes, same rules as apply_style."""
+    if style == "Complex":
+        if mood == "Energetic": return 0.5, 120
+        if mood == "Calm": return 2.0, 80
+    return 1.0, 100
+
+@lru_cache(maxsize=None)
+def transition_matrix(scale):
+    """
+    Markov transition probabilities between the degrees of `scale` (a tuple of
+    MIDI pitches). Steps are weighted by semitone distance so melodies mostly
+    move stepwise, repeats are allowed, and there is a pull back to the tonic.
+    """
+    pitches = np.array(scale, dtype=np.float64)
+    distance = np.abs(pitches[:, None] - pitches[None, :])
+    weights = np.exp(-distance / 3.0)
+    np.fill_diagonal(weights, 0.35) # Repeated note
+    weights[:, 0] += 0.15           # Tonic
+    return weights / weights.sum(axis=1, keepdims=True)
+
+@lru_cache(maxsize=64)
+def _track_template(style, mood, length):
+    """
+    Note layout shared by every track of a batch: for a given style and mood
+    only the melody pitches vary, so timing, bass and drums are built once.
+    Returns (template notes sorted by start, melody index of each row or -1, duration).
+    """
+    dur, vel = style_params(style, mood)
+    starts = np.arange(length, dtype=np.float64) * dur
+    duration = length * dur
+
+    on_beat = np.flatnonzero(starts % 2 == 0)
+    pattern = DRUM_PATTERNS.get(mood, DEFAULT_DRUM_PATTERN)
+    bar_starts = np.arange(0, duration, 2.0)
+    drum_pitch = np.tile([p for p, _ in pattern], len(bar_starts))
+    drum_start = (bar_starts[:, None] + np.array([o for _, o in pattern])[None, :]).ravel()
+
+    n_mel, n_bass, n_drum = length, len(on_beat), len(drum_start)
+    notes = np.zeros(n_mel + n_bass + n_drum, dtype=NOTE_DTYPE)
+    source = np.full(len(notes), -1, dtype=np.int64) # Which melody step a row's pitch comes from
+
+    mel = slice(0, n_mel)
+    notes["track"][mel], notes["channel"][mel] = 0, 0
+    notes["start"][mel], notes["duration"][mel], notes["velocity"][mel] = starts, dur, vel
+    source[mel] = np.arange(length)
+
+    bass = slice(n_mel, n_mel + n_bass)
+    notes["track"][bass], notes["channel"][bass] = 1, 1
+    notes["start"][bass], notes["duration"][bass], notes["velocity"][bass] = starts[on_beat], 2.0, vel - 20
+    source[bass] = on_beat
+
+    drum = slice(n_mel + n_bass, None)
+    notes["track"][drum], notes["channel"][drum] = 2, 9
+    notes["start"][drum], notes["duration"][drum], notes["velocity"][drum] = drum_start, 0.5, 100
+    notes["pitch"][drum] = drum_pitch
+
+    order = np.argsort(notes["start"], kind="stable")
+    return notes[order], source[order], duration
+
+def markov_batch(scale, n, length, rng):
+    """(n, length) MIDI pitches, one Markov chain per row, all rows stepped together."""
+    cumulative = np.cumsum(transition_matrix(tuple(scale)), axis=1)
+    states = np.empty((n, length), dtype=np.int64)
+    states[:, 0] = rng.integers(0, len(scale), n)
+    draws = rng.random((n, length - 1))
+    for t in range(1, length):
+        row = cumulative[states[:, t - 1]]
+        states[:, t] = np.minimum((draws[:, t - 1, None] > row).sum(axis=1), len(scale) - 1)
+    return np.asarray(scale, dtype=np.int64)[states]
+
+def compose_batch(mood, style, n, length=32, seed=None):
+    """
+    Composes `n` tracks in one call. Returns (notes, duration) where notes is an
+    (n, notes_per_track) NOTE_DTYPE array, each row sorted by start time.
+    The same seed always gives the same batch.
+    """
+    rng = np.random.default_rng(seed)
+    scale = SCALES.get(mood, SCALES["Happy"])
+    template, source, duration = _track_template(style, mood, length)
+    melody = markov_batch(scale, n, length, rng)
+
+    notes = np.broadcast_to(template, (n, len(template))).copy()
+    pitched = source >= 0
+    pitch = melody[:, source[pitched]]
+    is_bass = (template["channel"][pitched] == 1)[None, :]
+    notes["pitch"][:, pitched] = np.where(is_bass, pitch - 12, pitch)
+    return notes, duration
+
+def compose_track(mood, style, length=32, seed=None):
+    """Single-track convenience wrapper: returns (notes, duration) for one track."""
+    notes, duration = compose_batch(mood, style, 1, length=length, seed=seed)
+    return notes[0], duration
+
+def dump_notes(notes):
+    """A note array as .npy bytes (kept next to the MIDI so remixes can re-encode it)."""
+    buf = io.BytesIO()
+    np.save(buf, np.asarray(notes, dtype=NOTE_DTYPE), allow_pickle=False)
+    return buf.getvalue()
+
+def load_notes(data): return np.load(io.BytesIO(data), allow_pickle=False)
+
+# --- BENCHMARK ---
+class _NoteSink:
+    """Stands in for MIDIFile so the reference path is timed without MIDIUtil overhead."""
+    def __init__(self): self.notes = []
+    def addNote(self, *note): self.notes.append(note)
+
+def _reference_track(mood, style):
+    melody = markov_melody(SCALES.get(mood, SCALES["Happy"]))
+    sink, t = _NoteSink(), 0
+    for note, dur, vel in apply_style(melody, style, mood):
+        sink.addNote(0, 0, note, t, dur, vel)
+        if t % 2 == 0: sink.addNote(1, 1, note - 12, t, 2.0, vel - 20)
+        t += dur
+    add_drums(sink, t, mood)
+    return sink.notes
@@ -0,0 +1,78 @@
+import time, threading
+from collections import Counter
+from sqlalchemy import text
+
+FLUSH_INTERVAL = 1.0 # Seconds between write-behind flushes
+
+
+class PlayCounter:
+    """
+    Write-behind buffer for play counts. Plays are tallied in memory and a
+    background thread folds them into `tracks.play_count` with one bulk
+    UPDATE per interval, instead of one SQLite transaction per click.
+    Counts survive a failed flush (they're merged back) and stop() flushes
+    whatever is left, so a graceful shutdown loses nothing.
+    """
+
+    def __init__(self, engine, interval=FLUSH_INTERVAL):
+        self.engine = engine
+        self.interval = interval
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock() # One flush at a time (timer vs shutdown)
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {"plays": 0, "flushes": 0, "rows_updated": 0, "flush_errors": 0, "last_flush_ms": 0.0}
+
+    def start(self):
+        if self._thread: return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="play-counter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join()
+        self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try: self.flush()
+            except Exception as e: print(f"⚠️ Play count flush failed: {e}")
+
+    def add(self, track_id, n=1):
+        with self._lock:
+            self._pending[track_id] += n
+            self._stats["plays"] += n
+
+    def pending(self, track_id=None):
+        """Unflushed plays for one track, or a copy of the whole buffer."""
+        with self._lock:
+            return self._pending.get(track_id, 0) if track_id is not None else dict(self._pending)
+
+    def flush(self):
+        """Writes buffered increments in one transaction; returns the number of tracks touched."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, Counter()
+            if not batch: return 0
+            start = time.perf_counter()
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(text("UPDATE tracks SET play_count = COALESCE(play_count, 0) + :n WHERE id = :id"),
+                                 [{"id": track_id, "n": n} for track_id, n in batch.items()])
+            except Exception:
+                with self._lock:
+                    self._pending.update(batch) # Retry on the next flush
+                    self._stats["flush_errors"] += 1
+                raise
+            with self._lock:
+                self._stats["flushes"] += 1
+                self._stats["rows_updated"] += len(batch)
+                self._stats["last_flush_ms"] = round(1000 * (time.perf_counter() - start), 2)
+            return len(batch)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "pending_tracks": len(self._pending), "pending_plays": sum(self._pending.values())}
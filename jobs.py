@@ -0,0 +1,188 @@
+import threading, queue, time, uuid, json, asyncio
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+
+class QueueFullError(Exception):
+    """Raised by JobQueue.submit when no more jobs can be accepted (-> HTTP 429)."""
+
+
+class StageStats:
+    """Thread-safe per-stage latency aggregates (count / total / max, in seconds)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, stage, seconds, failed=False):
+        with self._lock:
+            s = self._stats.setdefault(stage, {"count": 0, "errors": 0, "total": 0.0, "max": 0.0})
+            s["count"] += 1
+            s["total"] += seconds
+            s["max"] = max(s["max"], seconds)
+            if failed: s["errors"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {
+                    "count": s["count"], "errors": s["errors"],
+                    "avg_ms": round(1000 * s["total"] / s["count"], 2) if s["count"] else 0.0,
+                    "max_ms": round(1000 * s["max"], 2),
+                }
+                for name, s in self._stats.items()
+            }
+
+
+class Job:
+    """One queued generation. Status goes queued -> running -> done | failed."""
+
+    def __init__(self, owner_id, params, stats, instrument=None):
+        self.id = uuid.uuid4().hex
+        self.owner_id = owner_id
+        self.params = params
+        self.status = "queued"
+        self.stage = None
+        self.timings = {}
+        self.events = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.profile = None # Text report when the job ran under the profiler
+        self._stats = stats
+        self._instrument = instrument
+        self.emit("queued")
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def emit(self, event, **data):
+        self.events.append({
+            "event": event, "status": self.status, "stage": self.stage,
+            "elapsed": round(time.time() - self.created, 3), **data
+        })
+
+    @contextmanager
+    def track_stage(self, name):
+        """Times a pipeline stage and publishes start/end progress events."""
+        self.stage = name
+        self.emit("stage_start")
+        start = time.perf_counter()
+        failed = False
+        try:
+            with self._instrument(name) if self._instrument else nullcontext():
+                yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            self.timings[name] = round(1000 * seconds, 2)
+            self._stats.record(name, seconds, failed)
+            self.emit("stage_end", ms=self.timings[name], failed=failed)
+
+    def to_dict(self):
+        return {
+            "id": self.id, "status": self.status, "stage": self.stage,
+            "timings_ms": self.timings, "error": self.error,
+            "result": self.result if self.status == "done" else None,
+        }
+
+
+class JobQueue:
+    """
+    Bounded queue + fixed pool of worker threads running `handler(job)`.
+    The handler's return value becomes `job.result`; an exception fails the job.
+    `instrument(stage)`, if given, is a context manager wrapped around every job stage.
+    """
+
+    def __init__(self, handler, workers=2, max_queued=16, keep_finished=500, instrument=None):
+        self.handler = handler
+        self.instrument = instrument
+        self.workers = workers
+        self.keep_finished = keep_finished
+        self.stats = StageStats()
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+        self._rejected = 0
+
+    def start(self):
+        if self._threads: return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"gen-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=5.0):
+        for _ in self._threads: self._queue.put(None)
+        for t in self._threads: t.join(timeout)
+        self._threads = []
+
+    def submit(self, owner_id, params):
+        job = Job(owner_id, params, self.stats, self.instrument)
+        with self._lock: # Registered before a worker can pick it up, so get() finds it from the start
+            self._jobs[job.id] = job
+            self._prune()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+                self._rejected += 1
+            raise QueueFullError("Generation queue is full, try again shortly.")
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def _prune(self):
+        # Drop the oldest finished jobs once we keep more than `keep_finished`
+        finished = [jid for jid, j in self._jobs.items() if j.finished]
+        for jid in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[jid]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None: break
+            with self._lock: self._running += 1
+            job.status = "running"
+            job.emit("started", queue_wait=round(time.time() - job.created, 3))
+            try:
+                job.result = self.handler(job)
+                job.status = "done"
+                job.stage = None
+                job.emit("done")
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+                job.emit("failed", error=job.error)
+            finally:
+                with self._lock: self._running -= 1
+                self._queue.task_done()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "running": self._running,
+                "workers": self.workers,
+                "rejected": self._rejected,
+                "stages": self.stats.snapshot(),
+            }
+
+    async def sse(self, job, poll_interval=0.25):
+        """Async generator of Server-Sent Events for a job until it finishes."""
+        sent = 0
+        while True:
+            while sent < len(job.events):
+                ev = job.events[sent]
+                sent += 1
+                yield f"event: {ev['event']}\ndata: {json.dumps(ev)}\n\n"
+            if job.finished and sent >= len(job.events): break
+            await asyncio.sleep(poll_interval)
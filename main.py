@@ -1,42 +1,93 @@
-from fastapi import FastAPI, Request, Form, Response, Depends
-from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse
+import time
+IMPORT_STARTED = time.perf_counter() # Startup timing includes the framework imports below
+
+from fastapi import FastAPI, APIRouter, Request, Form, Response, Depends, Body
+from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from midiutil import MIDIFile
-from midi2audio import FluidSynth
-import os, random, json
-from datetime import datetime, timedelta
+import os, random, json, uuid, queue, threading, itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 
 # --- DB IMPORTS ---
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, Index, func, case, insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session, relationship
-from passlib.context import CryptContext
-from jose import JWTError, jwt
-from album_art import generate_cover_art
-from sqlalchemy import text
+from album_art import ArtExecutor, CoverCache, CoverVariants, VARIANT_WIDTHS, VARIANT_FORMATS
+from composer import compose_track, compose_batch, dump_notes, load_notes
+from midi_writer import encode_midi, decode_midi, RecentBuffers
+from jobs import JobQueue, QueueFullError
+from database import make_engine, migrate
+from auth import CachedUser, UserCache, PasswordHasher, HasherBusy
+from counters import PlayCounter
+from storage import Storage, GarbageCollector, GC_MAX_FRACTION
+from metrics import Registry, PipelineMetrics, TimedTemplates, profiled
+from synth import SynthPool, RenderError
+from analysis import HedgedAnalyzer, AnalysisCache, CircuitBreaker
+from search import SearchIndex, TEMPO_BUCKETS
+from pagecache import FragmentCache, PageStats, ImmutableStaticFiles, etag_for, http_date, not_modified
+from streaming import AudioTranscoder, LiveRender, MEDIA_TYPES, range_response
 
-app = FastAPI()
+router = APIRouter() # Routes; the app itself is built by create_app() at the bottom
 
 # --- DIRECTORIES ----
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_DIR = os.path.join(BASE_DIR, "static")
-OUTPUT_DIR = os.path.join(STATIC_DIR, "output")
+OUTPUT_DIR = os.environ.get("OUTPUT_DIR", os.path.join(STATIC_DIR, "output")) # Generated artifacts, served at /static/output
 TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
 
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
-templates = Jinja2Templates(directory=TEMPLATE_DIR)
+# --- METRICS ---
+metrics = Registry()
+pipeline_metrics = PipelineMetrics(metrics)
+http_seconds = metrics.histogram("covercomposer_http_request_seconds", "HTTP request latency", ["method", "route", "status"])
+http_in_flight = metrics.gauge("covercomposer_http_requests_in_flight", "HTTP requests being handled")
+template_seconds = metrics.histogram("covercomposer_template_render_seconds", "Jinja2 render time", ["template"],
+                                     buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+
+page_views = metrics.counter("covercomposer_page_views_total", "Dashboard/profile/history views by how they were answered", ["page", "outcome"])
+page_bytes = metrics.counter("covercomposer_page_bytes_total", "HTML bytes sent for page views (0 for a 304)", ["page"])
+page_render_seconds = metrics.histogram("covercomposer_page_render_seconds", "Time to build a page that wasn't cached", ["page"],
+                                        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5))
+
+templates = TimedTemplates(directory=TEMPLATE_DIR, histogram=template_seconds)
 
 # --- CONFIG ---
 SECRET_KEY = "covercomposer_secret"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
-SQLALCHEMY_DATABASE_URL = "sqlite:///./covercomposer.db"
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./covercomposer.db") # or postgresql+psycopg2://...
+DB_POOL_SIZE = 10           # Should cover GENERATION_WORKERS + concurrent requests
+DB_MAX_OVERFLOW = 20
+GENERATION_WORKERS = 2      # Threads running the generate pipeline
+GENERATION_QUEUE_SIZE = 16  # Pending jobs before POST / answers 429
+SOUNDFONT_PATH = os.path.join(BASE_DIR, "soundfont.sf2")
+SYNTH_INSTANCES = GENERATION_WORKERS # One resident FluidSynth per generation worker
+ART_WORKERS = None          # Cover-art processes (None -> one per CPU core)
+DETERMINISTIC_COVERS = False # True -> covers without an explicit seed use seed 0, so equal inputs share one cached image
+COVER_CACHE_DIR = os.path.join(BASE_DIR, "cache", "covers")
+AUDIO_CACHE_DIR = os.path.join(BASE_DIR, "cache", "audio") # FLAC / Ogg encodes of rendered WAVs
+THUMBNAIL_DIR = os.path.join(BASE_DIR, "cache", "thumbs")  # WebP / JPEG size variants of covers
+COVER_CACHE_MAX_ENTRIES = 512
+COVER_CACHE_MAX_BYTES = 256 * 1024 * 1024
+PLAY_FLUSH_INTERVAL = 1.0   # Seconds between write-behind play-count flushes
+STORAGE_GC_INTERVAL = int(os.environ.get("STORAGE_GC_INTERVAL", 3600)) # Seconds between orphaned-file sweeps of static/output (0 disables)
+STORAGE_GC_DELETE = os.environ.get("STORAGE_GC_DELETE") == "1" # Let the scheduled pass delete; otherwise it only reports what it would remove
+STORAGE_GC_HTTP_DELETE = os.environ.get("STORAGE_GC_HTTP_DELETE") == "1" # Allow POST /storage/gc?dry_run=false
+PROFILING_ENABLED = False   # Allow `X-Profile: 1` on POST / to profile that generation
+PROFILE_HEADER = "X-Profile"
+BATCH_MAX_ITEMS = 5000      # Tracks per /batch request
+BATCH_PREP_THREADS = 8      # Concurrent analyses in a batch
+BATCH_COMPOSE_GROUP = 32    # Unseeded items with the same mood/style composed per compose_batch() call
+BATCH_MAX_CONCURRENT = 2    # Batches running at once before POST /batch answers 429
+DASHBOARD_PAGE_SIZE = 30   # Tracks per dashboard page / infinite-scroll fetch
+PASSWORD_HASH_WORKERS = 2  # Processes hashing passwords for /register and /login (0 -> on the request thread)
+PASSWORD_HASH_MAX_PENDING = 16 # Hashes queued or running before logins get a 429
+PASSWORD_ROUNDS = 29000     # pbkdf2_sha256 work factor; raise it and older hashes are upgraded at each user's next login
+PAGE_CACHE_TTL = 300        # Seconds a cached page/fragment is trusted; bounds staleness from writes made by other processes
+PAGE_CACHE_MAX_ENTRIES = 4096
+PRELOAD_ON_STARTUP = os.environ.get("PRELOAD", "1") != "0" # Warm synths, art workers and SDKs in the background after startup
 
 # --- CEREBRAS AI ---
-from cerebras.cloud.sdk import Cerebras
-
 # PASTE YOUR 5 KEYS HERE
 CEREBRAS_API_KEYS = [
     "csk-tdjkyk942tf3j8rd43em5rftyph5xmw55f6855pr8nwktp3k",
@@ -46,19 +97,14 @@ CEREBRAS_API_KEYS = [
     "csk-4dvdcynwe6kd2mk3kym9t9exwyxx3kj96wckd8kf45ej3xd4"
 ]
 
-current_key_index = 0
+CEREBRAS_MODELS = ["llama-3.3-70b", "llama3.1-8b", "qwen-3-32b"] # Valid models from user
+CEREBRAS_BASE_URL = None # Another chat-completions endpoint (e.g. a local mock); None -> Cerebras cloud
+ANALYSIS_CACHE_PATH = os.path.join(BASE_DIR, "cache", "analysis.db")
+ANALYSIS_CACHE_TTL = 7 * 24 * 3600
+ANALYSIS_BUDGET = 8.0       # Seconds per analysis before falling back to Offline Magic Mode
+ANALYSIS_HEDGE_AFTER = 2.0  # Hedge delay until enough latencies are recorded to use the p90
 
-def get_next_cerebras_key():
-    global current_key_index
-    key = CEREBRAS_API_KEYS[current_key_index]
-    current_key_index = (current_key_index + 1) % len(CEREBRAS_API_KEYS)
-    return key
-
-def analyze_prompt_with_cerebras(prompt_text):
-    """
-    Uses Cerebras (Llama 3.1) with Key Rotation to analyze the prompt.
-    """
-    system_instruction = """
+ANALYSIS_SYSTEM_PROMPT = """
     You are an expert Musicologist and Producer AI. Analyze the user's story/prompt and output a JSON object.
     
     CRITICAL: Your "reasoning" must be a deep musical explanation (approx 2 sentences). 
@@ -71,52 +117,19 @@ def analyze_prompt_with_cerebras(prompt_text):
         "reasoning": "Deep musical explanation string", "lyrics": "4 lines of lyrics"
     }
     """
-    
-    # Try up to 5 times (once per key)
-    # Valid models from user: llama-3.3-70b, llama3.1-8b, qwen-3-32b
-    models = ["llama-3.3-70b", "llama3.1-8b", "qwen-3-32b"]
-    
-    for _ in range(len(CEREBRAS_API_KEYS)):
-        try:
-            api_key = get_next_cerebras_key()
-            if "YOUR_KEY" in api_key: continue # Skip placeholders
-            
-            client = Cerebras(api_key=api_key)
-            
-            # Try models in order
-            for model_name in models:
-                try:
-                    print(f"🤖 Sending prompt to Cerebras AI (Model: {model_name})...")
-                    
-                    response = client.chat.completions.create(
-                        model=model_name,
-                        messages=[
-                            {"role": "system", "content": system_instruction},
-                            {"role": "user", "content": prompt_text}
-                        ],
-                        response_format={"type": "json_object"}
-                    )
-                    
-                    content = response.choices[0].message.content
-                    data = json.loads(content)
-                    
-                    print(f"✅ Cerebras Success! Reasoning: {data.get('reasoning')}")
-                    print(f"🎤 AI Lyrics: {data.get('lyrics')[:50]}...")
-                    return data
-                    
-                except Exception as model_error:
-                    if "404" in str(model_error) or "model_not_found" in str(model_error):
-                        print(f"⚠️ Cerebras Model Not Found ({model_name}). Trying next...")
-                        continue # Try next model with SAME key
-                    else:
-                        raise model_error # Re-raise if it's a key/rate limit issue to trigger key rotation
-            
-        except Exception as e:
-            print(f"Cerebras Key Error (Key: {api_key[:5]}...): {e}")
-            continue
 
-    print("All Cerebras keys failed. Using Offline Magic Mode.")
-    return simulate_ai_response(prompt_text)
+def make_cerebras_client(api_key):
+    from cerebras.cloud.sdk import AsyncCerebras # Heavy SDK import, done on first client (preloaded after startup)
+    # No SDK retries: the hedged analyzer decides when to try another key/model
+    return AsyncCerebras(api_key=api_key, base_url=CEREBRAS_BASE_URL, max_retries=0)
+
+def analyze_prompt_with_cerebras(prompt_text):
+    """
+    Uses Cerebras (Llama 3.1) with Key Rotation to analyze the prompt.
+    Results are cached by normalized prompt and concurrent identical prompts share one call.
+    Slow calls are hedged to another key/model; past ANALYSIS_BUDGET we use the offline path.
+    """
+    return analyzer.analyze(prompt_text)
 
 def simulate_ai_response(text):
     text = text.lower()
@@ -149,7 +162,14 @@ def simulate_ai_response(text):
         })
         
     return data
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+
+analyzer = HedgedAnalyzer(
+    CEREBRAS_API_KEYS, CEREBRAS_MODELS, ANALYSIS_SYSTEM_PROMPT, make_cerebras_client, simulate_ai_response,
+    cache=AnalysisCache(ANALYSIS_CACHE_PATH, ttl=ANALYSIS_CACHE_TTL), breaker=CircuitBreaker(threshold=3, cooldown=60),
+    budget=ANALYSIS_BUDGET, hedge_after=ANALYSIS_HEDGE_AFTER
+)
+
+engine = make_engine(SQLALCHEMY_DATABASE_URL, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -194,49 +214,70 @@ class Track(Base):
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="tracks")
     cover_art = Column(String, nullable=True)
+    spec = Column(Text, nullable=True) # JSON of analyze_params() output, so remixes skip the LLM
 
-Base.metadata.create_all(bind=engine)
+    # Dashboard listing walks (owner_id, id) newest-first; also serves every owner_id filter.
+    # Search facet counts without a text query are an index-only scan of the second one.
+    __table_args__ = (Index("ix_tracks_owner_id_id", "owner_id", "id"),
+                      Index("ix_tracks_owner_facets", "owner_id", "mood", "genre", "instrument", "tempo"))
 
-# --- MIGRATION CHECK ---
-def run_migrations():
-    try:
-        with engine.connect() as conn:
-            conn.execute(text("ALTER TABLE tracks ADD COLUMN cover_art VARCHAR"))
-            print("✅ Migration: Added 'cover_art' column to tracks table.")
-    except Exception as e:
-        # Expected if column already exists
-        pass
+# --- SCHEMA CHECK ---
+_schema_lock = threading.Lock()
+_schema_ready = False
 
-run_migrations()
+def init_database():
+    """Creates missing tables and applies pending migrations, once per process (app startup or CLI)."""
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready: return
+        Base.metadata.create_all(bind=engine)
+        migrate(engine) # Versioned steps in database.MIGRATIONS; a no-op once the schema is current
+        _schema_ready = True
+
+play_counter = PlayCounter(engine, interval=PLAY_FLUSH_INTERVAL)
+search_index = SearchIndex(engine) # FTS5 over tracks; backfills pre-existing rows in the background
+page_cache = FragmentCache(ttl=PAGE_CACHE_TTL, max_entries=PAGE_CACHE_MAX_ENTRIES) # Per-user; bumped by anything that changes a user's pages
+page_stats = PageStats()
 
 # --- SECURITY ---
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+password_hasher = PasswordHasher(workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING, rounds=PASSWORD_ROUNDS)
+
+def hasher_busy(e):
+    return HTMLResponse(str(e), status_code=429, headers={"Retry-After": "2"})
 
 def get_db():
     db = SessionLocal()
     try: yield db
     finally: db.close()
 
-def get_current_user(request: Request, db: Session = Depends(get_db)):
+def load_user(user_id):
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        return CachedUser.from_row(user) if user else None
+    finally: db.close()
+
+user_cache = UserCache(load_user)
+
+def create_access_token(user):
+    from jose import jwt
+    expires = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    return jwt.encode({"sub": user.username, "uid": user.id, "exp": expires}, SECRET_KEY, algorithm=ALGORITHM)
+
+def get_current_user(request: Request):
+    """Resolves the user from the token's uid claim via the user cache; tokens without uid/exp are rejected."""
     token = request.cookies.get("access_token")
     if not token: return None
+    from jose import JWTError, jwt
     try:
         if token.startswith("Bearer "): token = token.split(" ")[1]
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None: return None
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"require_exp": True})
+        user_id = payload.get("uid")
+        if not isinstance(user_id, int): return None
     except JWTError: return None
-    return db.query(User).filter(User.username == username).first()
+    return user_cache.get(user_id)
 
 # --- MUSIC DATA ---
-SCALES = {
-    "Happy": [60, 62, 64, 65, 67, 69, 71, 72], # Major
-    "Sad": [60, 62, 63, 65, 67, 68, 70, 72],   # Minor
-    "Calm": [60, 62, 64, 67, 69],              # Pentatonic
-    "Energetic": [60, 62, 63, 65, 67, 68, 71, 72], # Dorian-ish
-    # We can expand this later with AI suggested scales
-}
-
 INSTRUMENTS = {
     "Grand Piano": 0, "Electric Piano": 4, "Acoustic Guitar": 24, "Electric Guitar": 29,
     "Violin": 40, "Cello": 42, "Trumpet": 56, "Saxophone": 65, "Flute": 73,
@@ -256,80 +297,55 @@ def generate_lyrics(mood, prompt=None):
     random.shuffle(lines)
     return "\n".join(lines)
 
-# --- MUSIC LOGIC ---
-def markov_melody(scale, length=32):
-    curr = random.choice(scale)
-    melody = [curr]
-    for _ in range(length - 1):
-        if random.random() > 0.5: curr = random.choice(scale) # Simple randomness for now
-        melody.append(curr)
-    return melody
-
-def apply_style(melody, style, mood):
-    processed = []
-    for note in melody:
-        dur, vel = 1.0, 100
-        if style == "Complex":
-            if mood == "Energetic": dur, vel = 0.5, 120
-            elif mood == "Calm": dur, vel = 2.0, 80
-        processed.append((note, dur, vel))
-    return processed
-
-def add_drums(midi, duration, mood):
-    track, channel = 2, 9
-    pattern = [(35, 0), (38, 1.0)] # Kick Snare basic
-    if mood == "Energetic": pattern = [(35, 0), (42, 0.5), (38, 1.0), (42, 1.5)]
-    elif mood == "Sad": pattern = [(35, 0)] # Minimal
-    
-    time = 0
-    while time < duration:
-        for note, offset in pattern: midi.addNote(track, channel, note, time + offset, 0.5, 100)
-        time += 2
-
 # --- ROUTES ---
-@app.post("/register")
+@router.post("/register")
 def register(username: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
     if db.query(User).filter(User.username == username).first(): return RedirectResponse(url="/register", status_code=303)
-    new_user = User(username=username, hashed_password=pwd_context.hash(password))
+    try: hashed = password_hasher.hash(password)
+    except HasherBusy as e: return hasher_busy(e)
+    new_user = User(username=username, hashed_password=hashed)
     db.add(new_user); db.commit()
     return RedirectResponse(url="/login", status_code=303)
 
-@app.post("/login")
+@router.post("/login")
 def login(response: Response, username: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
     user = db.query(User).filter(User.username == username).first()
-    if not user or not pwd_context.verify(password, user.hashed_password): return RedirectResponse(url="/login?error=Invalid", status_code=303)
-    token = jwt.encode({"sub": user.username}, SECRET_KEY, algorithm=ALGORITHM)
+    if not user: return RedirectResponse(url="/login?error=Invalid", status_code=303)
+    try: ok, new_hash = password_hasher.verify(password, user.hashed_password)
+    except HasherBusy as e: return hasher_busy(e)
+    if not ok: return RedirectResponse(url="/login?error=Invalid", status_code=303)
+    if new_hash: # Stored under an older work factor: upgrade it now that we have the plaintext
+        user.hashed_password = new_hash; db.commit()
+    token = create_access_token(user)
+    user_cache.put(CachedUser.from_row(user))
     resp = RedirectResponse(url="/", status_code=303)
-    resp.set_cookie(key="access_token", value=f"Bearer {token}", httponly=True)
+    resp.set_cookie(key="access_token", value=f"Bearer {token}", httponly=True, max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
     return resp
 
-@app.get("/logout")
+@router.get("/logout")
 def logout(response: Response):
     resp = RedirectResponse(url="/login", status_code=303); resp.delete_cookie("access_token"); return resp
 
-@app.get("/login", response_class=HTMLResponse)
+@router.get("/login", response_class=HTMLResponse)
 def login_page(request: Request): return templates.TemplateResponse("login.html", {"request": request})
-@app.get("/register", response_class=HTMLResponse)
+@router.get("/register", response_class=HTMLResponse)
 def register_page(request: Request): return templates.TemplateResponse("register.html", {"request": request})
 
-@app.get("/", response_class=HTMLResponse)
-def home(request: Request, user: User = Depends(get_current_user)):
+@router.get("/", response_class=HTMLResponse)
+def home(request: Request, user: CachedUser = Depends(get_current_user)):
     if not user: return RedirectResponse(url="/login")
     return templates.TemplateResponse("index.html", {"request": request, "user": user, "instruments": INSTRUMENTS})
 
-@app.post("/", response_class=HTMLResponse)
-def generate(
-    request: Request,
-    prompt: str = Form(None), # Text prompt for AI
-    mood: str = Form(None), genre: str = Form(None), tempo: int = Form(120),
-    style: str = Form("Complex"), instrument: str = Form(None), 
-    user: User = Depends(get_current_user), db: Session = Depends(get_db)
-):
-    if not user: return RedirectResponse(url="/login")
+# --- GENERATION PIPELINE ---
+# Stage functions shared by the job queue (one track) and the batch pipeline (many).
+def analyze_params(p):
+    """Stage 1: resolves request params into the final music spec (Cerebras decides when there's a prompt)."""
+    prompt, mood, genre, tempo = p.get("prompt"), p.get("mood"), p.get("genre"), p.get("tempo") or 120
+    style, instrument = p.get("style") or "Complex", p.get("instrument")
+    cover_seed = p.get("seed")
+    if cover_seed is None and DETERMINISTIC_COVERS: cover_seed = 0
 
     ai_data = {}
-    
-    # 1. AI Logic
     if prompt and len(prompt) > 5:
         # Use Cerebras
         ai_data = analyze_prompt_with_cerebras(prompt)
@@ -350,114 +366,958 @@ def generate(
         if not instrument: instrument = "0"
         ai_data["reasoning"] = "Manual creation"
 
-    # 2. Generation Logic
-    scale = SCALES.get(mood, SCALES["Happy"])
-    melody = markov_melody(scale)
-    styled_melody = apply_style(melody, style, mood)
-    
-    ts = datetime.now().strftime("%Y%m%d%H%M%S")
-    midi_file = f"{ts}.mid"
-    wav_file = f"{ts}.wav"
-    midi_path = os.path.join(OUTPUT_DIR, midi_file)
-    wav_path = os.path.join(OUTPUT_DIR, wav_file)
-
-    midi = MIDIFile(3)
-    midi.addTempo(0, 0, tempo)
-    midi.addProgramChange(0, 0, 0, int(instrument))
-    
-    time = 0
-    for note, dur, vel in styled_melody:
-        midi.addNote(0, 0, note, time, dur, vel)
-        if time % 2 == 0: midi.addNote(1, 1, note - 12, time, 2.0, vel - 20) # Bass
-        time += dur
-    add_drums(midi, time, mood)
-
-    with open(midi_path, "wb") as f: midi.writeFile(f)
-    
-    # WAV Conversion
-    wav_ready = False
-    try: FluidSynth(os.path.join(BASE_DIR, "soundfont.sf2")).midi_to_audio(midi_path, wav_path); wav_ready = True
-    except: pass
-
     # Use AI lyrics if available, else fallback
-    song_lyrics = ai_data.get("lyrics")
-    if not song_lyrics:
-        song_lyrics = generate_lyrics(mood)
+    lyrics = ai_data.get("lyrics") or generate_lyrics(mood)
+    return {"prompt": prompt, "mood": mood, "genre": genre, "tempo": tempo, "style": style, "instrument": instrument,
+            "seed": p.get("seed"), "cover_seed": cover_seed, "reasoning": ai_data.get("reasoning"), "lyrics": lyrics}
+
+def notes_name(midi_name):
+    """The note array stored alongside a track's MIDI (<stem>.npy)."""
+    return f"{midi_name[:-len('.mid')]}.npy"
+
+def write_midi(spec, notes):
+    """
+    Encodes the note array and stores it as <stem>.mid (plus the notes as <stem>.npy),
+    where the stem hashes the MIDI plus the cover inputs (unique per track unless
+    everything is seeded). Returns (stem, MIDI bytes).
+    """
+    midi_data = encode_midi(notes, spec["tempo"], int(spec["instrument"]))
+    stem = storage.new_stem(midi_data, spec["mood"], spec["genre"], spec["tempo"], spec["cover_seed"],
+                            deterministic=spec["cover_seed"] is not None)
+    storage.write_bytes(f"{stem}.mid", midi_data)
+    storage.write_bytes(f"{stem}.npy", dump_notes(notes))
+    recent_midi.put(f"{stem}.mid", midi_data)
+    return stem, midi_data
+
+def render_wav(stem, midi_data):
+    """Renders <stem>.wav through the synth pool unless it exists; raises RenderError."""
+    if storage.exists(f"{stem}.wav"): return # Same id -> same MIDI -> same audio
+    wav_path = storage.path(f"{stem}.wav")
+    tmp_path = f"{wav_path}.{uuid.uuid4().hex[:8]}.part" # Renders of the same stem can run at once
+    try:
+        synth_pool.render_to_wav(storage.path(f"{stem}.mid"), tmp_path, midi_data=midi_data)
+        os.replace(tmp_path, wav_path)
+    finally:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
 
-    # 4. Generate Album Art
-    cover_filename = f"{ts}.png"
-    cover_path = os.path.join(OUTPUT_DIR, cover_filename)
+def write_wav(stem, midi_data):
+    """render_wav() for the pipelines: returns False (and logs) if the synth isn't available."""
     try:
-        generate_cover_art(mood, genre, tempo, cover_path)
+        render_wav(stem, midi_data)
+        return True
+    except RenderError as e:
+        print(f"WAV Render Error: {e}")
+        pipeline_metrics.error("wav")
+        return False
+
+def write_cover(spec, stem):
+    """Renders <stem>.png in the art pool; returns its name, or None (and logs) on failure."""
+    cover_filename = f"{stem}.png"
+    if spec["cover_seed"] is not None and storage.exists(cover_filename): return cover_filename
+    try:
+        art_executor.render(spec["mood"], spec["genre"], spec["tempo"], storage.path(cover_filename, create=True), seed=spec["cover_seed"],
+                            variants=cover_variants.eager(cover_filename))
+        return cover_filename
     except Exception as e:
         print(f"Album Art Error: {e}")
-        cover_filename = None
-
-    # 3. DB Save
-    new_track = Track(
-        filename=midi_file, wav_filename=wav_file if wav_ready else None,
-        mood=mood, genre=genre, tempo=tempo, style=style,
-        instrument=list(INSTRUMENTS.keys())[list(INSTRUMENTS.values()).index(int(instrument))],
-        prompt=prompt,
-        ai_reasoning=ai_data.get("reasoning", "Manual"),
+        pipeline_metrics.error("cover_art")
+        return None
+
+def track_row(spec, stem, owner_id, duration, wav_ready, cover_filename):
+    """Column values for the Track of one finished generation."""
+    return dict(
+        filename=f"{stem}.mid", wav_filename=f"{stem}.wav" if wav_ready else None,
+        mood=spec["mood"], genre=spec["genre"], tempo=spec["tempo"], style=spec["style"],
+        instrument=list(INSTRUMENTS.keys())[list(INSTRUMENTS.values()).index(int(spec["instrument"]))],
+        prompt=spec["prompt"],
+        ai_reasoning=spec["reasoning"] or "Manual",
         created_at=datetime.now().strftime("%H:%M"),
         created_date=datetime.now().strftime("%Y-%m-%d"),
-        lyrics=song_lyrics, duration=int(time), owner_id=user.id,
-        cover_art=cover_filename
+        lyrics=spec["lyrics"], duration=int(duration), owner_id=owner_id,
+        cover_art=cover_filename, spec=json.dumps(spec)
     )
-    db.add(new_track); db.commit()
+
+def run_generation(job):
+    """
+    Runs the full pipeline for a queued job (on a worker thread, not the request thread).
+    Returns the template context needed to render result.html.
+    """
+    # 1. AI Logic
+    with job.track_stage("analysis"):
+        spec = analyze_params(job.params)
+
+    # 2. Generation Logic (melody, bass and drums as one note array)
+    with job.track_stage("melody"):
+        notes, duration = compose_track(spec["mood"], spec["style"], seed=spec["seed"])
     
-    history = db.query(Track).filter(Track.owner_id == user.id).order_by(Track.id.desc()).limit(5).all()
+    with storage.holding() as hold: # GC leaves the files alone until the Track row is committed
+        with job.track_stage("midi"):
+            stem, midi_data = write_midi(spec, notes)
+            hold(stem)
+
+        # WAV Conversion
+        with job.track_stage("wav"):
+            wav_ready = write_wav(stem, midi_data)
+
+        # 4. Generate Album Art
+        with job.track_stage("cover_art"):
+            cover_filename = write_cover(spec, stem)
+
+        # 3. DB Save (worker threads get their own session)
+        with job.track_stage("db"):
+            db = SessionLocal()
+            try:
+                new_track = Track(**track_row(spec, stem, job.owner_id, duration, wav_ready, cover_filename))
+                db.add(new_track); db.commit()
+                track_id = new_track.id
+            finally:
+                db.close()
+            page_cache.bump(job.owner_id, "generate")
+
+    return {
+        "track_id": track_id, "mood": spec["mood"], "genre": spec["genre"],
+        "ai_reasoning": spec["reasoning"], "prompt": spec["prompt"],
+        "audio": f"/static/output/{stem}.mid", "wav_filename": f"{stem}.wav" if wav_ready else None,
+        "lyrics": spec["lyrics"], "cover_art": cover_filename
+    }
+
+# --- REMIX ---
+REMIX_FIELDS = ("mood", "genre", "tempo", "style", "instrument", "seed", "cover_seed")
+# Stage -> (spec fields it reads, stages whose output it reads). Analysis (the LLM) reads
+# only the prompt, which a remix can't change, so it is never rerun.
+REMIX_STAGES = {
+    "melody": (("mood", "style", "seed"), ()),
+    "midi": (("tempo", "instrument"), ("melody",)),
+    "wav": ((), ("midi",)),
+    "cover_art": (("mood", "genre", "tempo", "cover_seed"), ()),
+}
+remix_stages = metrics.counter("covercomposer_remix_stages_total", "Pipeline stages of remixes by outcome (recomputed or reused)", ["stage", "outcome"])
+
+def stored_spec(track):
+    """The spec a track was generated from; rebuilt from its columns for tracks stored before specs were kept."""
+    if track.spec: return json.loads(track.spec)
+    return {"prompt": track.prompt, "mood": track.mood, "genre": track.genre, "tempo": track.tempo, "style": track.style or "Complex",
+            "instrument": str(INSTRUMENTS.get(track.instrument, 0)), "seed": None, "cover_seed": None,
+            "reasoning": track.ai_reasoning, "lyrics": track.lyrics}
+
+def remix_plan(old, new, new_cover=False):
+    """Returns (changed fields, stages to recompute in order) for going from spec `old` to `new`."""
+    changed = {field for field in REMIX_FIELDS if new.get(field) != old.get(field)}
+    rerun = []
+    for stage, (fields, inputs) in REMIX_STAGES.items():
+        if changed & set(fields) or any(s in rerun for s in inputs) or (stage == "cover_art" and new_cover): rerun.append(stage)
+    return changed, rerun
+
+def load_track_notes(track):
+    """A track's note array: the stored .npy, or decoded from its MIDI for tracks that predate it."""
+    try:
+        with open(storage.path(notes_name(track.filename)), "rb") as f: return load_notes(f.read())
+    except FileNotFoundError:
+        with open(storage.path(track.filename), "rb") as f: return decode_midi(f.read())[0]
+
+def run_remix(job):
+    """
+    Re-runs only the stages of an existing track whose inputs changed (see REMIX_STAGES),
+    reusing the stored spec, notes, MIDI, WAV and cover for the rest, then updates the
+    track in place. Files the track no longer uses are deleted unless shared.
+    """
+    db = SessionLocal()
+    try:
+        track = db.query(Track).filter(Track.id == job.params["remix"], Track.owner_id == job.owner_id).first()
+        if not track: raise ValueError("Track not found")
+        old = stored_spec(track)
+        new = {**old, **job.params["changes"]}
+        if job.params.get("new_cover") and "cover_seed" not in job.params["changes"]: new["cover_seed"] = None # Reroll
+        changed, rerun = remix_plan(old, new, job.params.get("new_cover"))
+
+        with storage.holding() as hold:
+            stem, duration = track.filename[:-len(".mid")], track.duration
+            if "melody" in rerun:
+                with job.track_stage("melody"):
+                    notes, duration = compose_track(new["mood"], new["style"], seed=new["seed"])
+            elif "midi" in rerun:
+                with job.track_stage("notes"): notes = load_track_notes(track)
+            wav_filename = track.wav_filename
+            if "midi" in rerun:
+                with job.track_stage("midi"):
+                    stem, midi_data = write_midi(new, notes)
+                    hold(stem)
+                with job.track_stage("wav"):
+                    wav_filename = f"{stem}.wav" if write_wav(stem, midi_data) else None
+            cover_filename = track.cover_art
+            if "cover_art" in rerun:
+                with job.track_stage("cover_art"):
+                    # A new name even when the MIDI is reused: covers are served as immutable
+                    cover_stem = stem if "midi" in rerun else storage.new_stem(
+                        track.id, new["mood"], new["genre"], new["tempo"], new["cover_seed"], deterministic=new["cover_seed"] is not None)
+                    hold(cover_stem)
+                    cover_filename = write_cover(new, cover_stem) or cover_filename
+
+            with job.track_stage("db"):
+                old_names = [track.filename, track.wav_filename, track.cover_art]
+                row = track_row(new, stem, track.owner_id, duration, wav_filename is not None, cover_filename)
+                for column in ("filename", "wav_filename", "mood", "genre", "tempo", "style", "instrument", "duration", "cover_art", "spec"):
+                    setattr(track, column, row[column])
+                db.commit()
+                page_cache.bump(track.owner_id, "remix")
+                drop_artifacts(db, [name for name in old_names if name not in (track.filename, track.wav_filename, track.cover_art)])
+                result = {
+                    "track_id": track.id, "mood": track.mood, "genre": track.genre, "ai_reasoning": track.ai_reasoning, "prompt": track.prompt,
+                    "audio": f"/static/output/{track.filename}", "wav_filename": track.wav_filename,
+                    "lyrics": track.lyrics, "cover_art": track.cover_art,
+                }
+    finally:
+        db.close()
+
+    reused = ["analysis"] + [stage for stage in REMIX_STAGES if stage not in rerun]
+    for stage in rerun: remix_stages.labels(stage, "recomputed").inc()
+    for stage in reused: remix_stages.labels(stage, "reused").inc()
+    return {**result, "remix": {"changed": sorted(changed), "recomputed": rerun, "reused": reused}}
+
+def handle_job(job):
+    """Job queue handler: run_generation (or run_remix), under the profiler when the request asked for it."""
+    run = run_remix if job.params.get("remix") else run_generation
+    if not job.params.get("profile"): return run(job)
+    report = {}
+    try:
+        with profiled() as report:
+            return run(job)
+    finally:
+        job.profile = f"# profiler: {report.get('profiler')}\n{report.get('report')}"
+
+job_queue = JobQueue(handle_job, workers=GENERATION_WORKERS, max_queued=GENERATION_QUEUE_SIZE, instrument=pipeline_metrics.time)
+cover_cache = CoverCache(COVER_CACHE_DIR, max_entries=COVER_CACHE_MAX_ENTRIES, max_bytes=COVER_CACHE_MAX_BYTES)
+art_executor = ArtExecutor(workers=ART_WORKERS, cache=cover_cache)
+synth_pool = SynthPool(SOUNDFONT_PATH, size=SYNTH_INSTANCES)
+storage = Storage(OUTPUT_DIR)
+recent_midi = RecentBuffers() # Just-written .mid files, served to downloads from memory
+transcoder = AudioTranscoder(AUDIO_CACHE_DIR)
+thumb_storage = Storage(THUMBNAIL_DIR)
+cover_variants = CoverVariants(thumb_storage, make=art_executor.make_variants)
+
+def referenced_files(db):
+    """Every artifact name some Track points at."""
+    names = set()
+    for row in db.query(Track.filename, Track.wav_filename, Track.cover_art).yield_per(5000):
+        names.update(name for name in row if name)
+        if row.filename and row.filename.endswith(".mid"): names.add(notes_name(row.filename))
+    return names
+
+def collect_garbage(dry_run=False):
+    """
+    Deletes files no Track references from static/output, and FLAC/Ogg encodes and thumbnails of deleted tracks.
+    Refuses to delete anything when the DB has no tracks or static/output would lose more than GC_MAX_FRACTION of its files.
+    """
+    db = SessionLocal()
+    try: referenced = referenced_files(db)
+    finally: db.close()
+    if not referenced:
+        summary = {"removed": 0, "freed_bytes": 0, "dry_run": dry_run, "refused": "the database has no tracks"}
+    else:
+        summary = storage.collect(referenced, dry_run=dry_run, max_fraction=GC_MAX_FRACTION, keep=storage.pending_stems())
+    if "refused" in summary:
+        print(f"⚠️ Storage GC skipped: {summary['refused']}")
+        return summary
+    encodes = {os.path.basename(transcoder.path_for(name, fmt)) for name in referenced if name.endswith(".wav") for fmt in ("flac", "ogg")}
+    summary["audio_cache"] = audio_cache_storage.collect(encodes, dry_run=dry_run)
+    thumbs = {variant for name in referenced if name.endswith(".png") for variant in cover_variants.names_for(name)}
+    summary["thumbnails"] = thumb_storage.collect(thumbs, dry_run=dry_run, keep=storage.pending_stems())
+    if summary["removed"] or summary["audio_cache"]["removed"] or summary["thumbnails"]["removed"]:
+        verb = "would remove" if dry_run else "removed"
+        print(f"🧹 Storage GC: {verb} {summary['removed']} files ({summary['freed_bytes'] / 1e6:.1f} MB) + "
+              f"{summary['audio_cache']['removed']} encodes + {summary['thumbnails']['removed']} thumbnails")
+    return summary
+
+audio_cache_storage = Storage(AUDIO_CACHE_DIR)
+storage_gc = GarbageCollector(lambda: collect_garbage(dry_run=not STORAGE_GC_DELETE), interval=STORAGE_GC_INTERVAL)
+
+# --- BATCH GENERATION ---
+BATCH_PARAMS = ("prompt", "mood", "genre", "tempo", "style", "instrument", "seed")
+
+def normalize_batch_item(item):
+    """A batch item is a prompt string or a dict of form params; instruments may be given by name."""
+    if isinstance(item, str): return {"prompt": item}
+    if not isinstance(item, dict): raise ValueError(f"Unsupported batch item: {item!r}")
+    p = {k: item.get(k) for k in BATCH_PARAMS}
+    instrument = p["instrument"]
+    if instrument in INSTRUMENTS: p["instrument"] = str(INSTRUMENTS[instrument])
+    elif instrument is not None and str(instrument) not in map(str, INSTRUMENTS.values()): p["instrument"] = None
+    elif instrument is not None: p["instrument"] = str(instrument)
+    return p
+
+def run_batch(owner_id, items, emit, cancelled=None):
+    """
+    Generates many tracks as a pipeline: analyses run on a thread pool; as they
+    finish, items are composed (unseeded ones with the same mood and style in
+    groups, one compose_batch() call each) and each item's WAV goes to the synth
+    pool and its cover to the art process pool, overlapping with later analyses.
+    All Track rows are written with one bulk INSERT at the end; until then the
+    items' stems are held so the storage GC can't collect their files.
+    `emit(event_dict)` receives progress; setting the `cancelled` event stops
+    starting new items (finished ones are still saved).
+    Returns track ids aligned with items (None if an item failed or was cancelled).
+    """
+    batch_id = uuid.uuid4().hex[:8]
+    started = datetime.now()
+    emit({"event": "batch_start", "batch_id": batch_id, "items": len(items)})
+
+    timed = pipeline_metrics.time
+    def prepare(p):
+        with timed("analysis"): return analyze_params(p)
+
+    def cover(spec, stem):
+        with timed("cover_art"): return write_cover(spec, stem)
+
+    def finish(spec, stem, duration, midi_data):
+        cover_future = cover_pool.submit(cover, spec, stem)
+        with timed("wav"): wav_ready = write_wav(stem, midi_data)
+        return track_row(spec, stem, owner_id, duration, wav_ready, cover_future.result())
+
+    def compose(group):
+        """[(index, spec)] sharing mood and style; a seeded item is always alone so its seed decides its notes."""
+        mood, style, seed = group[0][1]["mood"], group[0][1]["style"], group[0][1]["seed"]
+        try:
+            with timed("melody"):
+                if seed is not None: notes, duration = compose_track(mood, style, seed=seed); notes = [notes]
+                else: notes, duration = compose_batch(mood, style, len(group))
+        except Exception as e:
+            for i, _ in group: emit({"event": "error", "index": i, "stage": "melody", "error": str(e)})
+            return
+        for (i, spec), track_notes in zip(group, notes):
+            try:
+                with timed("midi"): stem, midi_data = write_midi(spec, track_notes)
+                hold(stem)
+            except Exception as e:
+                emit({"event": "error", "index": i, "stage": "midi", "error": str(e)}); continue
+            rendering[render_pool.submit(finish, spec, stem, duration, midi_data)] = i
+
+    def stop(futures):
+        if cancelled is None or not cancelled.is_set(): return False
+        for fut in futures: fut.cancel() # Not started yet; running ones finish
+        return True
+
+    with storage.holding() as hold:
+        rows = [None] * len(items)
+        rendering, groups = {}, {}
+        with ThreadPoolExecutor(BATCH_PREP_THREADS) as prep_pool, ThreadPoolExecutor(synth_pool.size) as render_pool, \
+             ThreadPoolExecutor(art_executor.workers) as cover_pool:
+            prepared = {prep_pool.submit(prepare, p): i for i, p in enumerate(items)}
+            for fut in as_completed(prepared):
+                if stop(prepared): break
+                i = prepared[fut]
+                try: spec = fut.result()
+                except Exception as e:
+                    emit({"event": "error", "index": i, "stage": "prepare", "error": str(e)}); continue
+                emit({"event": "prepared", "index": i, "mood": spec["mood"], "genre": spec["genre"], "tempo": spec["tempo"]})
+                if spec["seed"] is not None: compose([(i, spec)]); continue
+                group = groups.setdefault((spec["mood"], spec["style"]), [])
+                group.append((i, spec))
+                if len(group) >= BATCH_COMPOSE_GROUP: compose(groups.pop((spec["mood"], spec["style"])))
+            if not stop(prepared):
+                for group in groups.values(): compose(group)
+            for fut in as_completed(rendering):
+                if stop(rendering): break
+                i = rendering[fut]
+                try: rows[i] = fut.result()
+                except Exception as e:
+                    emit({"event": "error", "index": i, "stage": "render", "error": str(e)}); continue
+                emit({"event": "rendered", "index": i, "wav": rows[i]["wav_filename"] is not None, "cover": rows[i]["cover_art"] is not None})
+        for fut, i in rendering.items(): # Renders that were running when the batch was cancelled
+            if rows[i] is None and fut.done() and not fut.cancelled() and fut.exception() is None: rows[i] = fut.result()
+
+        done = [i for i, row in enumerate(rows) if row is not None]
+        track_ids = [None] * len(items)
+        if done:
+            db = SessionLocal()
+            try:
+                with timed("db"):
+                    ids = db.scalars(insert(Track).returning(Track.id, sort_by_parameter_order=True), [rows[i] for i in done]).all()
+                    db.commit()
+            finally:
+                db.close()
+            page_cache.bump(owner_id, "batch")
+            for i, track_id in zip(done, ids): track_ids[i] = track_id
+    emit({"event": "done", "batch_id": batch_id, "created": len(done), "failed": len(items) - len(done),
+          "cancelled": cancelled is not None and cancelled.is_set(),
+          "track_ids": track_ids, "seconds": round((datetime.now() - started).total_seconds(), 2)})
+    return track_ids
+
+batch_slots = threading.BoundedSemaphore(BATCH_MAX_CONCURRENT)
+
+def ndjson_batch(owner_id, items, on_done=None):
+    """
+    Starts a batch on its own thread and returns a generator of its progress events
+    as NDJSON lines. Closing the generator (the client went away) cancels the batch.
+    """
+    events, cancelled = queue.Queue(), threading.Event()
+    def work():
+        try: run_batch(owner_id, items, events.put, cancelled)
+        except Exception as e: events.put({"event": "failed", "error": str(e)})
+        finally:
+            events.put(None)
+            if on_done: on_done()
+    threading.Thread(target=work, name="batch", daemon=True).start()
+    def lines():
+        try:
+            while (event := events.get()) is not None:
+                yield json.dumps(event) + "\n"
+        finally:
+            cancelled.set()
+    return lines()
+
+@router.post("/batch")
+def batch_generate(payload: dict = Body(...), user: CachedUser = Depends(get_current_user)):
+    """Bulk generation: {"items": ["prompt", {"mood": ..., "tempo": ...}, ...]} -> NDJSON progress stream."""
+    if not user: return JSONResponse({"error": "Not authenticated"}, status_code=401)
+    items = payload.get("items")
+    if not isinstance(items, list) or not items: return JSONResponse({"error": "items must be a non-empty list"}, status_code=400)
+    if len(items) > BATCH_MAX_ITEMS: return JSONResponse({"error": f"At most {BATCH_MAX_ITEMS} items per batch"}, status_code=413)
+    try: items = [normalize_batch_item(item) for item in items]
+    except ValueError as e: return JSONResponse({"error": str(e)}, status_code=400)
+    if not batch_slots.acquire(blocking=False):
+        return JSONResponse({"error": "Too many batches running, try again shortly."}, status_code=429, headers={"Retry-After": "30"})
+    return StreamingResponse(ndjson_batch(user.id, items, on_done=batch_slots.release), media_type="application/x-ndjson")
+
+def wants_json(request: Request):
+    return "application/json" in request.headers.get("accept", "")
+
+@router.post("/", response_class=HTMLResponse)
+def generate(
+    request: Request,
+    prompt: str = Form(None), # Text prompt for AI
+    mood: str = Form(None), genre: str = Form(None), tempo: int = Form(120),
+    style: str = Form("Complex"), instrument: str = Form(None), 
+    seed: int = Form(None), # Optional: deterministic, cacheable cover art
+    user: CachedUser = Depends(get_current_user)
+):
+    if not user: return RedirectResponse(url="/login")
+
+    params = {"prompt": prompt, "mood": mood, "genre": genre, "tempo": tempo, "style": style, "instrument": instrument, "seed": seed,
+              "profile": PROFILING_ENABLED and request.headers.get(PROFILE_HEADER) == "1"}
+    return submit_job(request, user, params)
+
+def submit_job(request: Request, user, params):
+    """Queues a pipeline job; 202 with its URLs for JSON clients, else a redirect to the job page (429 when full)."""
+    try:
+        job = job_queue.submit(user.id, params)
+    except QueueFullError as e:
+        if wants_json(request): return JSONResponse({"error": str(e)}, status_code=429, headers={"Retry-After": "5"})
+        return HTMLResponse(str(e), status_code=429, headers={"Retry-After": "5"})
+
+    if wants_json(request):
+        body = {"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}", "events_url": f"/jobs/{job.id}/events"}
+        if params.get("profile"): body["profile_url"] = f"/jobs/{job.id}/profile"
+        return JSONResponse(body, status_code=202)
+    return RedirectResponse(url=f"/jobs/{job.id}/view", status_code=303)
+
+@router.post("/track/{track_id}/remix")
+def remix_track(
+    request: Request, track_id: int,
+    mood: str = Form(None), genre: str = Form(None), tempo: str = Form(None), style: str = Form(None),
+    instrument: str = Form(None), seed: str = Form(None), cover_seed: str = Form(None), # Ints; blank form fields mean "keep"
+    new_cover: bool = Form(False), # Re-roll the cover even if nothing it depends on changed
+    user: CachedUser = Depends(get_current_user), db: Session = Depends(get_db)
+):
+    """
+    Changes some generation inputs of an existing track and recomputes only the
+    stages that depend on them: an instrument change re-encodes the MIDI and
+    re-renders the WAV, with no LLM call and no new cover.
+    """
+    if not user: return JSONResponse({"error": "Not authenticated"}, status_code=401)
+    if not db.query(Track.id).filter(Track.id == track_id, Track.owner_id == user.id).first():
+        return JSONResponse({"error": "Track not found"}, status_code=404)
+    try: tempo, seed, cover_seed = (int(v) if v not in (None, "") else None for v in (tempo, seed, cover_seed))
+    except ValueError: return JSONResponse({"error": "tempo, seed and cover_seed must be integers"}, status_code=400)
+    changes = {k: v for k, v in (("mood", mood), ("genre", genre), ("tempo", tempo), ("style", style), ("seed", seed), ("cover_seed", cover_seed)) if v not in (None, "")}
+    if instrument:
+        if instrument in INSTRUMENTS: instrument = str(INSTRUMENTS[instrument])
+        if instrument not in map(str, INSTRUMENTS.values()): return JSONResponse({"error": f"Unknown instrument: {instrument}"}, status_code=400)
+        changes["instrument"] = instrument
+    if tempo is not None and not 20 <= tempo <= 300: return JSONResponse({"error": "tempo must be between 20 and 300"}, status_code=400)
+    if not changes and not new_cover: return JSONResponse({"error": "Nothing to remix"}, status_code=400)
+    return submit_job(request, user, {"remix": track_id, "changes": changes, "new_cover": new_cover})
+
+# --- JOB STATUS ---
+def get_owned_job(job_id: str, user):
+    job = job_queue.get(job_id)
+    if not job or not user or job.owner_id != user.id: return None
+    return job
+
+@router.get("/jobs/stats")
+def job_stats(): return job_queue.snapshot()
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str, user: CachedUser = Depends(get_current_user)):
+    job = get_owned_job(job_id, user)
+    if not job: return JSONResponse({"error": "Job not found"}, status_code=404)
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}/profile", response_class=PlainTextResponse)
+def job_profile(job_id: str, user: CachedUser = Depends(get_current_user)):
+    """Profiler report of a job submitted with the profiling header (available once it finishes)."""
+    job = get_owned_job(job_id, user)
+    if not job or not job.params.get("profile"): return PlainTextResponse("Job not found", status_code=404)
+    if not job.finished: return PlainTextResponse("Job still running", status_code=409)
+    return job.profile or ""
+
+@router.get("/jobs/{job_id}/events")
+def job_events(job_id: str, user: CachedUser = Depends(get_current_user)):
+    job = get_owned_job(job_id, user)
+    if not job: return JSONResponse({"error": "Job not found"}, status_code=404)
+    return StreamingResponse(job_queue.sse(job), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/jobs/{job_id}/view", response_class=HTMLResponse)
+def job_view(job_id: str, request: Request, user: CachedUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    if not user: return RedirectResponse(url="/login")
+    job = get_owned_job(job_id, user)
+    if not job: return RedirectResponse(url="/")
+    if job.status != "done":
+        return templates.TemplateResponse("job.html", {"request": request, "user": user, "job": job})
+
+    def render():
+        history = db.query(Track).filter(Track.owner_id == user.id).order_by(Track.id.desc()).limit(5).all()
+        return templates.TemplateResponse("result.html", {
+            "request": request, "history": history, "user": user, "instruments": INSTRUMENTS, **job.result
+        })
+    return cached_page(request, user, ("result", job_id), render)
+
+def artifact_path(name, ext):
+    """Absolute path of a stored artifact with extension `ext`, or None if the name is invalid or missing."""
+    try: path = storage.path(name)
+    except ValueError: return None
+    return path if path.endswith(ext) and os.path.exists(path) else None
 
-    return templates.TemplateResponse("result.html", {
-        "request": request, "mood": mood, "genre": genre, 
-        "ai_reasoning": ai_data.get("reasoning"), "prompt": prompt,
-        "audio": f"/static/output/{midi_file}", "wav_filename": wav_file if wav_ready else None,
-        "lyrics": song_lyrics, "history": history, "user": user,
-        "cover_art": cover_filename
-    })
+@router.get("/download/{filename:path}")
+def download(filename: str):
+    download_name = os.path.basename(filename)
+    data = recent_midi.get(filename)
+    if data is not None:
+        return Response(data, media_type="audio/midi", headers={"Content-Disposition": f'attachment; filename="{download_name}"'})
+    try: path = storage.path(filename)
+    except ValueError: return JSONResponse({"error": "Not found"}, status_code=404)
+    if not os.path.exists(path): return JSONResponse({"error": "Not found"}, status_code=404)
+    return FileResponse(path, filename=download_name)
+
+# --- AUDIO STREAMING ---
+@router.get("/stream/stats")
+def stream_stats(): return transcoder.stats()
+
+live_renders = {} # stem -> LiveRender still writing <stem>.wav; later listeners tail it instead of rendering again
+live_renders_lock = threading.Lock()
+
+@router.get("/stream/live/{filename:path}")
+def stream_live(filename: str, request: Request, user: CachedUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Plays one of the user's tracks even if its WAV wasn't rendered at generation time:
+    streams the audio while the synth is still producing it, teeing it into the
+    track's .wav so the render happens once. Once the file exists it is served from
+    disk with Range support.
+    """
+    if not user: return JSONResponse({"error": "Not authenticated"}, status_code=401)
+    track = db.query(Track).filter(Track.filename == filename, Track.owner_id == user.id).first()
+    midi_path = artifact_path(filename, ".mid") if track else None
+    if not midi_path: return JSONResponse({"error": "Not found"}, status_code=404)
+    stem, owner_id = filename[:-len(".mid")], user.id
+    wav_filename = f"{stem}.wav"
+    with live_renders_lock: live = live_renders.get(stem)
+    if live is None and storage.exists(wav_filename):
+        if track.wav_filename != wav_filename:
+            track.wav_filename = wav_filename; db.commit()
+            page_cache.bump(owner_id, "render")
+        return range_response(storage.path(wav_filename), request.headers.get("range"), MEDIA_TYPES["wav"],
+                              headers={"Cache-Control": "private, max-age=86400"})
+    if live is None:
+        midi_data = recent_midi.get(filename)
+        if midi_data is None:
+            with open(midi_path, "rb") as f: midi_data = f.read()
+        chunks = synth_pool.stream(midi_data)
+        try:
+            first = next(chunks) # Surface render errors as a status code, not a truncated body
+        except (RenderError, StopIteration) as e:
+            return JSONResponse({"error": f"Render failed: {str(e) or 'no audio'}"}, status_code=503)
+
+        def on_done(error):
+            with live_renders_lock: live_renders.pop(stem, None)
+            if error: print(f"WAV Render Error: {error}"); return
+            done_db = SessionLocal()
+            try: done_db.query(Track).filter(Track.filename == filename).update({"wav_filename": wav_filename}); done_db.commit()
+            finally: done_db.close()
+            page_cache.bump(owner_id, "render")
+        live = LiveRender(itertools.chain([first], chunks), storage.path(wav_filename, create=True), synth_pool.sample_rate, on_done)
+        with live_renders_lock: live_renders[stem] = live
+    return StreamingResponse(live.iter_bytes(), media_type=MEDIA_TYPES["wav"])
+
+@router.get("/stream/{filename:path}")
+def stream_audio(filename: str, request: Request, format: str = "wav"):
+    """Serves a rendered track with Range support, optionally transcoded to flac/ogg (cached on disk)."""
+    wav_path = artifact_path(filename, ".wav")
+    if format not in MEDIA_TYPES or not wav_path:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    path = wav_path
+    if format != "wav":
+        try: path = transcoder.get(wav_path, format)
+        except Exception as e:
+            print(f"Transcode Error ({format}): {e}")
+            path, format = wav_path, "wav" # Uncompressed is better than nothing
+    return range_response(path, request.headers.get("range"), MEDIA_TYPES[format],
+                          headers={"Cache-Control": "public, max-age=86400"})
+
+# --- COVER VARIANTS ---
+@router.get("/cover/{filename:path}")
+def cover_variant(filename: str, request: Request, w: int = 256, format: str = "auto"):
+    """
+    A cover scaled down to width `w` as WebP or JPEG (format=auto: WebP when the browser
+    accepts it). Variants are made once and kept on disk; a cover name never changes
+    content, so responses are immutable and revalidate by ETag.
+    """
+    cover_path = artifact_path(filename, ".png")
+    if not cover_path: return JSONResponse({"error": "Not found"}, status_code=404)
+    if format == "auto": format = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+    if w not in VARIANT_WIDTHS or format not in VARIANT_FORMATS:
+        return JSONResponse({"error": f"Unsupported variant (w: {list(VARIANT_WIDTHS)}, format: {list(VARIANT_FORMATS)})"}, status_code=400)
+    try: path = cover_variants.get(cover_path, filename, w, format)
+    except Exception as e:
+        print(f"Thumbnail Error ({w} {format}): {e}")
+        return FileResponse(cover_path, media_type="image/png") # The full cover is better than nothing
+    st = os.stat(path)
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable", "Vary": "Accept"}
+    if etag in request.headers.get("if-none-match", ""): return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=VARIANT_FORMATS[format][1], headers=headers)
 
-@app.get("/download/{filename}")
-def download(filename: str): return FileResponse(os.path.join(OUTPUT_DIR, filename))
 
 # --- DASHBOARD & PROFILE (Simplified) ---
-@app.get("/dashboard", response_class=HTMLResponse)
-def dashboard(request: Request, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def cached_page(request, user, key, render):
+    """
+    Serves one of the user's pages from page_cache, built by render() (a template
+    response) only when the user's content changed since it was cached. The ETag
+    hashes the body, so a browser revalidating an unchanged page gets a bodyless 304.
+    key[0] names the page in /pages/stats and the metrics.
+    """
+    start = time.perf_counter()
+    def build():
+        response = render()
+        extra = {name: value for name, value in response.headers.items() if name.startswith("x-")} # e.g. X-Next-Cursor
+        return response.body, etag_for(response.body), extra
+    (body, etag, extra), hit = page_cache.get(user.id, ("page",) + key, build)
+    modified_at = page_cache.version(user.id)[1]
+    seconds = time.perf_counter() - start
+    headers = {"ETag": etag, "Last-Modified": http_date(modified_at), "Cache-Control": "private, no-cache",
+               "Server-Timing": "cache;desc=hit" if hit else f"render;dur={1000 * seconds:.1f}", **extra}
+    fresh = not_modified(request.headers, etag, modified_at)
+    response = Response(status_code=304, headers=headers) if fresh else HTMLResponse(body, headers=headers)
+    nbytes = 0 if fresh else len(body)
+    page_stats.record(key[0], not hit, fresh, seconds, nbytes)
+    page_views.labels(key[0], "not_modified" if fresh else "cached" if hit else "rendered").inc()
+    page_bytes.labels(key[0]).inc(nbytes)
+    if not hit: page_render_seconds.labels(key[0]).observe(seconds)
+    return response
+
+def cached_stats(db, owner_id):
+    """track_stats() through page_cache; shared by the dashboard and profile pages."""
+    return page_cache.get(owner_id, ("stats",), lambda: track_stats(db, owner_id))[0]
+
+def track_stats(db, owner_id):
+    """Track count, plays, favorites and total duration for one user, in a single aggregate query."""
+    row = db.query(
+        func.count(Track.id),
+        func.coalesce(func.sum(Track.play_count), 0),
+        func.coalesce(func.sum(case((Track.is_favorite != 0, 1), else_=0)), 0),
+        func.coalesce(func.sum(Track.duration), 0),
+    ).filter(Track.owner_id == owner_id).one()
+    stats = dict(zip(("total_tracks", "total_plays", "favorites_count", "total_duration"), row))
+    stats["total_plays"] += pending_plays(db, owner_id)
+    return stats
+
+def pending_plays(db, owner_id):
+    """Plays still sitting in the write-behind buffer for this user's tracks (the buffer only holds ~1s of clicks)."""
+    pending = play_counter.pending()
+    if not pending: return 0
+    owned = db.query(Track.id).filter(Track.owner_id == owner_id, Track.id.in_(list(pending))).all()
+    return sum(pending[track_id] for track_id, in owned)
+
+def track_page(db, owner_id, before=None, limit=DASHBOARD_PAGE_SIZE):
+    """
+    One newest-first page of a user's tracks, keyset-paginated on id so deep pages
+    cost the same as the first (an index range scan, no OFFSET).
+    Returns (tracks, cursor for the next page or None).
+    """
+    q = db.query(Track).filter(Track.owner_id == owner_id)
+    if before is not None: q = q.filter(Track.id < before)
+    tracks = q.order_by(Track.id.desc()).limit(limit + 1).all()
+    if len(tracks) > limit: return tracks[:limit], tracks[limit - 1].id
+    return tracks, None
+
+@router.get("/dashboard", response_class=HTMLResponse)
+def dashboard(request: Request, user: CachedUser = Depends(get_current_user), db: Session = Depends(get_db)):
     if not user: return RedirectResponse("/login")
-    all_tracks = db.query(Track).filter(Track.owner_id == user.id).order_by(Track.id.desc()).all()
-    return templates.TemplateResponse("dashboard.html", {
-        "request": request, "user": user, 
-        "tracks": all_tracks, 
-        "total_tracks": len(all_tracks),
-        "total_plays": sum(t.play_count for t in all_tracks), 
-        "favorites_count": sum(1 for t in all_tracks if t.is_favorite),
-        "activity_data": [] # Simplified for now
-    })
-
-@app.get("/profile", response_class=HTMLResponse)
-def profile(request: Request, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    def render():
+        tracks, next_cursor = track_page(db, user.id)
+        stats = cached_stats(db, user.id)
+        return templates.TemplateResponse("dashboard.html", {
+            "request": request, "user": user, 
+            "tracks": tracks, "next_cursor": next_cursor,
+            "total_tracks": stats["total_tracks"],
+            "total_plays": stats["total_plays"], 
+            "favorites_count": stats["favorites_count"],
+            "activity_data": [] # Simplified for now
+        })
+    return cached_page(request, user, ("dashboard",), render)
+
+@router.get("/dashboard/tracks", response_class=HTMLResponse)
+def dashboard_tracks(request: Request, before: int, user: CachedUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Next page of dashboard rows for infinite scroll; the following cursor comes back in X-Next-Cursor."""
+    if not user: return Response(status_code=401)
+    def render():
+        tracks, next_cursor = track_page(db, user.id, before=before)
+        response = templates.TemplateResponse("track_rows.html", {"request": request, "tracks": tracks})
+        if next_cursor is not None: response.headers["X-Next-Cursor"] = str(next_cursor)
+        return response
+    return cached_page(request, user, ("rows", before), render)
+
+@router.get("/profile", response_class=HTMLResponse)
+def profile(request: Request, user: CachedUser = Depends(get_current_user), db: Session = Depends(get_db)):
     if not user: return RedirectResponse("/login")
-    tracks = db.query(Track).filter(Track.owner_id == user.id).all()
-    return templates.TemplateResponse("profile.html", {
-        "request": request, "user": user, 
-        "total_tracks": len(tracks), "total_duration": sum(t.duration for t in tracks),
-        "member_since": user.created_date
-    })
+    def render():
+        stats = cached_stats(db, user.id)
+        return templates.TemplateResponse("profile.html", {
+            "request": request, "user": user, 
+            "total_tracks": stats["total_tracks"], "total_duration": stats["total_duration"],
+            "member_since": user.created_date
+        })
+    return cached_page(request, user, ("profile",), render)
+
+@router.get("/search")
+def search_tracks(q: str = "", mood: str = None, genre: str = None, instrument: str = None, tempo: str = None,
+                  limit: int = 20, offset: int = 0, user: CachedUser = Depends(get_current_user)):
+    """
+    Ranked full-text search over the user's prompts, lyrics, reasoning and tags,
+    filtered by exact mood/genre/instrument and a tempo bucket, with facet counts.
+    """
+    if not user: return JSONResponse({"error": "Not authenticated"}, status_code=401)
+    if tempo and tempo not in {label for label, _, _ in TEMPO_BUCKETS}:
+        return JSONResponse({"error": f"tempo must be one of {[label for label, _, _ in TEMPO_BUCKETS]}"}, status_code=400)
+    return search_index.search(user.id, q, mood=mood, genre=genre, instrument=instrument, tempo=tempo, limit=limit, offset=offset)
 
 # --- ACTION ROUTES ---
-@app.post("/profile/update")
-def update_profile(bio: str = Form(...), avatar_color: str = Form(...), user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    if user: user.bio = bio; user.avatar_color = avatar_color; db.commit()
+@router.post("/profile/update")
+def update_profile(bio: str = Form(...), avatar_color: str = Form(...), user: CachedUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    if user:
+        db.query(User).filter(User.id == user.id).update({"bio": bio, "avatar_color": avatar_color}); db.commit()
+        user_cache.invalidate(user.id); page_cache.bump(user.id, "profile")
     return RedirectResponse("/profile", status_code=303)
 
-@app.post("/track/{track_id}/play")
-def play_track(track_id: int, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    t = db.query(Track).filter(Track.id == track_id).first()
-    if t: t.play_count += 1; db.commit()
+@router.post("/track/{track_id}/play")
+def play_track(track_id: int, db: Session = Depends(get_db)):
+    owner_id = db.query(Track.owner_id).filter(Track.id == track_id).scalar() # A primary-key read; the count itself is write-behind
+    if owner_id is None: return JSONResponse({"error": "Not found"}, status_code=404)
+    play_counter.add(track_id) # Buffered; flushed in bulk by the play counter thread
+    page_cache.bump(owner_id, "play") # The owner's pages show the count
     return {"success": True}
 
-@app.post("/track/{track_id}/delete")
-def delete_track(track_id: int, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+@router.get("/track/{track_id}/plays")
+def track_plays(track_id: int, db: Session = Depends(get_db)):
+    """Play count including plays not flushed to the database yet."""
     t = db.query(Track).filter(Track.id == track_id).first()
-    if t: db.delete(t); db.commit()
-    return RedirectResponse("/dashboard", status_code=303)
\ No newline at end of file
+    if not t: return JSONResponse({"error": "Not found"}, status_code=404)
+    return {"track_id": track_id, "play_count": (t.play_count or 0) + play_counter.pending(track_id)}
+
+@router.post("/track/{track_id}/delete")
+def delete_track(track_id: int, user: CachedUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    t = db.query(Track).filter(Track.id == track_id).first()
+    if t and user and t.owner_id == user.id:
+        names = [t.filename, t.wav_filename, t.cover_art]
+        db.delete(t); db.commit()
+        page_cache.bump(user.id, "delete")
+        drop_artifacts(db, names)
+    return RedirectResponse("/dashboard", status_code=303)
+
+def drop_artifacts(db, names):
+    """Deletes the given artifacts (with their notes and thumbnails) once no Track references them (call after committing)."""
+    # Files can be shared by identical seeded tracks; only drop the ones nothing else references
+    shared = referenced_files_among(db, names)
+    unshared = [name for name in names if name and name not in shared]
+    storage.delete(unshared + [notes_name(name) for name in unshared if name.endswith(".mid")])
+    thumb_storage.delete([variant for name in unshared if name.endswith(".png") for variant in cover_variants.names_for(name)])
+    for name in names: recent_midi.discard(name)
+
+def referenced_files_among(db, names):
+    names = [name for name in names if name]
+    if not names: return set()
+    rows = db.query(Track.filename, Track.wav_filename, Track.cover_art).filter(
+        Track.filename.in_(names) | Track.wav_filename.in_(names) | Track.cover_art.in_(names)).all()
+    return {name for row in rows for name in row if name in names}
+
+async def observe_requests(request: Request, call_next):
+    """Request latency by route template (not raw path, so ids don't explode the label set) and in-flight count."""
+    http_in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        http_seconds.labels(request.method, getattr(route, "path", "unmatched"), status).observe(time.perf_counter() - start)
+        http_in_flight.dec()
+
+@metrics.collector
+def component_metrics():
+    """Gauges read from the existing component stats on every scrape."""
+    q, synth, covers = job_queue.snapshot(), synth_pool.stats(), cover_cache.stats()
+    ai, users, plays = analyzer.stats(), user_cache.stats(), play_counter.stats()
+    yield "covercomposer_queue_depth", "gauge", "Generation jobs waiting", {}, q["queue_depth"]
+    yield "covercomposer_jobs_running", "gauge", "Generation jobs running", {}, q["running"]
+    yield "covercomposer_jobs_rejected_total", "counter", "Generation jobs rejected with 429", {}, q["rejected"]
+    hashing = password_hasher.stats()
+    yield "covercomposer_password_hashes_in_flight", "gauge", "Password hash/verify calls queued or running", {}, hashing["in_flight"]
+    yield "covercomposer_password_hashes_rejected_total", "counter", "Logins/registrations refused with 429 (hashing saturated)", {}, hashing["rejected"]
+    yield "covercomposer_password_rehashes_total", "counter", "Stored hashes upgraded to the current work factor at login", {}, hashing["rehashes"]
+    yield "covercomposer_synth_renders_total", "counter", "WAV renders attempted", {}, synth["renders"]
+    yield "covercomposer_synth_failures_total", "counter", "WAV renders that failed", {}, synth["failures"]
+    yield "covercomposer_synth_cli_fallbacks_total", "counter", "WAV renders done by the fluidsynth CLI", {}, synth["cli_fallbacks"]
+    yield "covercomposer_analysis_backend_calls_total", "counter", "LLM calls made", {}, ai["backend_calls"]
+    yield "covercomposer_analysis_fallbacks_total", "counter", "Analyses answered by Offline Magic Mode", {}, ai["fallbacks"]
+    yield "covercomposer_analysis_coalesced_total", "counter", "Analyses that joined an in-flight call", {}, ai["coalesced"]
+    yield "covercomposer_analysis_hedges_total", "counter", "Hedge requests sent", {}, ai.get("hedges")
+    for name, s in (("covers", covers), ("analysis", ai.get("cache")), ("users", users), ("pages", page_cache.stats())):
+        if not s: continue
+        yield "covercomposer_cache_hits_total", "counter", "Cache hits", {"cache": name}, s["hits"]
+        yield "covercomposer_cache_misses_total", "counter", "Cache misses", {"cache": name}, s["misses"]
+    yield "covercomposer_plays_pending", "gauge", "Plays buffered and not yet flushed", {}, plays["pending_plays"]
+    scan = storage.stats()["last_scan"]
+    if scan: yield "covercomposer_storage_bytes", "gauge", "Bytes in static/output at the last GC scan", {}, scan["bytes"]
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/analysis/stats")
+def analysis_stats(): return analyzer.stats()
+
+@router.get("/auth/stats")
+def auth_stats(): return {**user_cache.stats(), "hashing": password_hasher.stats()}
+
+@router.get("/pages/stats")
+def pages_stats(): return {"pages": page_stats.stats(), "cache": page_cache.stats()}
+
+@router.get("/plays/stats")
+def play_stats(): return play_counter.stats()
+
+@router.get("/storage/stats")
+def storage_stats():
+    return {"output": storage.stats(), "audio_cache": audio_cache_storage.stats(), "thumbnails": thumb_storage.stats(), "gc_interval": STORAGE_GC_INTERVAL}
+
+@router.post("/storage/gc")
+def storage_gc_now(dry_run: bool = True, user: CachedUser = Depends(get_current_user)):
+    """
+    Runs a GC pass now and reports what it found. Storage is shared by every user,
+    so ?dry_run=false only deletes when STORAGE_GC_HTTP_DELETE is set.
+    """
+    if not user: return JSONResponse({"error": "Not authenticated"}, status_code=401)
+    if not dry_run and not STORAGE_GC_HTTP_DELETE:
+        return JSONResponse({"error": "Deleting via HTTP is disabled (set STORAGE_GC_HTTP_DELETE=1)"}, status_code=403)
+    return collect_garbage(dry_run=dry_run)
+
+@router.get("/search/stats")
+def search_stats(): return search_index.stats()
+
+@router.get("/synth/stats")
+def synth_stats(): return synth_pool.stats()
+
+@router.get("/covers/stats")
+def cover_stats(): return {**cover_cache.stats(), "variants": cover_variants.stats()}
+
+@router.post("/covers/regenerate")
+def regenerate_covers(user: CachedUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Re-renders the cover of every track the user owns, in parallel across the art pool."""
+    if not user: return JSONResponse({"error": "Not authenticated"}, status_code=401)
+    tracks = db.query(Track).filter(Track.owner_id == user.id).all()
+    jobs, targets = [], []
+    with storage.holding() as hold:
+        for t in tracks:
+            stem = storage.new_stem(t.id, deterministic=False) # New name: the old cover may be shared
+            cover_filename = f"{stem}.png"; hold(stem)
+            jobs.append((t.mood, t.genre, t.tempo, storage.path(cover_filename, create=True), None, cover_variants.eager(cover_filename)))
+            targets.append((t, cover_filename))
+        results = art_executor.render_batch(jobs)
+        failed = 0
+        for (t, cover_filename), (_, error) in zip(targets, results):
+            if error: failed += 1; print(f"Album Art Error (track {t.id}): {error}")
+            else: t.cover_art = cover_filename
+        db.commit()
+    page_cache.bump(user.id, "covers")
+    return {"rendered": len(tracks) - failed, "failed": failed}
+
+# --- APP ---
+startup_timings = {"import_ms": None, "init_ms": None, "ready_ms": None, "preload_ms": {}, "preload_errors": {}}
+preload_stop = threading.Event() # Set on shutdown: preload gives up between steps
+
+def preload():
+    """
+    Does the one-time work the first requests would otherwise pay for: the JWT
+    import and password-hashing processes, the analysis and cover caches (SQLite
+    open, directory scan), the Cerebras clients, the resident
+    synths (soundfont load) and the cover-art workers (Pillow import + palette
+    caches). Runs on a background
+    thread while the server is already accepting requests.
+    """
+    steps = [
+        ("auth", lambda: (__import__("jose.jwt"), password_hasher.warm())),
+        ("caches", lambda: (analyzer.cache and analyzer.cache.open(), cover_cache.open())),
+        ("synths", synth_pool.warm),
+        ("cover_workers", art_executor.warm),
+        # Last: the SDK opens a warm-up connection per client
+        ("analysis_clients", lambda: [analyzer.client(key) for key in analyzer.api_keys if not preload_stop.is_set()]),
+    ]
+    for name, step in steps:
+        if preload_stop.is_set(): return
+        start = time.perf_counter()
+        try: step()
+        except Exception as e:
+            startup_timings["preload_errors"][name] = str(e)
+            print(f"⚠️ Preload of {name} failed: {e}")
+        startup_timings["preload_ms"][name] = round(1000 * (time.perf_counter() - start), 1)
+    if preload_stop.is_set(): return
+    startup_timings["ready_ms"] = round(1000 * (time.perf_counter() - IMPORT_STARTED), 1)
+    print(f"✅ Warmed up {startup_timings['ready_ms']:.0f} ms after import")
+
+@asynccontextmanager
+async def lifespan(app):
+    start = time.perf_counter()
+    init_database()
+    os.makedirs(OUTPUT_DIR, exist_ok=True) # Mounted at /static/output; the other storage dirs appear on first write
+    job_queue.start(); play_counter.start(); storage_gc.start(); search_index.start()
+    startup_timings["init_ms"] = round(1000 * (time.perf_counter() - start), 1)
+    preloader = threading.Thread(target=preload, name="preload", daemon=True) if PRELOAD_ON_STARTUP else None
+    preload_stop.clear()
+    if preloader: preloader.start()
+    yield
+    preload_stop.set()
+    if preloader: preloader.join() # Don't close the pools under a warm-up step that's still using them
+    job_queue.stop(); play_counter.stop(); storage_gc.stop(); search_index.stop(); password_hasher.shutdown(); art_executor.shutdown(); synth_pool.close()
+
+@metrics.collector
+def startup_metrics():
+    for phase in ("import", "init", "ready"):
+        ms = startup_timings[f"{phase}_ms"]
+        yield ("covercomposer_startup_seconds", "gauge", "Module import / lifespan init durations; ready = import start to warmed up",
+               {"phase": phase}, ms / 1000 if ms is not None else None)
+
+@router.get("/startup/stats")
+def startup_stats(): return startup_timings
+
+def create_app():
+    """Builds the ASGI app. Nothing heavy happens here: schema checks and workers start in the lifespan."""
+    app = FastAPI(lifespan=lifespan)
+    # Artifact names change whenever their content does, so browsers can keep them without revalidating
+    app.mount("/static/output", ImmutableStaticFiles(directory=OUTPUT_DIR, check_dir=False), name="output")
+    app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+    app.include_router(router)
+    app.middleware("http")(observe_requests)
+    return app
+
+app = create_app()
+startup_timings["import_ms"] = round(1000 * (time.perf_counter() - IMPORT_STARTED), 1)
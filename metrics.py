@@ -0,0 +1,198 @@
+import io, time, bisect, threading
+from contextlib import contextmanager
+from fastapi.templating import Jinja2Templates
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# --- METRIC TYPES ---
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs: return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    if value == float("inf"): return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def labels(self, *values):
+        return _Child(self, tuple(str(v) for v in values))
+
+    def _key(self, values):
+        if len(values) != len(self.labelnames): raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return values
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock: items = sorted(self._values.items())
+        lines += [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+        return lines
+
+class _Child:
+    """A metric bound to one set of label values (what .labels() returns)."""
+    def __init__(self, metric, values): self.metric, self.values = metric, values
+    def inc(self, amount=1): self.metric.inc(amount, self.values)
+    def dec(self, amount=1): self.metric.inc(-amount, self.values)
+    def set(self, value): self.metric.set(value, self.values)
+    def observe(self, value): self.metric.observe(value, self.values)
+
+class Counter(_Metric):
+    kind = "counter"
+    def inc(self, amount=1, values=()):
+        key = self._key(values)
+        with self._lock: self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Counter):
+    kind = "gauge"
+    def dec(self, amount=1, values=()): self.inc(-amount, values)
+    def set(self, value, values=()):
+        key = self._key(values)
+        with self._lock: self._values[key] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, values=()):
+        key = self._key(values)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock: items = sorted((k, (list(c), t)) for k, (c, t) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metrics plus scrape-time collectors, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs): return self.add(Counter(*args, **kwargs))
+    def gauge(self, *args, **kwargs): return self.add(Gauge(*args, **kwargs))
+    def histogram(self, *args, **kwargs): return self.add(Histogram(*args, **kwargs))
+
+    def collector(self, fn):
+        """Registers fn() -> iterable of (name, kind, help, {labels}, value), evaluated on every scrape."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics: lines += metric.render()
+        seen = set()
+        for fn in self._collectors:
+            try: samples = list(fn())
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}"); continue
+            for name, kind, help, labels, value in samples:
+                if value is None: continue
+                if name not in seen:
+                    lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]; seen.add(name)
+                lines.append(f"{name}{_format_labels(labels, labels.values())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# --- PIPELINE INSTRUMENTATION ---
+class PipelineMetrics:
+    """Latency histogram, error counter and in-flight gauge per pipeline stage."""
+
+    def __init__(self, registry, prefix="covercomposer"):
+        self.seconds = registry.histogram(f"{prefix}_stage_seconds", "Time spent in each generation stage", ["stage"])
+        self.errors = registry.counter(f"{prefix}_stage_errors_total", "Stage failures (exceptions or degraded results)", ["stage"])
+        self.in_flight = registry.gauge(f"{prefix}_stage_in_flight", "Stages currently running", ["stage"])
+
+    @contextmanager
+    def time(self, stage):
+        self.in_flight.labels(stage).inc()
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors.labels(stage).inc()
+            raise
+        finally:
+            self.seconds.labels(stage).observe(time.perf_counter() - start)
+            self.in_flight.labels(stage).dec()
+
+    def error(self, stage):
+        """Counts a failure the stage handled itself (e.g. the synth is missing and the track has no WAV)."""
+        self.errors.labels(stage).inc()
+
+
+class TimedTemplates(Jinja2Templates):
+    """Jinja2Templates that records how long each template takes to render."""
+
+    def __init__(self, *args, histogram=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.histogram = histogram
+
+    def TemplateResponse(self, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().TemplateResponse(*args, **kwargs) # Renders the body here
+        if self.histogram is not None:
+            name = args[0] if args and isinstance(args[0], str) else kwargs.get("name", getattr(response.template, "name", "?"))
+            self.histogram.labels(name).observe(time.perf_counter() - start)
+        return response
+
+
+# --- PROFILING ---
+@contextmanager
+def profiled(limit=40):
+    """
+    Profiles the enclosed block on the current thread. Uses pyinstrument (a
+    sampling profiler) when installed, else cProfile. Yields a dict whose
+    "report" is filled with a text report on exit.
+    """
+    out = {"profiler": None, "report": None}
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+    if Profiler is not None:
+        profiler = Profiler(interval=0.001)
+        out["profiler"] = "pyinstrument"
+        profiler.start()
+        try: yield out
+        finally:
+            profiler.stop()
+            out["report"] = profiler.output_text(unicode=True, color=False)
+        return
+    import cProfile, pstats
+    profiler = cProfile.Profile()
+    out["profiler"] = "cProfile"
+    profiler.enable()
+    try: yield out
+    finally:
+        profiler.disable()
+        buf = io.StringIO()
+        pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(limit)
+        out["report"] = buf.getvalue()
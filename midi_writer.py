@@ -0,0 +1,201 @@
+import io, struct, threading
+from collections import OrderedDict
+import numpy as np
+
+TICKS_PER_BEAT = 960 # Same division MIDIUtil uses
+END_OF_TRACK = b"\x00\xff\x2f\x00"
+
+
+def _track_chunk(data):
+    data += END_OF_TRACK
+    return b"MTrk" + struct.pack(">L", len(data)) + data
+
+def _pack_events(deltas, status, data1, data2):
+    """
+    Serializes channel events (delta VLQ + 3 bytes each) in one shot: every event
+    is laid out in a 7-byte row with its VLQ right-aligned in the first 4 bytes,
+    and the unused leading VLQ bytes are masked away.
+    Returns (bytes, encoded length of each event).
+    """
+    n = len(deltas)
+    rows = np.zeros((n, 7), dtype=np.uint8)
+    for col, shift in enumerate((21, 14, 7, 0)):
+        rows[:, col] = (deltas >> shift) & 0x7F
+    rows[:, :3] |= 0x80 # Continuation bit on all but the last VLQ byte
+    rows[:, 4], rows[:, 5], rows[:, 6] = status, data1, data2
+    vlq_len = 1 + (deltas >= 1 << 7) + (deltas >= 1 << 14) + (deltas >= 1 << 21)
+    keep = np.ones((n, 7), dtype=bool)
+    keep[:, :4] = np.arange(4)[None, :] >= (4 - vlq_len)[:, None]
+    return rows[keep].tobytes(), vlq_len + 3
+
+def _has_overlaps(track, channel, pitch, on, off):
+    """True if two notes on the same track/channel/pitch overlap or start together (MIDIUtil rewrites those)."""
+    if len(on) < 2: return False
+    order = np.lexsort((on, pitch, channel, track))
+    key = (track << 16) | (channel << 8) | pitch
+    same = key[order][1:] == key[order][:-1]
+    return bool(np.any(same & (on[order][1:] < np.maximum(off[order][:-1], on[order][:-1] + 1))))
+
+def _encode_with_midiutil(notes, tempo, program, num_tracks):
+    from midiutil import MIDIFile
+    midi = MIDIFile(num_tracks)
+    midi.addTempo(0, 0, tempo)
+    midi.addProgramChange(0, 0, 0, program)
+    for track, channel, pitch, velocity, start, duration in notes.tolist():
+        midi.addNote(track, channel, pitch, start, duration, velocity)
+    buf = io.BytesIO()
+    midi.writeFile(buf)
+    return buf.getvalue()
+
+def encode_midi(notes, tempo, program, num_tracks=3):
+    """
+    Encodes a NOTE_DTYPE array (see composer.py) as a format-1 Standard MIDI File,
+    byte-identical to what MIDIUtil writes for
+        MIDIFile(num_tracks); addTempo(0, 0, tempo); addProgramChange(0, 0, 0, program);
+        addNote(...) for each row in array order.
+    All tracks are sorted and packed together, then split into chunks.
+    Notes of the same channel/pitch that overlap are rare (the composer never
+    produces them) and are handed to MIDIUtil, whose de-interleaving we don't replicate.
+    """
+    notes = np.asarray(notes)
+    n = len(notes)
+    track = notes["track"].astype(np.int64)
+    channel = notes["channel"].astype(np.int64)
+    pitch = notes["pitch"].astype(np.int64)
+    on = (notes["start"].astype(np.float64) * TICKS_PER_BEAT).astype(np.int64)
+    off = on + (notes["duration"].astype(np.float64) * TICKS_PER_BEAT).astype(np.int64)
+    if _has_overlaps(track, channel, pitch, on, off):
+        return _encode_with_midiutil(notes, tempo, program, num_tracks)
+
+    # MIDIUtil's per-track sort key: (tick, note-off before note-on, insertion order)
+    ticks = np.concatenate([on, off])
+    kind = np.repeat([3, 2], n)
+    order = np.tile(np.arange(n), 2)
+    ev_track = np.concatenate([track, track])
+    perm = np.lexsort((order, kind, ticks, ev_track))
+    ticks, ev_track = ticks[perm], ev_track[perm]
+    deltas = np.diff(ticks, prepend=0)
+    first = np.ones(len(perm), dtype=bool)
+    first[1:] = ev_track[1:] != ev_track[:-1]
+    deltas[first] = ticks[first] # Each track's clock starts at 0
+    status = np.where(kind[perm] == 3, 0x90, 0x80) | np.concatenate([channel, channel])[perm]
+    velocity = np.concatenate([notes["velocity"], notes["velocity"]])[perm]
+    packed, sizes = _pack_events(deltas, status, np.concatenate([pitch, pitch])[perm], velocity)
+
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(ev_track, weights=sizes, minlength=num_tracks))]).astype(int)
+    chunks = [_track_chunk(b"\x00\xff\x51\x03" + struct.pack(">L", int(60000000 / tempo))[1:])]
+    for t in range(num_tracks):
+        data = packed[bounds[t]:bounds[t + 1]]
+        if t == 0: data = b"\x00\xc0" + bytes([program]) + data
+        chunks.append(_track_chunk(data))
+
+    header = b"MThd" + struct.pack(">LHHH", 6, 1, num_tracks + 1, TICKS_PER_BEAT)
+    return header + b"".join(chunks)
+
+# --- READING ---
+def _read_varlen(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]; pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80: return value, pos
+
+def tokenize_midi(data):
+    """
+    Minimal Standard MIDI File reader shared by decode_midi and the synth.
+    Returns (division, events) with events as (track, tick, kind, channel, a, b)
+    in file order, kind being "tempo" (a = microseconds per beat, channel None),
+    "program", "on", "off" (including zero-velocity note-ons), "cc" or "bend"
+    (a = 14-bit value). Other meta, SysEx and aftertouch events are skipped.
+    Raises ValueError for malformed data.
+    """
+    if data[:4] != b"MThd": raise ValueError("Not a MIDI file")
+    header_len = int.from_bytes(data[4:8], "big")
+    n_tracks = int.from_bytes(data[10:12], "big")
+    division = int.from_bytes(data[12:14], "big")
+    events = []
+    pos = 8 + header_len
+    try:
+        for track in range(n_tracks):
+            if data[pos:pos + 4] != b"MTrk": raise ValueError("Corrupt track header")
+            end = pos + 8 + int.from_bytes(data[pos + 4:pos + 8], "big")
+            pos += 8
+            tick, status = 0, None
+            while pos < end:
+                delta, pos = _read_varlen(data, pos)
+                tick += delta
+                if data[pos] & 0x80:
+                    status = data[pos]; pos += 1
+                elif status is None:
+                    raise ValueError("Running status without a previous status byte")
+                if status == 0xFF:
+                    meta = data[pos]
+                    length, pos = _read_varlen(data, pos + 1)
+                    if meta == 0x51: events.append((track, tick, "tempo", None, int.from_bytes(data[pos:pos + 3], "big"), 0))
+                    pos += length
+                    status = None
+                    continue
+                if status in (0xF0, 0xF7):
+                    length, pos = _read_varlen(data, pos)
+                    pos += length
+                    status = None
+                    continue
+                kind, channel = status & 0xF0, status & 0x0F
+                if kind in (0xC0, 0xD0):
+                    a = data[pos]; pos += 1
+                    if kind == 0xC0: events.append((track, tick, "program", channel, a, 0))
+                    continue
+                a, b = data[pos], data[pos + 1]; pos += 2
+                if kind == 0x90 and b > 0: events.append((track, tick, "on", channel, a, b))
+                elif kind in (0x80, 0x90): events.append((track, tick, "off", channel, a, 0))
+                elif kind == 0xB0: events.append((track, tick, "cc", channel, a, b))
+                elif kind == 0xE0: events.append((track, tick, "bend", channel, a | (b << 7), 0))
+            pos = end
+    except IndexError:
+        raise ValueError("Truncated MIDI data")
+    return division, events
+
+def decode_midi(data):
+    """
+    Inverse of encode_midi for files it (or MIDIUtil) wrote: returns
+    (notes, tempo, program) with notes as a NOTE_DTYPE array sorted by start.
+    Used to recover the note sequence of tracks stored before notes were kept.
+    """
+    from composer import NOTE_DTYPE
+    division, events = tokenize_midi(data)
+    rows, tempo, program = [], 120, None
+    sounding = {} # (track, channel, pitch) -> [(on tick, velocity)]
+    for track, tick, kind, channel, a, b in events:
+        if kind == "tempo": tempo = round(60000000 / a)
+        elif kind == "program" and program is None: program = a
+        elif kind == "on": sounding.setdefault((track, channel, a), []).append((tick, b))
+        elif kind == "off" and sounding.get((track, channel, a)):
+            on, velocity = sounding[(track, channel, a)].pop(0)
+            # Track 0 holds the tempo; note tracks follow it
+            rows.append((track - 1, channel, a, velocity, on / division, (tick - on) / division))
+    notes = np.array(rows, dtype=NOTE_DTYPE)
+    return notes[np.argsort(notes["start"], kind="stable")], tempo, program or 0
+
+
+class RecentBuffers:
+    """Small LRU of freshly encoded files (filename -> bytes) so the first downloads skip the disk."""
+
+    def __init__(self, max_items=64):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, name, data):
+        with self._lock:
+            self._items[name] = data
+            self._items.move_to_end(name)
+            while len(self._items) > self.max_items: self._items.popitem(last=False)
+
+    def get(self, name):
+        with self._lock:
+            data = self._items.get(name)
+            if data is not None: self._items.move_to_end(name)
+            return data
+
+    def discard(self, name):
+        with self._lock: self._items.pop(name, None)
@@ -0,0 +1,128 @@
+import time, hashlib, threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi.staticfiles import StaticFiles
+
+FRAGMENT_CACHE_TTL = 300      # Seconds an entry is trusted (bounds staleness across worker processes)
+FRAGMENT_CACHE_SIZE = 4096    # Entries kept per process
+
+
+class FragmentCache:
+    """
+    Per-user versioned cache of rendered fragments and computed values (track
+    rows, stats, whole pages). Every user has a version that bump() increments
+    on anything that changes what their pages show (generate, delete, play,
+    profile update); entries remember the version they were built at, so one
+    bump invalidates all of a user's entries without walking the cache.
+    Versions live in this process only, so entries also expire after `ttl`.
+    """
+
+    def __init__(self, ttl=FRAGMENT_CACHE_TTL, max_entries=FRAGMENT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._versions = {}            # user_id -> (version, modified_at)
+        self._entries = OrderedDict()  # (user_id, key) -> (version, expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.bumps = {}                # reason -> count
+
+    def version(self, user_id):
+        """(version, modified_at) of a user's content; modified_at is a Unix time for Last-Modified."""
+        with self._lock:
+            return self._versions.setdefault(user_id, (0, time.time()))
+
+    def bump(self, user_id, reason):
+        with self._lock:
+            version, _ = self._versions.get(user_id, (0, 0))
+            self._versions[user_id] = (version + 1, time.time())
+            self.bumps[reason] = self.bumps.get(reason, 0) + 1
+
+    def get(self, user_id, key, compute):
+        """Returns (value, hit). On a miss compute() runs outside the lock; its result is kept only if no bump happened meanwhile."""
+        version, _ = self.version(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry and entry[0] == version and entry[1] > now:
+                self._entries.move_to_end((user_id, key))
+                self.hits += 1
+                return entry[2], True
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            if self._versions[user_id][0] == version:
+                self._entries[(user_id, key)] = (version, now + self.ttl, value)
+                self._entries.move_to_end((user_id, key))
+                while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+        return value, False
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "users": len(self._versions), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0, "bumps": dict(self.bumps)}
+
+
+# --- CONDITIONAL RESPONSES ---
+def etag_for(body):
+    return f'"{hashlib.blake2b(body, digest_size=10).hexdigest()}"'
+
+def http_date(timestamp): return formatdate(timestamp, usegmt=True)
+
+def not_modified(headers, etag, last_modified):
+    """
+    True if the request's validators match: If-None-Match against `etag` (weak
+    comparison), else If-Modified-Since against `last_modified` (Unix time).
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try: return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError): return False
+    return False
+
+
+class PageStats:
+    """Views, cache outcomes, render time and bytes sent per page."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages = {}
+
+    def record(self, page, rendered, not_modified, seconds, nbytes):
+        """rendered: the body was built for this view (else it came from the cache); not_modified: answered 304 with no body."""
+        with self._lock:
+            p = self._pages.setdefault(page, {"views": 0, "rendered": 0, "cached": 0, "not_modified": 0,
+                                              "render_ms": 0.0, "max_render_ms": 0.0, "bytes": 0})
+            p["views"] += 1; p["not_modified"] += not_modified; p["bytes"] += nbytes
+            if not rendered: p["cached"] += 1; return
+            p["rendered"] += 1
+            p["render_ms"] += 1000 * seconds
+            p["max_render_ms"] = max(p["max_render_ms"], 1000 * seconds)
+
+    def stats(self):
+        with self._lock: pages = {name: dict(p) for name, p in self._pages.items()}
+        for p in pages.values():
+            p["avg_render_ms"] = round(p["render_ms"] / p["rendered"], 2) if p["rendered"] else 0.0
+            p["avg_bytes"] = round(p["bytes"] / p["views"], 1)
+            p["render_ms"] = round(p["render_ms"], 2); p["max_render_ms"] = round(p["max_render_ms"], 2)
+        return pages
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    StaticFiles for content-addressed artifacts: a file's name changes whenever
+    its content does, so browsers may keep it for a year without revalidating.
+    """
+
+    def __init__(self, *args, max_age=31536000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = f"public, max-age={max_age}, immutable"
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = self.cache_control
+        return response
@@ -0,0 +1,261 @@
+import re, html, time, threading
+from sqlalchemy import text
+
+FTS_COLUMNS = ("prompt", "lyrics", "ai_reasoning", "tags", "mood", "genre", "instrument", "owner_id")
+BM25_WEIGHTS = (3.0, 1.0, 0.5, 2.0, 2.0, 2.0, 2.0, 0.0) # Per FTS column; owner_id only filters
+FACETS = ("mood", "genre", "instrument", "tempo")
+TEMPO_BUCKETS = [("<90", 0, 89), ("90-119", 90, 119), ("120-139", 120, 139), ("140+", 140, 10**6)]
+BACKFILL_BATCH = 2000      # Rows indexed per backfill transaction
+BACKFILL_PAUSE = 0.05      # Seconds between batches, so request writes get the lock in between
+SEARCH_MAX_LIMIT = 100
+
+
+# --- SCHEMA ---
+# External-content FTS5 table over `tracks`. A row is in the index iff its id <= done or
+# id > upto (tracks_fts_state): rows that existed when the index was created are added
+# by the backfill, everything newer by the triggers. The triggers check the same rule, so
+# a delete never removes a row the index hasn't seen (which would corrupt it).
+_INDEXED = "({row}.id <= (SELECT done FROM tracks_fts_state) OR {row}.id > (SELECT upto FROM tracks_fts_state))"
+_COLS = ", ".join(FTS_COLUMNS)
+
+def _values(row): return ", ".join(f"{row}.{c}" for c in FTS_COLUMNS)
+
+FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5({_COLS}, content='tracks', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2', prefix='2 3')""",
+    "CREATE TABLE IF NOT EXISTS tracks_fts_state (upto INTEGER NOT NULL, done INTEGER NOT NULL)",
+    "INSERT INTO tracks_fts_state (upto, done) SELECT COALESCE(MAX(id), 0), 0 FROM tracks WHERE NOT EXISTS (SELECT 1 FROM tracks_fts_state)",
+    f"""CREATE TRIGGER IF NOT EXISTS tracks_fts_insert AFTER INSERT ON tracks WHEN {_INDEXED.format(row="new")} BEGIN
+        INSERT INTO tracks_fts (rowid, {_COLS}) VALUES (new.id, {_values("new")}); END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tracks_fts_delete AFTER DELETE ON tracks WHEN {_INDEXED.format(row="old")} BEGIN
+        INSERT INTO tracks_fts (tracks_fts, rowid, {_COLS}) VALUES ('delete', old.id, {_values("old")}); END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tracks_fts_update AFTER UPDATE OF {_COLS} ON tracks WHEN {_INDEXED.format(row="old")} BEGIN
+        INSERT INTO tracks_fts (tracks_fts, rowid, {_COLS}) VALUES ('delete', old.id, {_values("old")});
+        INSERT INTO tracks_fts (rowid, {_COLS}) VALUES (new.id, {_values("new")}); END""",
+]
+
+def fts5_available(conn):
+    if conn.dialect.name != "sqlite": return False
+    return bool(conn.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar())
+
+def install_fts(conn):
+    """Migration step: creates the FTS table, its state row and sync triggers (SQLite with FTS5 only)."""
+    if not fts5_available(conn):
+        print("⚠️ FTS5 unavailable: search will fall back to LIKE scans")
+        return
+    for statement in FTS_SCHEMA: conn.execute(text(statement))
+
+def install_facet_index(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tracks_owner_facets ON tracks (owner_id, mood, genre, instrument, tempo)"))
+
+
+# --- QUERIES ---
+def match_expression(q):
+    """
+    Free text -> FTS5 query: every word must match (as a prefix for the last one,
+    so partial input works). Quoting each token keeps user input from being
+    parsed as FTS syntax.
+    """
+    words = re.findall(r"\w+", q or "")
+    if not words: return None
+    terms = [f'"{w}"' for w in words[:-1]] + [f'"{words[-1]}"*']
+    return " ".join(terms)
+
+def _tempo_bucket_sql(column="tempo"):
+    cases = " ".join(f"WHEN {column} BETWEEN {lo} AND {hi} THEN '{label}'" for label, lo, hi in TEMPO_BUCKETS)
+    return f"CASE {cases} ELSE NULL END"
+
+def _mark(term, token):
+    """Escapes `token`, wrapping each `term` match in <mark>; matches are found on the raw text so they can't land inside an entity."""
+    out, pos = [], 0
+    for m in term.finditer(token):
+        out += [html.escape(token[pos:m.start()]), "<mark>", html.escape(m.group(0)), "</mark>"]
+        pos = m.end()
+    out.append(html.escape(token[pos:]))
+    return "".join(out)
+
+def highlight(words, *texts, width=12):
+    """
+    HTML snippet of the first text that mentions a query word: up to `width` words
+    around the first hit, each word starting with a query term wrapped in <mark>.
+    Done here rather than with FTS5 snippet(), which re-scans the owner's whole
+    doclist for every row and costs ~10 ms per result on large libraries.
+    """
+    if not words: return None
+    term = re.compile(r"\b(?:" + "|".join(re.escape(w) for w in words) + r")\w*", re.IGNORECASE)
+    for body in texts:
+        if not body or not term.search(body): continue
+        tokens = body.split()
+        first = next(i for i, token in enumerate(tokens) if term.search(token))
+        lo = max(0, min(first - width // 3, len(tokens) - width))
+        marked = " ".join(_mark(term, token) for token in tokens[lo:lo + width])
+        return ("…" if lo > 0 else "") + marked + ("…" if lo + width < len(tokens) else "")
+    return None
+
+class SearchIndex:
+    """
+    Ranked (bm25) full-text search over a user's tracks with facet counts,
+    backed by the tracks_fts FTS5 table. The backfill of rows that predate
+    the index runs incrementally on a daemon thread; until it finishes,
+    older tracks are simply missing from text results. Without FTS5 (or on
+    PostgreSQL) text queries fall back to LIKE scans.
+    """
+
+    def __init__(self, engine, batch=BACKFILL_BATCH, pause=BACKFILL_PAUSE):
+        self.engine = engine
+        self.batch = batch
+        self.pause = pause
+        self._available = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"searches": 0, "fallback_searches": 0, "total_ms": 0.0, "backfilled": 0, "backfill_ms": 0.0}
+
+    @property
+    def available(self):
+        if self._available is None:
+            with self.engine.connect() as conn:
+                self._available = fts5_available(conn) and conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE name = 'tracks_fts'")).scalar() is not None
+        return self._available
+
+    # --- BACKFILL ---
+    def state(self):
+        with self.engine.connect() as conn:
+            return tuple(conn.execute(text("SELECT upto, done FROM tracks_fts_state")).one())
+
+    def backfill_step(self):
+        """Indexes the next batch of pre-existing rows in one transaction; returns how many ids it covered (0 when done)."""
+        start = time.perf_counter()
+        with self.engine.begin() as conn:
+            upto, done = conn.execute(text("SELECT upto, done FROM tracks_fts_state")).one()
+            if done >= upto: return 0
+            until = min(done + self.batch, upto)
+            conn.execute(text(f"INSERT INTO tracks_fts (rowid, {_COLS}) SELECT id, {_COLS} FROM tracks WHERE id > :done AND id <= :until"),
+                         {"done": done, "until": until})
+            conn.execute(text("UPDATE tracks_fts_state SET done = :until"), {"until": until})
+        with self._lock:
+            self._stats["backfilled"] += until - done
+            self._stats["backfill_ms"] += 1000 * (time.perf_counter() - start)
+        return until - done
+
+    def backfill(self):
+        """Runs backfill steps until the index has caught up (or stop() is called)."""
+        while not self._stop.is_set():
+            if not self.backfill_step(): break
+            self._stop.wait(self.pause)
+
+    def start(self):
+        if self._thread or not self.available: return
+        upto, done = self.state()
+        if done >= upto: return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="search-backfill", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        start = time.perf_counter()
+        try: self.backfill()
+        except Exception as e:
+            print(f"⚠️ Search backfill failed: {e}"); return
+        upto, done = self.state()
+        if done >= upto: print(f"✅ Search index backfilled {upto} tracks in {time.perf_counter() - start:.1f}s")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join()
+        self._thread = None
+
+    # --- SEARCH ---
+    def search(self, owner_id, q=None, mood=None, genre=None, instrument=None, tempo=None, limit=20, offset=0):
+        """
+        One page of `owner_id`'s tracks matching free text `q` (best match first;
+        newest first without q) and the exact facet filters, plus facet counts
+        over everything that matches.
+        """
+        start = time.perf_counter()
+        limit, offset = max(1, min(limit, SEARCH_MAX_LIMIT)), max(0, offset)
+        where, params = ["t.owner_id = :owner"], {"owner": owner_id, "limit": limit, "offset": offset}
+        for name, value in (("mood", mood), ("genre", genre), ("instrument", instrument)):
+            if value: where.append(f"t.{name} = :{name}"); params[name] = value
+        if tempo:
+            bucket = next((b for b in TEMPO_BUCKETS if b[0] == tempo), None)
+            if not bucket: raise ValueError(f"Unknown tempo bucket: {tempo}")
+            where.append("t.tempo BETWEEN :tempo_lo AND :tempo_hi"); params.update(tempo_lo=bucket[1], tempo_hi=bucket[2])
+
+        expression = match_expression(q)
+        words = re.findall(r"\w+", q or "")
+        fallback = bool(expression) and not self.available
+        if fallback:
+            for i, word in enumerate(words):
+                params[f"w{i}"] = f"%{word.lower()}%"
+                where.append("(" + " OR ".join(f"lower(t.{c}) LIKE :w{i}" for c in FTS_COLUMNS[:-1]) + ")")
+        bucket_sql = _tempo_bucket_sql("t.tempo")
+        columns = "t.id, t.prompt, t.mood, t.genre, t.instrument, t.tempo, t.cover_art, t.created_at"
+
+        with self.engine.connect() as conn:
+            if expression and not fallback:
+                # owner_id is an FTS column too, so the owner filter is applied inside the index; so are the
+                # facet filters (as phrases: the SQL equality below keeps them exact), which lets FTS5
+                # intersect doclists instead of ranking hits that are then filtered out
+                narrow = [f'{name} : "{value.replace(chr(34), chr(34) * 2)}"' for name, value in
+                          (("mood", mood), ("genre", genre), ("instrument", instrument)) if value and re.search(r"\w", value)]
+                params["match"] = " AND ".join([f"owner_id : {int(owner_id)}"] + narrow + [f"({expression})"])
+                # CROSS JOIN keeps the FTS scan as the outer loop; given the choice, the planner walks
+                # the owner's rows by index and runs the MATCH once per row
+                source = "tracks_fts CROSS JOIN tracks t ON t.id = tracks_fts.rowid"
+                where_sql = " AND ".join(["tracks_fts MATCH :match"] + where)
+                # Ranking needs a score for every hit anyway, so one pass fetches the facet
+                # columns too; the page is cut here and only its rows are loaded in full.
+                hits = conn.execute(text(
+                    f"""SELECT t.id, bm25(tracks_fts, {", ".join(map(str, BM25_WEIGHTS))}) AS score,
+                               t.mood, t.genre, t.instrument, {bucket_sql} AS bucket
+                        FROM {source} WHERE {where_sql}"""), params).all()
+                groups = [(h.mood, h.genre, h.instrument, h.bucket, 1) for h in hits]
+                page = sorted(hits, key=lambda h: (h.score, -h.id))[offset:offset + limit]
+                scores = {h.id: h.score for h in page}
+                rows = conn.execute(text(
+                    f"""SELECT {columns}, t.lyrics, t.tags FROM tracks t
+                        WHERE t.id IN ({", ".join(str(h.id) for h in page) or "NULL"})""")).all()
+                position = {h.id: i for i, h in enumerate(page)}
+                rows.sort(key=lambda r: position[r.id])
+            else:
+                where_sql = " AND ".join(where)
+                rows = conn.execute(text(
+                    f"""SELECT {columns}, t.lyrics, t.tags FROM tracks t WHERE {where_sql}
+                        ORDER BY t.id DESC LIMIT :limit OFFSET :offset"""), params).all()
+                scores = {}
+                # Grouped in SQL; without text this is an index-only scan of ix_tracks_owner_facets
+                groups = conn.execute(text(
+                    f"""SELECT t.mood, t.genre, t.instrument, {bucket_sql} AS bucket, COUNT(*) AS n
+                        FROM tracks t WHERE {where_sql} GROUP BY 1, 2, 3, 4"""), params).all()
+
+        facets = {name: {} for name in FACETS}
+        total = 0
+        for mood_, genre_, instrument_, bucket, n in groups:
+            total += n
+            for name, value in (("mood", mood_), ("genre", genre_), ("instrument", instrument_), ("tempo", bucket)):
+                if value is not None: facets[name][value] = facets[name].get(value, 0) + n
+        facets = {name: dict(sorted(counts.items(), key=lambda kv: -kv[1])) for name, counts in facets.items()}
+
+        ms = 1000 * (time.perf_counter() - start)
+        with self._lock:
+            self._stats["searches"] += 1
+            self._stats["fallback_searches"] += fallback
+            self._stats["total_ms"] += ms
+        return {
+            "query": q, "match": expression, "total": total, "offset": offset, "limit": limit,
+            "results": [{"id": r.id, "prompt": r.prompt, "mood": r.mood, "genre": r.genre, "instrument": r.instrument,
+                         "tempo": r.tempo, "cover_art": r.cover_art, "created_at": r.created_at,
+                         "score": round(-scores.get(r.id, 0.0), 4), "highlight": highlight(words, r.prompt, r.lyrics, r.tags)} for r in rows],
+            "facets": facets, "fallback": fallback, "ms": round(ms, 2),
+        }
+
+    def stats(self):
+        with self._lock: s = dict(self._stats)
+        s["mean_ms"] = round(s["total_ms"] / s["searches"], 2) if s["searches"] else 0.0
+        s["available"] = self.available
+        if self.available:
+            upto, done = self.state()
+            s["backfill_pending"] = max(0, upto - done)
+        return s
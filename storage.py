@@ -0,0 +1,174 @@
+import os, time, uuid, hashlib, threading, contextlib
+from collections import Counter
+
+ID_LENGTH = 24        # Hex chars of the content hash used as the artifact id
+GC_GRACE_SECONDS = 600 # Never collect files younger than this (their Track row may not be committed yet)
+GC_MAX_FRACTION = 0.1  # Refuse a pass that would delete more than this share of the files (likely the wrong DB)
+
+
+class Storage:
+    """
+    Generated artifacts (.mid / .wav / .png) under one root, named by a
+    content hash and sharded two levels deep (ab/cd/abcd....mid) so no
+    directory grows past a few hundred entries.
+    Names stored in the DB are paths relative to the root; the old flat
+    timestamp names keep working because they're just shard-less paths.
+    Directories are created by the first write, not by the constructor.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._lock = threading.Lock()
+        self._stats = {"written": 0, "deleted": 0, "gc_runs": 0}
+        self.last_scan = None # Disk usage from the last GC walk
+        self._pending = Counter() # Stems being produced whose Track row isn't committed yet
+
+    # --- NAMING ---
+    def new_stem(self, *parts, deterministic=True):
+        """
+        Relative stem ("ab/cd/<hash>") for an artifact set derived from `parts`.
+        Equal inputs give equal ids (outputs are shared); pass deterministic=False
+        when the outputs involve randomness so the id is unique anyway.
+        """
+        h = hashlib.sha256()
+        for part in parts: h.update(part if isinstance(part, bytes) else repr(part).encode()); h.update(b"\0")
+        if not deterministic: h.update(uuid.uuid4().bytes)
+        digest = h.hexdigest()[:ID_LENGTH]
+        return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+    def path(self, name, create=False):
+        """Absolute path of a relative artifact name; raises ValueError for names escaping the root."""
+        path = os.path.normpath(os.path.join(self.root, name))
+        if not path.startswith(self.root + os.sep): raise ValueError(f"Invalid artifact name: {name}")
+        if create: os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def write_bytes(self, name, data):
+        """Atomically writes `data` to `name` (write to .part, then rename)."""
+        path = self.path(name, create=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+        with open(tmp_path, "wb") as f: f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock: self._stats["written"] += 1
+        return path
+
+    # --- IN-FLIGHT ARTIFACTS ---
+    @contextlib.contextmanager
+    def holding(self):
+        """
+        Yields hold(stem); GC skips the files of every held stem until the block
+        exits. Wrap the pipeline from its first write through the Track commit.
+        """
+        held = []
+        def hold(stem):
+            with self._lock: self._pending[stem] += 1
+            held.append(stem)
+        try: yield hold
+        finally:
+            with self._lock:
+                self._pending.subtract(held)
+                self._pending = +self._pending # Drops stems whose count reached zero
+
+    def pending_stems(self):
+        with self._lock: return set(self._pending)
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def delete(self, names):
+        """Deletes the given artifacts (missing ones are ignored); returns bytes freed."""
+        freed = 0
+        for name in names:
+            if not name: continue
+            try:
+                path = self.path(name)
+                size = os.path.getsize(path)
+                os.remove(path)
+            except (OSError, ValueError):
+                continue
+            freed += size
+            with self._lock: self._stats["deleted"] += 1
+        return freed
+
+    # --- GARBAGE COLLECTION ---
+    def collect(self, referenced, grace=GC_GRACE_SECONDS, dry_run=False, max_fraction=None, keep=()):
+        """
+        Walks the root, deleting files that no Track references (and leftover
+        .part files) once they're older than `grace`, then prunes empty shard
+        directories. Records disk usage as it goes. `referenced` is a set of
+        relative names; files whose stem is in `keep` (see holding()) are never
+        removed. With `max_fraction` set, a pass that would delete more
+        than that share of the files deletes nothing and reports "refused".
+        Returns a summary dict.
+        """
+        start = time.perf_counter()
+        cutoff = time.time() - grace
+        usage = {"files": 0, "bytes": 0, "by_type": {}}
+        orphans = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+                try: st = os.stat(path)
+                except OSError: continue
+                if name not in referenced and st.st_mtime < cutoff and name.split(".", 1)[0] not in keep:
+                    orphans.append((path, st.st_size)); continue
+                ext = os.path.splitext(filename)[1].lstrip(".").lower() or "other"
+                kind = usage["by_type"].setdefault(ext, {"files": 0, "bytes": 0})
+                kind["files"] += 1; kind["bytes"] += st.st_size
+                usage["files"] += 1; usage["bytes"] += st.st_size
+        total = usage["files"] + len(orphans)
+        refused = None
+        if max_fraction is not None and orphans and len(orphans) > max_fraction * total:
+            refused = f"would delete {len(orphans)} of {total} files (limit {max_fraction:.0%})"
+        removed = freed = 0
+        for path, size in orphans:
+            if refused: break
+            if not dry_run:
+                try: os.remove(path)
+                except OSError: continue
+            removed += 1; freed += size
+        if not dry_run and removed:
+            for dirpath, dirnames, filenames in os.walk(self.root, topdown=False):
+                if dirpath != self.root and not os.listdir(dirpath):
+                    try: os.rmdir(dirpath)
+                    except OSError: pass
+        summary = {"removed": removed, "freed_bytes": freed, "dry_run": dry_run,
+                   "seconds": round(time.perf_counter() - start, 3), "at": time.strftime("%Y-%m-%d %H:%M:%S")}
+        if refused: summary["refused"] = refused
+        with self._lock:
+            self._stats["gc_runs"] += 1
+            if not dry_run: self._stats["deleted"] += removed
+            self.last_scan = {**usage, "gc": summary}
+        return summary
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "root": self.root, "last_scan": self.last_scan}
+
+
+class GarbageCollector:
+    """Runs `collect()` (a zero-arg callable) on a daemon thread at start, then every `interval` seconds."""
+
+    def __init__(self, collect, interval):
+        self.collect = collect
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread or not self.interval: return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="storage-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            try: self.collect()
+            except Exception as e: print(f"⚠️ Storage GC failed: {e}")
+            if self._stop.wait(self.interval): break
@@ -0,0 +1,162 @@
+import os, re, threading, struct, uuid
+from fastapi.responses import StreamingResponse, Response
+
+CHUNK_SIZE = 64 * 1024
+MEDIA_TYPES = {"wav": "audio/wav", "flac": "audio/flac", "ogg": "audio/ogg"}
+SOUNDFILE_FORMATS = {"flac": ("FLAC", "PCM_16"), "ogg": ("OGG", "VORBIS")}
+WAV_HEADER_SIZE = 44
+
+
+# --- HTTP RANGE ---
+def parse_range(header, size):
+    """
+    Parses a single `bytes=` range against a file of `size` bytes.
+    Returns (start, end) inclusive, None when there is no usable Range header,
+    or raises ValueError when the range can't be satisfied (-> 416).
+    """
+    if not header: return None
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header)
+    if not match: return None # Multi-range or garbage: ignore and send the whole file
+    first, last = match.groups()
+    if not first and not last: return None
+    if not first: # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end: raise ValueError("Range not satisfiable")
+    return start, end
+
+def iter_file(path, start, end, chunk_size=CHUNK_SIZE):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk: break
+            remaining -= len(chunk)
+            yield chunk
+
+def range_response(path, range_header, media_type, headers=None):
+    """Serves `path` honouring a Range header: 206 for a slice, 200 for the whole file, 416 when out of bounds."""
+    size = os.path.getsize(path)
+    headers = {"Accept-Ranges": "bytes", **(headers or {})}
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return StreamingResponse(iter_file(path, 0, size - 1), media_type=media_type,
+                                 headers={**headers, "Content-Length": str(size)})
+    start, end = byte_range
+    headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)})
+    return StreamingResponse(iter_file(path, start, end), status_code=206, media_type=media_type, headers=headers)
+
+
+# --- COMPRESSED FORMATS ---
+class AudioTranscoder:
+    """
+    Encodes rendered WAVs to FLAC / Ogg Vorbis in-process (libsndfile via
+    soundfile) and keeps the encoded file on disk, so each track is encoded
+    at most once per format.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.encodes = self.hits = 0
+        self._lock = threading.Lock()
+        self._file_locks = [threading.Lock() for _ in range(64)] # Picked by hash(out_path); fixed size however many tracks get played
+
+    def path_for(self, wav_path, fmt):
+        stem = os.path.splitext(os.path.basename(wav_path))[0]
+        return os.path.join(self.cache_dir, f"{stem}.{fmt}")
+
+    def get(self, wav_path, fmt):
+        """Returns the path of `wav_path` encoded as `fmt`, encoding it on first request."""
+        if fmt not in SOUNDFILE_FORMATS: raise ValueError(f"Unsupported format: {fmt}")
+        out_path = self.path_for(wav_path, fmt)
+        file_lock = self._file_locks[hash(out_path) % len(self._file_locks)]
+        with file_lock: # Concurrent first plays of one track encode once
+            if os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(wav_path):
+                with self._lock: self.hits += 1
+                return out_path
+            import soundfile
+            container, subtype = SOUNDFILE_FORMATS[fmt]
+            data, sample_rate = soundfile.read(wav_path, dtype="int16")
+            os.makedirs(self.cache_dir, exist_ok=True) # First encode creates the cache
+            tmp_path = f"{out_path}.part"
+            soundfile.write(tmp_path, data, sample_rate, format=container, subtype=subtype)
+            os.replace(tmp_path, out_path)
+            with self._lock: self.encodes += 1
+        return out_path
+
+    def stats(self):
+        with self._lock:
+            return {"encodes": self.encodes, "hits": self.hits}
+
+
+# --- LIVE RENDER ---
+def wav_header(sample_rate, data_bytes=None, channels=2, bits=16):
+    """44-byte PCM WAV header; without `data_bytes` the sizes are 'unknown' (max), for a WAV still being written."""
+    block_align = channels * bits // 8
+    data_bytes = 0xFFFFFFFF - 36 if data_bytes is None else data_bytes
+    return (b"RIFF" + struct.pack("<I", data_bytes + 36) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, bits)
+            + b"data" + struct.pack("<I", data_bytes))
+
+class LiveRender:
+    """
+    Writes the PCM chunks of a synth stream into a WAV at `path` on a background
+    thread, as fast as the synth produces them, while listeners tail what has
+    been written so far (iter_bytes). The file is built as a uniquely named .part
+    and renamed into place once complete; `on_done(error)` runs after that.
+    A slow or vanished listener never paces the synth.
+    """
+
+    def __init__(self, chunks, path, sample_rate, on_done=None):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.done = False
+        self.error = None
+        self._tmp = f"{path}.{uuid.uuid4().hex[:8]}.part"
+        self._written = 0
+        self._cond = threading.Condition()
+        f = open(self._tmp, "wb")
+        f.write(wav_header(sample_rate))
+        threading.Thread(target=self._run, args=(chunks, f, on_done), name="live-render", daemon=True).start()
+
+    def _run(self, chunks, f, on_done):
+        try:
+            with f:
+                for chunk in chunks:
+                    data = chunk.tobytes()
+                    f.write(data); f.flush()
+                    with self._cond: self._written += len(data); self._cond.notify_all()
+                f.seek(0); f.write(wav_header(self.sample_rate, self._written))
+            with self._cond: os.replace(self._tmp, self.path) # Under the lock: iter_bytes picks which name to open
+        except Exception as e:
+            self.error = e
+            try: os.remove(self._tmp)
+            except OSError: pass
+        with self._cond: self.done = True; self._cond.notify_all()
+        if on_done: on_done(self.error)
+
+    def iter_bytes(self):
+        """The WAV as it is rendered: a streaming header, then the samples as soon as they are on disk."""
+        yield wav_header(self.sample_rate)
+        with self._cond:
+            try: f = open(self.path if self.done else self._tmp, "rb")
+            except OSError: return # The render failed before this listener arrived
+        with f:
+            f.seek(WAV_HEADER_SIZE)
+            sent = 0
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._written > sent or self.done)
+                    available = self._written - sent
+                if not available: return
+                while available > 0:
+                    data = f.read(min(CHUNK_SIZE, available))
+                    if not data: return
+                    sent += len(data); available -= len(data)
+                    yield data
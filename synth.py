@@ -0,0 +1,203 @@
+import os, time, wave, queue, threading
+import numpy as np
+from midi_writer import tokenize_midi
+
+SAMPLE_RATE = 44100
+GAIN = 0.2           # Same as the fluidsynth CLI default midi2audio relied on
+TAIL_SECONDS = 1.0   # Let the last notes ring out after the final event
+BLOCK_FRAMES = 4096  # Max frames requested from the synth per call
+ACQUIRE_TIMEOUT = 30.0 # Seconds a render waits for a free synth before failing
+
+
+class RenderError(Exception):
+    """Raised when a MIDI file can't be turned into audio."""
+
+
+# --- MIDI PARSING ---
+_PRIORITY = {"tempo": 0, "program": 0, "cc": 0, "bend": 0, "off": 1, "on": 2} # At equal ticks: setup, then offs, then ons
+
+def parse_midi(data):
+    """
+    Time-ordered list of (seconds, kind, channel, a, b) for a MIDI file, with kind
+    in "on", "off", "program", "cc", "bend", honouring tempo changes.
+    """
+    try: division, tokens = tokenize_midi(data)
+    except ValueError as e: raise RenderError(str(e))
+    if division & 0x8000: raise RenderError("SMPTE time division is not supported")
+
+    events = []
+    us_per_beat, last_tick, seconds = 500000, 0, 0.0
+    for _, tick, kind, channel, a, b in sorted(tokens, key=lambda e: (e[1], _PRIORITY[e[2]])):
+        seconds += (tick - last_tick) * us_per_beat / (1e6 * division)
+        last_tick = tick
+        if kind == "tempo": us_per_beat = a
+        else: events.append((seconds, kind, channel, a, b))
+    return events
+
+
+# --- RENDERING ---
+def _apply(synth, kind, channel, a, b):
+    if kind == "on": synth.noteon(channel, a, b)
+    elif kind == "off": synth.noteoff(channel, a)
+    elif kind == "program": synth.program_change(channel, a)
+    elif kind == "cc": synth.cc(channel, a, b)
+    elif kind == "bend": synth.pitch_bend(channel, a - 8192)
+
+def iter_pcm(synth, events, sample_rate=SAMPLE_RATE, tail=TAIL_SECONDS, block=BLOCK_FRAMES):
+    """Drives `synth` through `events`, yielding interleaved stereo int16 chunks as they are produced."""
+    frame = 0
+    for seconds, kind, channel, a, b in events:
+        target = int(round(seconds * sample_rate))
+        while frame < target:
+            n = min(block, target - frame)
+            yield synth.get_samples(n)
+            frame += n
+        _apply(synth, kind, channel, a, b)
+    remaining = int(tail * sample_rate)
+    while remaining > 0:
+        n = min(block, remaining)
+        yield synth.get_samples(n)
+        remaining -= n
+
+def write_wav(path, pcm, sample_rate=SAMPLE_RATE):
+    with wave.open(path, "wb") as w:
+        w.setnchannels(2); w.setsampwidth(2); w.setframerate(sample_rate)
+        w.writeframes(np.asarray(pcm, dtype="<i2").tobytes())
+
+
+class SynthPool:
+    """
+    Long-lived FluidSynth instances that load the soundfont once and render
+    MIDI straight to PCM in-process. Instances are created lazily up to
+    `size` and handed out one render at a time; a render that can't get one
+    within `acquire_timeout` fails with RenderError instead of waiting forever.
+    If libfluidsynth can't be loaded, renders fall back to the fluidsynth CLI
+    (one subprocess per track, like before) and are counted as such.
+    """
+
+    def __init__(self, soundfont_path, size=2, sample_rate=SAMPLE_RATE, gain=GAIN, acquire_timeout=ACQUIRE_TIMEOUT):
+        self.soundfont_path = soundfont_path
+        self.size = size
+        self.sample_rate = sample_rate
+        self.gain = gain
+        self.acquire_timeout = acquire_timeout
+        self._idle = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._stats = {"renders": 0, "failures": 0, "cli_fallbacks": 0, "total_ms": 0.0, "max_ms": 0.0}
+        self.last_error = None
+        self._import_error = None
+
+    def _new_synth(self):
+        if self._import_error: raise RenderError(self._import_error)
+        try:
+            import fluidsynth
+        except ImportError as e:
+            self._import_error = f"pyfluidsynth unavailable: {e}"
+            raise RenderError(self._import_error)
+        if not os.path.exists(self.soundfont_path):
+            raise RenderError(f"Soundfont not found: {self.soundfont_path}")
+        synth = fluidsynth.Synth(gain=self.gain, samplerate=float(self.sample_rate))
+        sfid = synth.sfload(self.soundfont_path)
+        if sfid < 0:
+            synth.delete()
+            raise RenderError(f"Could not load soundfont: {self.soundfont_path}")
+        for channel in range(16): synth.program_select(channel, sfid, 128 if channel == 9 else 0, 0)
+        synth.sfid = sfid
+        return synth
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create: self._created += 1
+        if not create:
+            try: return self._idle.get(timeout=self.acquire_timeout)
+            except queue.Empty: raise RenderError(f"No synth free after {self.acquire_timeout:g}s")
+        try:
+            return self._new_synth()
+        except Exception:
+            with self._lock: self._created -= 1
+            raise
+
+    def _release(self, synth):
+        synth.system_reset()
+        for channel in range(16): synth.program_select(channel, synth.sfid, 128 if channel == 9 else 0, 0)
+        self._idle.put(synth)
+
+    def stream(self, midi_data):
+        """Yields PCM chunks for MIDI bytes while the synth is still rendering; the synth is held until the generator finishes, so consume it promptly."""
+        events = parse_midi(midi_data)
+        synth = self._acquire()
+        try:
+            yield from iter_pcm(synth, events, self.sample_rate)
+        finally:
+            self._release(synth)
+
+    def render(self, midi_data):
+        """Renders MIDI bytes to one interleaved stereo int16 array."""
+        chunks = list(self.stream(midi_data))
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int16)
+
+    def render_to_wav(self, midi_path, wav_path, midi_data=None):
+        """
+        Renders a .mid file to .wav, recording timing; raises RenderError on failure.
+        Pass `midi_data` when the bytes are already in memory to skip re-reading the file.
+        """
+        start = time.perf_counter()
+        try:
+            data = midi_data
+            if data is None:
+                with open(midi_path, "rb") as f: data = f.read()
+            try:
+                write_wav(wav_path, self.render(data), self.sample_rate)
+            except RenderError as e:
+                if "pyfluidsynth unavailable" not in str(e): raise
+                self._render_cli(midi_path, wav_path)
+        except Exception as e:
+            self._record(time.perf_counter() - start, error=e)
+            raise e if isinstance(e, RenderError) else RenderError(str(e))
+        self._record(time.perf_counter() - start)
+        return os.path.basename(wav_path)
+
+    def _render_cli(self, midi_path, wav_path):
+        from midi2audio import FluidSynth
+        FluidSynth(self.soundfont_path, sample_rate=self.sample_rate).midi_to_audio(midi_path, wav_path)
+        if not os.path.exists(wav_path): raise RenderError("fluidsynth CLI produced no output")
+        with self._lock: self._stats["cli_fallbacks"] += 1
+
+    def _record(self, seconds, error=None):
+        with self._lock:
+            s = self._stats
+            s["renders"] += 1
+            s["total_ms"] += 1000 * seconds
+            s["max_ms"] = max(s["max_ms"], 1000 * seconds)
+            if error is not None:
+                s["failures"] += 1
+                self.last_error = str(error)
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s["avg_ms"] = round(s["total_ms"] / s["renders"], 2) if s["renders"] else 0.0
+            s["total_ms"] = round(s["total_ms"], 2); s["max_ms"] = round(s["max_ms"], 2)
+            s.update(instances=self._created, idle=self._idle.qsize(), last_error=self.last_error)
+            return s
+
+    def warm(self):
+        """Creates every instance now (loading the soundfont) instead of on the first renders."""
+        synths = []
+        try:
+            while self._created < self.size: synths.append(self._acquire())
+        finally:
+            for synth in synths: self._idle.put(synth)
+        return len(synths)
+
+    def close(self):
+        while True:
+            try: self._idle.get_nowait().delete()
+            except queue.Empty: break
+        with self._lock: self._created = 0
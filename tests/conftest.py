@@ -0,0 +1,22 @@
+import os, sys
+
+import pytest
+from sqlalchemy import text
+
+# The app's modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import make_engine
+
+# tracks as the first release created it, before any migration ran
+LEGACY_TRACKS = """CREATE TABLE tracks (id INTEGER PRIMARY KEY, filename VARCHAR, wav_filename VARCHAR, mood VARCHAR, genre VARCHAR,
+    tempo INTEGER, style VARCHAR, instrument VARCHAR, prompt TEXT, ai_reasoning TEXT, created_at VARCHAR, created_date VARCHAR,
+    lyrics TEXT, rating INTEGER, is_favorite INTEGER, play_count INTEGER DEFAULT 0, duration INTEGER, tags VARCHAR, owner_id INTEGER)"""
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Scratch SQLite file holding the legacy tracks table (no migrations applied)."""
+    engine = make_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    with engine.begin() as conn: conn.execute(text(LEGACY_TRACKS))
+    yield engine
+    engine.dispose()
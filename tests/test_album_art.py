@@ -0,0 +1,30 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from album_art import CACHE_ENGINE_VERSION, render_cover_array
+
+# sha256 of render_cover_array(...).tobytes() per engine version. Covers are cached
+# by content address, so an intentional change to the output must bump
+# CACHE_ENGINE_VERSION and record the new hashes here.
+REFERENCE = {
+    1: {
+        ("Happy", "Pop", 120, 1): "8896d52f1cbc712dbf34b4b2e0c497bcda26b4c9ae57d7e9efaa21ba76137675",
+        ("Sad", "Jazz", 70, 42): "00e299b3d1224d333f159bf67c78cd4b65beeaabe9527018a944c14c6f8fe96c",
+        ("Energetic", "Rock", 160, 7): "7955b4c137db6bce78c1551ccf14c2a8a26f1137ab22b36c55d06f64158bad48",
+        ("Calm", "Ambient", 90, 0): "0f635e5a2746c879c03adddc2fb50b470302b9a5dc4ce1a05f38657c27bd4e44",
+    },
+}
+
+
+@pytest.mark.parametrize("args", sorted(REFERENCE[CACHE_ENGINE_VERSION]))
+def test_seeded_cover_matches_reference(args):
+    pixels = render_cover_array(*args)
+    assert pixels.shape == (800, 800, 3) and pixels.dtype == np.uint8
+    assert hashlib.sha256(pixels.tobytes()).hexdigest() == REFERENCE[CACHE_ENGINE_VERSION][args]
+
+def test_seed_controls_the_output():
+    a = render_cover_array("Happy", "Pop", 120, seed=5, width=200, height=200)
+    assert np.array_equal(a, render_cover_array("Happy", "Pop", 120, seed=5, width=200, height=200))
+    assert not np.array_equal(a, render_cover_array("Happy", "Pop", 120, seed=6, width=200, height=200))
@@ -0,0 +1,94 @@
+import time
+
+from analysis import AsyncStubClient, CircuitBreaker, HedgedAnalyzer
+
+
+def analyzer(clients, models=("m1",), **kwargs):
+    """HedgedAnalyzer over stub clients: `clients` maps api key -> AsyncStubClient, tried in that order."""
+    return HedgedAnalyzer(list(clients), list(models), "system", clients.__getitem__,
+                          fallback=lambda prompt: {"source": "fallback"}, **kwargs)
+
+def answer(name): return lambda model, prompt: {"source": name, "model": model}
+
+
+def test_slow_attempt_is_hedged_to_the_next_key():
+    slow, fast = AsyncStubClient(answer("slow"), delay=2.0), AsyncStubClient(answer("fast"), delay=0.01)
+    a = analyzer({"slow": slow, "fast": fast}, hedge_after=0.1, budget=5.0)
+    start = time.perf_counter()
+    assert a.analyze("a prompt")["source"] == "fast"
+    assert time.perf_counter() - start < 1.0
+    assert (slow.calls, fast.calls) == (1, 1)
+    assert a.stats()["hedges"] == 1
+
+def test_budget_exhausted_falls_back():
+    stub = AsyncStubClient(answer("late"), delay=2.0)
+    a = analyzer({"k": stub}, budget=0.2, hedge_after=0.05)
+    start = time.perf_counter()
+    assert a.analyze("a prompt") == {"source": "fallback"}
+    assert time.perf_counter() - start < 1.0
+    s = a.stats()
+    assert (s["fallbacks"], s["deadline_misses"]) == (1, 1)
+
+def test_failed_attempt_is_replaced_at_once():
+    def broken(model, prompt): raise RuntimeError("429 rate limited")
+    bad, good = AsyncStubClient(broken), AsyncStubClient(answer("good"), delay=0.01)
+    a = analyzer({"bad": bad, "good": good}, hedge_after=5.0)
+    assert a.analyze("a prompt")["source"] == "good"
+    assert a.stats()["hedges"] == 0 # Replaced because it failed, not hedged after a wait
+
+
+def test_identical_prompts_in_flight_share_one_call():
+    import threading
+    stub = AsyncStubClient(answer("stub"), delay=0.3)
+    a = analyzer({"k": stub})
+    results = []
+    threads = [threading.Thread(target=lambda p=p: results.append(a.analyze(p)))
+               for p in ("Rainy night", "rainy   night!", " RAINY NIGHT.", "rainy night")]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert stub.calls == 1 and len(results) == 4
+    assert all(r == results[0] for r in results)
+    assert a.stats()["coalesced"] == 3
+
+def test_cached_analysis_skips_the_backend(tmp_path):
+    from analysis import AnalysisCache
+    stub = AsyncStubClient(answer("stub"))
+    a = analyzer({"k": stub}, cache=AnalysisCache(str(tmp_path / "analysis.db")))
+    first = a.analyze("Sunny beach")
+    assert a.analyze("sunny beach!") == first
+    assert stub.calls == 1
+    assert a.stats()["cache"]["hits"] == 1
+
+def test_fallbacks_are_not_cached(tmp_path):
+    from analysis import AnalysisCache
+    def broken(model, prompt): raise RuntimeError("429 rate limited")
+    a = analyzer({"k": AsyncStubClient(broken)}, cache=AnalysisCache(str(tmp_path / "analysis.db")))
+    assert a.analyze("x") == {"source": "fallback"}
+    assert a.cache.stats()["entries"] == 0
+
+def test_cache_expires_and_evicts_least_recently_used(tmp_path):
+    from analysis import AnalysisCache
+    cache = AnalysisCache(str(tmp_path / "analysis.db"), ttl=60, max_entries=2)
+    cache.put("a", {"v": 1}); time.sleep(0.01)
+    cache.put("b", {"v": 2}); time.sleep(0.01)
+    assert cache.get("a") == {"v": 1}; time.sleep(0.01) # "a" is now the most recently used
+    cache.put("c", {"v": 3})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1} and cache.get("c") == {"v": 3}
+    cache.ttl = -1
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 1 # The expired row was deleted on read
+
+def test_open_breaker_skips_failing_key_and_missing_model():
+    def broken(model, prompt): raise RuntimeError("429 rate limited")
+    def partial(model, prompt):
+        if model == "gone": raise RuntimeError("404 model_not_found")
+        return {"source": "good", "model": model}
+    bad, good = AsyncStubClient(broken), AsyncStubClient(partial)
+    a = analyzer({"bad": bad, "good": good}, models=("gone", "m1"), breaker=CircuitBreaker(threshold=1, cooldown=60))
+    for i in range(4):
+        assert a.analyze(f"prompt {i}")["model"] == "m1"
+    assert bad.calls == 1 # Tripped on its first failure, then skipped
+    breaker = a.stats()["breaker"]
+    assert breaker["model:gone"]["open"] and breaker["key0"]["open"]
+    assert good.calls == 4 + 1 # One call to the missing model before it was skipped
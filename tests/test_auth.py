@@ -0,0 +1,87 @@
+from concurrent.futures import Future
+
+import pytest
+
+from auth import CachedUser, UserCache, PasswordHasher, HasherBusy, hash_password
+
+
+def make_cache(**kwargs):
+    loads = []
+    def loader(user_id):
+        loads.append(user_id)
+        return CachedUser(user_id, f"user{user_id}") if user_id > 0 else None
+    return UserCache(loader, **kwargs), loads
+
+def test_user_cache_hits_after_the_first_load():
+    cache, loads = make_cache()
+    assert cache.get(1) == CachedUser(1, "user1")
+    assert cache.get(1) is cache.get(1)
+    assert loads == [1]
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (2, 1)
+
+def test_missing_users_are_not_cached():
+    cache, loads = make_cache()
+    assert cache.get(0) is None and cache.get(0) is None
+    assert loads == [0, 0] and cache.stats()["entries"] == 0
+
+def test_invalidate_and_ttl_force_a_reload():
+    cache, loads = make_cache()
+    cache.get(1); cache.invalidate(1); cache.get(1)
+    assert loads == [1, 1] and cache.stats()["invalidations"] == 1
+
+    expiring, loads = make_cache(ttl=0)
+    expiring.get(1); expiring.get(1)
+    assert loads == [1, 1]
+
+def test_least_recently_used_user_is_evicted():
+    cache, loads = make_cache(max_entries=2)
+    cache.get(1); cache.get(2); cache.get(1) # 2 is now the least recently used
+    cache.get(3)
+    cache.get(1); cache.get(2)
+    assert loads == [1, 2, 3, 2]
+
+
+# --- PASSWORD HASHING ---
+ROUNDS = 1000 # Far below production so the tests stay fast
+
+class StuckPool:
+    """Executor stand-in whose calls never finish."""
+    def __init__(self): self.futures = []
+    def submit(self, *args):
+        self.futures.append(Future()); return self.futures[-1]
+    def shutdown(self, wait=True): pass
+
+def test_inline_hash_and_verify():
+    hasher = PasswordHasher(workers=0, rounds=ROUNDS)
+    hashed = hasher.hash("secret")
+    assert hasher.verify("secret", hashed) == (True, None)
+    assert hasher.verify("wrong", hashed) == (False, None)
+    assert hasher.verify("secret", None) == (False, None)
+    stats = hasher.stats()
+    assert (stats["hashes"], stats["verifies"], stats["failed_verifies"], stats["in_flight"]) == (1, 3, 2, 0)
+
+def test_weak_hash_is_upgraded_on_verify():
+    hasher = PasswordHasher(workers=0, rounds=2 * ROUNDS)
+    ok, new_hash = hasher.verify("secret", hash_password("secret", rounds=ROUNDS))
+    assert ok and new_hash is not None
+    assert hasher.verify("secret", new_hash) == (True, None)
+    assert hasher.stats()["rehashes"] == 1
+
+def test_full_hasher_refuses_right_away():
+    hasher = PasswordHasher(workers=0, max_pending=1, rounds=ROUNDS)
+    hasher._slots.acquire() # One call already in flight
+    with pytest.raises(HasherBusy):
+        hasher.hash("secret")
+    hasher._slots.release()
+    hasher.hash("secret")
+    assert hasher.stats()["rejected"] == 1
+
+def test_timeout_is_reported_as_busy():
+    hasher = PasswordHasher(workers=1, rounds=ROUNDS, timeout=0.01)
+    hasher._pool = pool = StuckPool()
+    with pytest.raises(HasherBusy):
+        hasher.verify("secret", "hash")
+    assert pool.futures[0].cancelled()
+    stats = hasher.stats()
+    assert (stats["timeouts"], stats["in_flight"], stats["verifies"]) == (1, 0, 0)
+    assert hasher._slots._value == hasher.max_pending # The slot was given back
@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import text
+
+from counters import PlayCounter
+
+
+def play_counts(engine):
+    with engine.connect() as conn:
+        return dict(conn.execute(text("SELECT id, play_count FROM tracks ORDER BY id")).all())
+
+@pytest.fixture
+def tracks(engine):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO tracks (id, play_count) VALUES (:id, :n)"), [{"id": 1, "n": 0}, {"id": 2, "n": 5}, {"id": 3, "n": None}])
+    return engine
+
+def test_flush_folds_plays_into_rows(tracks):
+    counter = PlayCounter(tracks)
+    for track_id in (1, 1, 2, 3): counter.add(track_id)
+    counter.add(2, n=3)
+    assert counter.pending(1) == 2 and counter.pending() == {1: 2, 2: 4, 3: 1}
+    assert play_counts(tracks) == {1: 0, 2: 5, 3: None} # Nothing written yet
+
+    assert counter.flush() == 3
+    assert play_counts(tracks) == {1: 2, 2: 9, 3: 1}
+    assert counter.pending() == {} and counter.flush() == 0
+    stats = counter.stats()
+    assert (stats["plays"], stats["flushes"], stats["rows_updated"], stats["pending_plays"]) == (7, 1, 3, 0)
+
+def test_failed_flush_keeps_the_plays(tmp_path):
+    from database import make_engine
+    engine = make_engine(f"sqlite:///{tmp_path / 'empty.db'}") # No tracks table yet
+    counter = PlayCounter(engine)
+    counter.add(1); counter.add(1)
+    with pytest.raises(Exception):
+        counter.flush()
+    counter.add(1)
+    assert counter.pending(1) == 3 and counter.stats()["flush_errors"] == 1
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE tracks (id INTEGER PRIMARY KEY, play_count INTEGER)"))
+        conn.execute(text("INSERT INTO tracks (id, play_count) VALUES (1, 0)"))
+    assert counter.flush() == 1 and play_counts(engine) == {1: 3}
+    engine.dispose()
+
+def test_stop_flushes_what_is_left(tracks):
+    counter = PlayCounter(tracks, interval=3600) # The timer never fires during the test
+    counter.start()
+    counter.add(1); counter.add(3)
+    counter.stop()
+    assert play_counts(tracks) == {1: 1, 2: 5, 3: 1}
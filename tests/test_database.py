@@ -0,0 +1,49 @@
+import pytest
+from sqlalchemy import inspect, text
+
+from database import MIGRATIONS, make_engine, migrate, schema_version
+
+
+def version(engine):
+    with engine.begin() as conn: return schema_version(conn)
+
+def test_legacy_schema_is_migrated_in_order(engine):
+    assert migrate(engine) == [v for v, _, _ in MIGRATIONS]
+    assert version(engine) == MIGRATIONS[-1][0]
+    columns = {c["name"] for c in inspect(engine).get_columns("tracks")}
+    assert {"cover_art", "spec"} <= columns
+    indexes = {i["name"] for i in inspect(engine).get_indexes("tracks")}
+    assert {"ix_tracks_owner_id_id", "ix_tracks_owner_facets"} <= indexes
+
+def test_migrate_is_a_no_op_once_current(engine):
+    migrate(engine)
+    assert migrate(engine) == []
+    assert version(engine) == MIGRATIONS[-1][0]
+
+def test_steps_are_safe_on_a_fresh_schema(tmp_path):
+    # create_all() already made the newest columns; the steps must not add them twice
+    engine = make_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE tracks (id INTEGER PRIMARY KEY, owner_id INTEGER, prompt TEXT, lyrics TEXT, ai_reasoning TEXT, tags VARCHAR, "
+                          "mood VARCHAR, genre VARCHAR, instrument VARCHAR, tempo INTEGER, cover_art VARCHAR, spec TEXT)"))
+    assert migrate(engine) == [v for v, _, _ in MIGRATIONS]
+    engine.dispose()
+
+def test_failed_step_is_not_recorded_and_runs_again(engine):
+    # pysqlite doesn't wrap DDL in the transaction, which is why steps must be idempotent
+    def add_column(conn): conn.execute(text("ALTER TABLE tracks ADD COLUMN extra VARCHAR"))
+    def broken(conn):
+        conn.execute(text("CREATE TABLE IF NOT EXISTS half_done (id INTEGER)"))
+        raise RuntimeError("step failed")
+    with pytest.raises(RuntimeError):
+        migrate(engine, [(1, "add extra", add_column), (2, "broken", broken)])
+    assert version(engine) == 1
+
+    def fixed(conn): conn.execute(text("CREATE TABLE IF NOT EXISTS half_done (id INTEGER)"))
+    assert migrate(engine, [(1, "add extra", add_column), (2, "fixed", fixed)]) == [2]
+    assert version(engine) == 2 and inspect(engine).has_table("half_done")
+
+def test_sqlite_connections_are_tuned(engine):
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+import pytest
+
+from jobs import JobQueue, QueueFullError
+
+
+def wait(job, timeout=5.0):
+    deadline = time.time() + timeout
+    while not job.finished:
+        assert time.time() < deadline, f"job still {job.status}"
+        time.sleep(0.01)
+    return job
+
+def run(handler, **kwargs):
+    q = JobQueue(handler, **kwargs)
+    q.start()
+    return q
+
+def test_job_runs_its_stages():
+    def handler(job):
+        with job.track_stage("melody"): pass
+        with job.track_stage("midi"): pass
+        return {"n": job.params["n"] * 2}
+    q = run(handler)
+    try:
+        job = wait(q.submit(1, {"n": 21}))
+    finally:
+        q.stop()
+    assert job.status == "done" and job.to_dict()["result"] == {"n": 42}
+    assert set(job.timings) == {"melody", "midi"}
+    assert [e["event"] for e in job.events] == ["queued", "started", "stage_start", "stage_end", "stage_start", "stage_end", "done"]
+    assert q.snapshot()["stages"]["midi"]["count"] == 1
+
+def test_failed_job_keeps_the_error():
+    def handler(job):
+        with job.track_stage("analysis"): raise ValueError("no model")
+    q = run(handler)
+    try:
+        job = wait(q.submit(1, {}))
+    finally:
+        q.stop()
+    assert job.status == "failed" and job.error == "no model"
+    assert job.to_dict()["result"] is None
+    assert (job.events[-1]["event"], job.events[-1]["error"]) == ("failed", "no model")
+    assert q.snapshot()["stages"]["analysis"]["errors"] == 1
+
+def test_full_queue_rejects_and_forgets_the_job():
+    q = JobQueue(lambda job: None, max_queued=2) # Not started: nothing drains the queue
+    accepted = [q.submit(1, {}), q.submit(1, {})]
+    with pytest.raises(QueueFullError):
+        q.submit(1, {})
+    assert q.snapshot()["rejected"] == 1 and q.snapshot()["queue_depth"] == 2
+    assert list(q._jobs.values()) == accepted
+
+def test_job_is_registered_before_a_worker_runs_it():
+    seen = []
+    q = run(lambda job: seen.append(q.get(job.id) is job), max_queued=32)
+    try:
+        jobs = [q.submit(1, {}) for _ in range(20)]
+        for job in jobs: wait(job)
+    finally:
+        q.stop()
+    assert seen == [True] * 20
+
+def test_prune_keeps_the_newest_finished_jobs():
+    q = run(lambda job: None, keep_finished=2)
+    try:
+        jobs = [wait(q.submit(1, {})) for _ in range(5)]
+        latest = q.submit(1, {})
+        wait(latest)
+    finally:
+        q.stop()
+    assert [q.get(job.id) for job in jobs] == [None, None, None, jobs[3], jobs[4]]
+    assert q.get(latest.id) is latest
+
+async def collect(agen):
+    return [chunk async for chunk in agen]
+
+@pytest.mark.parametrize("fails", [False, True])
+def test_sse_ends_when_the_job_finishes(fails):
+    def handler(job):
+        time.sleep(0.1) # Still running when the stream starts
+        if fails: raise RuntimeError("boom")
+        return {}
+    q = run(handler)
+    try:
+        job = q.submit(1, {})
+        chunks = asyncio.run(asyncio.wait_for(collect(q.sse(job, poll_interval=0.01)), timeout=5))
+    finally:
+        q.stop()
+    assert chunks[0].startswith("event: queued\n")
+    assert chunks[-1].startswith("event: failed\n" if fails else "event: done\n")
+    assert len(chunks) == len(job.events)
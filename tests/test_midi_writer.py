@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+import midi_writer
+from composer import NOTE_DTYPE, compose_batch
+from midi_writer import encode_midi, _encode_with_midiutil, _has_overlaps
+
+MOODS = ("Happy", "Sad", "Calm", "Energetic")
+STYLES = ("Simple", "Complex")
+
+
+@pytest.mark.parametrize("mood", MOODS)
+@pytest.mark.parametrize("style", STYLES)
+def test_composed_tracks_match_midiutil(mood, style):
+    notes, _ = compose_batch(mood, style, 20, seed=len(mood) + len(style))
+    for i, track in enumerate(notes):
+        tempo, program = 60 + 7 * i, i % 128
+        assert encode_midi(track, tempo, program) == _encode_with_midiutil(track, tempo, program, 3)
+
+def test_long_deltas_match_midiutil():
+    # Gaps of several beats need 2- and 3-byte delta VLQs
+    notes = np.array([(0, 0, 60, 100, 0.0, 1.0), (0, 0, 62, 90, 40.0, 0.5), (1, 1, 48, 80, 3000.0, 2.0), (2, 9, 35, 100, 3001.5, 0.25)],
+                     dtype=NOTE_DTYPE)
+    assert encode_midi(notes, 97, 40) == _encode_with_midiutil(notes, 97, 40, 3)
+
+def test_overlapping_notes_take_the_midiutil_path(monkeypatch):
+    # Same track/channel/pitch sounding twice at once, and two equal notes starting together
+    notes = np.array([(0, 0, 60, 100, 0.0, 2.0), (0, 0, 60, 90, 1.0, 2.0), (0, 0, 64, 80, 4.0, 1.0), (0, 0, 64, 70, 4.0, 1.0),
+                      (1, 1, 48, 80, 0.0, 1.0)], dtype=NOTE_DTYPE)
+    track, channel, pitch = (notes[f].astype(np.int64) for f in ("track", "channel", "pitch"))
+    on = (notes["start"].astype(np.float64) * midi_writer.TICKS_PER_BEAT).astype(np.int64)
+    off = on + (notes["duration"].astype(np.float64) * midi_writer.TICKS_PER_BEAT).astype(np.int64)
+    assert _has_overlaps(track, channel, pitch, on, off)
+
+    calls = []
+    original = midi_writer._encode_with_midiutil
+    monkeypatch.setattr(midi_writer, "_encode_with_midiutil", lambda *args: calls.append(args) or original(*args))
+    assert encode_midi(notes, 120, 0) == original(notes, 120, 0, 3)
+    assert len(calls) == 1
+
+def test_decode_inverts_encode():
+    from midi_writer import decode_midi
+    notes, _ = compose_batch("Energetic", "Complex", 1, seed=9)
+    data = encode_midi(notes[0], 133, 24)
+    decoded, tempo, program = decode_midi(data)
+    assert (tempo, program) == (133, 24)
+    assert encode_midi(decoded, tempo, program) == data
+
+def test_truncated_file_is_rejected():
+    from midi_writer import decode_midi
+    notes, _ = compose_batch("Happy", "Simple", 1, seed=1)
+    with pytest.raises(ValueError):
+        decode_midi(encode_midi(notes[0], 120, 0)[:-20])
@@ -0,0 +1,80 @@
+from email.utils import formatdate
+
+from pagecache import FragmentCache, ImmutableStaticFiles, PageStats, etag_for, not_modified
+
+
+def counting(value):
+    calls = []
+    def compute():
+        calls.append(1)
+        return value
+    return compute, calls
+
+def test_entries_are_reused_until_the_user_is_bumped():
+    cache = FragmentCache()
+    compute, calls = counting("<tr>")
+    assert cache.get(1, "rows", compute) == ("<tr>", False)
+    assert cache.get(1, "rows", compute) == ("<tr>", True)
+    cache.bump(2, "play") # Another user's change
+    assert cache.get(1, "rows", compute) == ("<tr>", True)
+    version, _ = cache.version(1)
+    cache.bump(1, "generate")
+    assert cache.version(1)[0] == version + 1
+    assert cache.get(1, "rows", compute) == ("<tr>", False)
+    assert len(calls) == 2 and cache.stats()["bumps"] == {"play": 1, "generate": 1}
+
+def test_value_computed_across_a_bump_is_not_kept():
+    cache = FragmentCache()
+    def compute():
+        cache.bump(1, "delete") # The rows changed while this page was being built
+        return "stale"
+    assert cache.get(1, "page", compute) == ("stale", False)
+    fresh, calls = counting("fresh")
+    assert cache.get(1, "page", fresh) == ("fresh", False) and calls == [1]
+
+def test_ttl_and_size_bound_the_cache():
+    expiring = FragmentCache(ttl=0)
+    compute, calls = counting(1)
+    expiring.get(1, "stats", compute); expiring.get(1, "stats", compute)
+    assert len(calls) == 2
+
+    small = FragmentCache(max_entries=2)
+    for key in ("a", "b", "c"): small.get(1, key, lambda: key)
+    assert small.stats()["entries"] == 2
+    assert small.get(1, "a", lambda: "again") == ("again", False)
+
+def test_etag_and_if_none_match():
+    etag = etag_for(b"<html>")
+    assert etag == etag_for(b"<html>") != etag_for(b"<html> ")
+    assert etag.startswith('"') and etag.endswith('"')
+    assert not_modified({"if-none-match": etag}, etag, 0)
+    assert not_modified({"if-none-match": f'"other", W/{etag}'}, etag, 0)
+    assert not_modified({"if-none-match": "*"}, etag, 0)
+    assert not not_modified({"if-none-match": '"other"'}, etag, 0)
+    assert not not_modified({}, etag, 0)
+
+def test_if_modified_since():
+    modified = 1_700_000_000.5
+    assert not_modified({"if-modified-since": formatdate(modified, usegmt=True)}, '"x"', modified)
+    assert not not_modified({"if-modified-since": formatdate(modified - 60, usegmt=True)}, '"x"', modified)
+    assert not not_modified({"if-modified-since": "yesterday"}, '"x"', modified)
+    # If-None-Match wins when both are sent
+    assert not not_modified({"if-none-match": '"y"', "if-modified-since": formatdate(modified, usegmt=True)}, '"x"', modified)
+
+def test_page_stats():
+    stats = PageStats()
+    stats.record("dashboard", rendered=True, not_modified=False, seconds=0.02, nbytes=1000)
+    stats.record("dashboard", rendered=False, not_modified=True, seconds=0.0, nbytes=0)
+    page = stats.stats()["dashboard"]
+    assert (page["views"], page["rendered"], page["cached"], page["not_modified"]) == (2, 1, 1, 1)
+    assert page["avg_render_ms"] == 20.0 and page["avg_bytes"] == 500.0
+
+def test_artifacts_are_served_as_immutable(tmp_path):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    (tmp_path / "ab").mkdir()
+    (tmp_path / "ab" / "x.png").write_bytes(b"png")
+    app = FastAPI()
+    app.mount("/out", ImmutableStaticFiles(directory=tmp_path, max_age=60))
+    response = TestClient(app).get("/out/ab/x.png")
+    assert response.status_code == 200 and response.headers["cache-control"] == "public, max-age=60, immutable"
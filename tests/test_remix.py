@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+import main
+from main import REMIX_STAGES, remix_plan, stored_spec
+
+SPEC = {"prompt": "rainy night", "mood": "Sad", "genre": "Jazz", "tempo": 70, "style": "Complex", "instrument": "0",
+        "seed": 1, "cover_seed": 2, "reasoning": "Manual", "lyrics": None}
+
+
+@pytest.mark.parametrize("changes, rerun", [
+    ({}, []),
+    ({"tempo": 90}, ["midi", "wav", "cover_art"]), # Covers are drawn from the tempo too
+    ({"instrument": "24"}, ["midi", "wav"]),
+    ({"seed": 5}, ["melody", "midi", "wav"]),
+    ({"style": "Simple"}, ["melody", "midi", "wav"]),
+    ({"genre": "Pop"}, ["cover_art"]),
+    ({"cover_seed": None}, ["cover_art"]),
+    ({"mood": "Happy"}, ["melody", "midi", "wav", "cover_art"]),
+    ({"instrument": "24", "genre": "Pop"}, ["midi", "wav", "cover_art"]),
+])
+def test_only_stages_reading_a_changed_field_rerun(changes, rerun):
+    changed, stages = remix_plan(SPEC, {**SPEC, **changes})
+    assert changed == set(changes) and stages == rerun
+
+def test_new_cover_reruns_only_the_cover():
+    assert remix_plan(SPEC, SPEC, new_cover=True) == (set(), ["cover_art"])
+
+def test_prompt_never_triggers_a_rerun():
+    assert remix_plan(SPEC, {**SPEC, "prompt": "something else"}) == (set(), [])
+
+def test_stages_come_after_their_inputs():
+    order = list(REMIX_STAGES)
+    for stage, (_, inputs) in REMIX_STAGES.items():
+        assert all(order.index(source) < order.index(stage) for source in inputs)
+
+def test_stored_spec_prefers_the_saved_spec():
+    track = main.Track(spec=json.dumps(SPEC), mood="ignored")
+    assert stored_spec(track) == SPEC
+
+def test_stored_spec_rebuilds_legacy_tracks():
+    track = main.Track(prompt="old", mood="Calm", genre="Ambient", tempo=90, style=None, instrument="Grand Piano",
+                       ai_reasoning="Detected calm", lyrics="la")
+    spec = stored_spec(track)
+    assert spec["instrument"] == str(main.INSTRUMENTS["Grand Piano"]) and spec["style"] == "Complex"
+    assert spec["seed"] is None and spec["cover_seed"] is None
+    assert remix_plan(spec, {**spec, "instrument": "24"})[1] == ["midi", "wav"]
@@ -0,0 +1,82 @@
+import pytest
+from sqlalchemy import text
+
+from database import migrate
+from search import SearchIndex, highlight, match_expression
+
+TRACKS = [ # id, owner, prompt, mood, genre, instrument, tempo
+    (1, 1, "rainy night in the city", "Sad", "Jazz", "Grand Piano", 70),
+    (2, 1, "sunny beach party", "Happy", "Pop", "Guitar", 128),
+    (3, 1, "rain on the beach", "Calm", "Ambient", "Grand Piano", 90),
+    (4, 2, "rainy afternoon", "Sad", "Jazz", "Grand Piano", 75),
+]
+
+
+def add_tracks(engine, rows):
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO tracks (id, owner_id, prompt, mood, genre, instrument, tempo) VALUES (:id, :o, :p, :m, :g, :i, :t)"),
+                     [dict(zip(("id", "o", "p", "m", "g", "i", "t"), row)) for row in rows])
+
+@pytest.fixture
+def index(engine):
+    migrate(engine)
+    add_tracks(engine, TRACKS)
+    index = SearchIndex(engine)
+    if not index.available: pytest.skip("SQLite without FTS5")
+    return index
+
+def ids(result): return [r["id"] for r in result["results"]]
+
+def test_highlight_marks_words_around_the_first_hit():
+    assert highlight(["rain"], "a walk in the rain, then raining again") == "a walk in the <mark>rain</mark>, then <mark>raining</mark> again"
+    text_ = " ".join(f"w{i}" for i in range(30)) + " rain"
+    assert highlight(["rain"], text_, width=6) == "…w25 w26 w27 w28 w29 <mark>rain</mark>"
+    assert highlight(["beach"], None, "no match here", "the beach") == "the <mark>beach</mark>"
+    assert highlight(["beach"], "nothing") is None and highlight([], "beach") is None
+
+@pytest.mark.parametrize("word", ["amp", "lt", "gt", "quot"])
+def test_highlight_never_marks_inside_entities(word):
+    snippet = highlight([word], f'rock & roll <live> "x" {word}')
+    assert snippet == f"rock &amp; roll &lt;live&gt; &quot;x&quot; <mark>{word}</mark>"
+    assert highlight(["lt"], "<lt>") == "&lt;<mark>lt</mark>&gt;"
+
+def test_match_expression_quotes_user_input():
+    assert match_expression('rain OR "beach') == '"rain" "OR" "beach"*'
+    assert match_expression("  !? ") is None and match_expression(None) is None
+
+def test_text_search_is_ranked_and_per_owner(index):
+    result = index.search(1, "rain")
+    assert sorted(ids(result)) == [1, 3] and result["total"] == 2 and not result["fallback"]
+    assert ids(index.search(1, "rai")) == ids(result) # The last word matches as a prefix
+    assert ids(index.search(2, "rain")) == [4]
+    assert ids(index.search(1, "rain beach")) == [3]
+    assert result["facets"]["instrument"] == {"Grand Piano": 2}
+    assert result["results"][0]["highlight"].count("<mark>") == 1
+
+def test_facet_filters_and_counts(index):
+    result = index.search(1)
+    assert ids(result) == [3, 2, 1] # Newest first without text
+    assert result["facets"]["tempo"] == {"<90": 1, "90-119": 1, "120-139": 1}
+    assert ids(index.search(1, mood="Sad")) == [1]
+    assert ids(index.search(1, "beach", tempo="120-139")) == [2]
+    with pytest.raises(ValueError):
+        index.search(1, tempo="fast")
+
+def test_like_fallback_finds_the_same_rows(index):
+    expected = sorted(ids(index.search(1, "rain beach")))
+    index._available = False
+    result = index.search(1, "rain beach")
+    assert result["fallback"] and sorted(ids(result)) == expected
+
+def test_backfill_indexes_rows_older_than_the_index(engine):
+    add_tracks(engine, TRACKS[:2]) # Before the FTS table exists
+    migrate(engine)
+    add_tracks(engine, TRACKS[2:]) # Indexed by the triggers
+    index = SearchIndex(engine, batch=1, pause=0)
+    if not index.available: pytest.skip("SQLite without FTS5")
+    assert ids(index.search(1, "rain")) == [3]
+    assert index.state() == (2, 0)
+    index.backfill()
+    assert index.state() == (2, 2) and sorted(ids(index.search(1, "rain"))) == [1, 3]
+    with engine.begin() as conn: conn.execute(text("DELETE FROM tracks WHERE id = 1"))
+    assert ids(index.search(1, "rain")) == [3]
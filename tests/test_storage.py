@@ -0,0 +1,73 @@
+import os
+import time
+
+import pytest
+
+from storage import Storage, ID_LENGTH
+
+OLD = time.time() - 3600 # Older than the GC grace period
+
+
+def write(storage, *names, old=True):
+    for name in names:
+        path = storage.write_bytes(name, b"data")
+        if old: os.utime(path, (OLD, OLD))
+
+def files(storage):
+    return sorted(os.path.relpath(os.path.join(d, f), storage.root).replace(os.sep, "/")
+                  for d, _, fs in os.walk(storage.root) for f in fs)
+
+def test_names_are_sharded_content_hashes(tmp_path):
+    storage = Storage(tmp_path / "out")
+    stem = storage.new_stem(b"midi", "Happy", 120)
+    assert stem == storage.new_stem(b"midi", "Happy", 120) != storage.new_stem(b"midi", "Happy", 121)
+    assert stem != storage.new_stem(b"midi", "Happy", 120, deterministic=False)
+    shard1, shard2, digest = stem.split("/")
+    assert len(digest) == ID_LENGTH and (shard1, shard2) == (digest[:2], digest[2:4])
+    with pytest.raises(ValueError):
+        storage.path("../escape.mid")
+
+def test_directories_appear_on_first_write(tmp_path):
+    storage = Storage(tmp_path / "out")
+    assert not os.path.exists(storage.root)
+    assert storage.collect(set())["removed"] == 0
+    write(storage, "ab/cd/x.mid", old=False)
+    assert storage.exists("ab/cd/x.mid") and files(storage) == ["ab/cd/x.mid"]
+
+def test_collect_removes_old_orphans_only(tmp_path):
+    storage = Storage(tmp_path / "out")
+    write(storage, "ab/cd/kept.mid", "ab/cd/orphan.mid", "ef/gh/orphan.wav", "ab/cd/leftover.wav.1234abcd.part")
+    write(storage, "ab/cd/new.mid", old=False) # Its Track row may not be committed yet
+    summary = storage.collect({"ab/cd/kept.mid"})
+    assert summary["removed"] == 3 and summary["freed_bytes"] == 12
+    assert files(storage) == ["ab/cd/kept.mid", "ab/cd/new.mid"]
+    assert not os.path.exists(os.path.join(storage.root, "ef")) # Emptied shards are pruned
+    assert storage.last_scan["files"] == 2 and storage.last_scan["by_type"]["mid"]["files"] == 2
+
+def test_dry_run_only_reports(tmp_path):
+    storage = Storage(tmp_path / "out")
+    write(storage, "ab/cd/kept.mid", "ab/cd/orphan.mid")
+    summary = storage.collect({"ab/cd/kept.mid"}, dry_run=True)
+    assert summary["removed"] == 1 and summary["dry_run"]
+    assert files(storage) == ["ab/cd/kept.mid", "ab/cd/orphan.mid"]
+    assert storage.stats()["deleted"] == 0
+
+def test_mass_delete_is_refused(tmp_path):
+    storage = Storage(tmp_path / "out")
+    names = [f"ab/cd/{i}.mid" for i in range(10)]
+    write(storage, *names)
+    summary = storage.collect(set(names[:8]), max_fraction=0.1)
+    assert summary["removed"] == 0 and "refused" in summary and len(files(storage)) == 10
+    summary = storage.collect(set(names[:9]), max_fraction=0.1)
+    assert summary["removed"] == 1 and "refused" not in summary
+
+def test_held_stems_survive_collection(tmp_path):
+    storage = Storage(tmp_path / "out")
+    write(storage, "ab/cd/busy.mid", "ab/cd/busy.png", "ab/cd/busy.wav.1234abcd.part", "ab/cd/idle.mid")
+    with storage.holding() as hold:
+        hold("ab/cd/busy")
+        with storage.holding() as other:
+            other("ab/cd/busy") # Two pipelines producing the same stem
+        assert storage.collect(set(), keep=storage.pending_stems())["removed"] == 1
+    assert storage.pending_stems() == set()
+    assert storage.collect(set(), keep=storage.pending_stems())["removed"] == 3